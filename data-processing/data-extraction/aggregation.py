@@ -0,0 +1,140 @@
+from abc import ABC, abstractmethod
+from collections import Counter
+from typing import Any, Dict, List
+
+from schema_validation import CompiledValidator
+
+
+class SchemaAggregator(ABC):
+    """
+    Validates chunk outputs against a schema and merges them into one result.
+
+    Array properties are aggregated into sets, so adding a response costs
+    O(len(response)) however much has been aggregated already; values are only
+    de-duplicated and sorted once, when the result is written. Other properties
+    keep the last valid value. Partial aggregators built by parallel workers can
+    be combined with merge(), or reduced pairwise with merge_aggregators().
+
+    Subclasses provide load_schema() and write_aggregated_data() for their format.
+
+    Attributes
+    ----------
+    schema : Dict[str, Any]
+        a dictionary representing the schema
+    validator : CompiledValidator
+        the schema compiled once into a reusable validator
+    aggregated_data : Dict[str, Any]
+        a set per array property, the last value of any other property
+    success : int
+        number of valid responses aggregated
+    fail : int
+        number of invalid responses
+    errors : Counter
+        failed validations by kind, e.g. {"required": 3, "type": 1}
+
+    Methods
+    -------
+    validate(data: Dict[str, Any])
+        Validates data against the schema, counting failures by kind.
+    aggregate(data: Dict[str, Any])
+        Aggregates data if it is valid. Returns whether it was.
+    merge(other: SchemaAggregator)
+        Merges the data and counters of another aggregator into this one.
+    final_data()
+        Returns the aggregated data with sorted, de-duplicated arrays.
+    """
+
+    def __init__(self, schema_file: str):
+        self.schema = self.load_schema(schema_file)
+        self.validator = CompiledValidator(self.schema)
+        self.array_keys = {
+            key
+            for key, value in self.schema["properties"].items()
+            if value.get("type") == "array"
+        }
+        self.aggregated_data = {
+            key: set() if key in self.array_keys else None
+            for key in self.schema["properties"].keys()
+        }
+        self.success = 0
+        self.fail = 0
+        self.errors = Counter()
+
+    @abstractmethod
+    def load_schema(self, schema_file: str) -> Dict[str, Any]:
+        """Returns the schema read from schema_file."""
+
+    @abstractmethod
+    def write_aggregated_data(self, output_file: str):
+        """Writes final_data() to output_file."""
+
+    def validate(self, data: Dict[str, Any]) -> bool:
+        """Validates data against the schema, counting failures by kind."""
+        error = self.validator(data)
+        if error is not None:
+            self.errors[error] += 1
+            return False
+        return True
+
+    def aggregate(self, data: Dict[str, Any]) -> bool:
+        """Aggregates data if it is valid. Returns whether it was."""
+        if not self.validate(data):
+            self.fail += 1
+            return False
+
+        self.success += 1
+        for key, value in data.items():
+            if key in self.array_keys:
+                self.aggregated_data[key].update(value)
+            elif key in self.aggregated_data:
+                self.aggregated_data[key] = value
+        return True
+
+    def merge(self, other: "SchemaAggregator") -> "SchemaAggregator":
+        """Merges the data and counters of another aggregator into this one, and returns it."""
+        for key, value in other.aggregated_data.items():
+            if key in self.array_keys:
+                self.aggregated_data[key].update(value)
+            elif value is not None:
+                self.aggregated_data[key] = value
+        self.success += other.success
+        self.fail += other.fail
+        self.errors.update(other.errors)
+        return self
+
+    def copy(self) -> "SchemaAggregator":
+        """Returns an aggregator with the same schema and a copy of the aggregated data."""
+        aggregator = self.__class__.__new__(self.__class__)
+        aggregator.__dict__.update(self.__dict__)
+        aggregator.aggregated_data = {
+            key: set(value) if key in self.array_keys else value
+            for key, value in self.aggregated_data.items()
+        }
+        aggregator.errors = Counter(self.errors)
+        return aggregator
+
+    def final_data(self) -> Dict[str, Any]:
+        """Returns the aggregated data with sorted, de-duplicated arrays."""
+        return {
+            key: sorted(value) if key in self.array_keys else value
+            for key, value in self.aggregated_data.items()
+        }
+
+
+def merge_aggregators(aggregators: List[SchemaAggregator]) -> SchemaAggregator:
+    """
+    Reduces partial aggregators pairwise, tree-style, into a new aggregator.
+
+    The inputs are left untouched. Each level halves the number of aggregators,
+    so the reduction of each level can be spread over workers.
+    """
+    if not aggregators:
+        raise ValueError("At least one aggregator is required")
+
+    level = [aggregator.copy() for aggregator in aggregators]
+    while len(level) > 1:
+        level = [
+            level[i].merge(level[i + 1]) if i + 1 < len(level) else level[i]
+            for i in range(0, len(level), 2)
+        ]
+    return level[0]
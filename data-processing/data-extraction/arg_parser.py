@@ -15,12 +15,37 @@ def parse_arguments():
     parser = argparse.ArgumentParser(
         description="Run a test for long or short context."
     )
+    parser.add_argument(
+        "--chunking",
+        type=str,
+        choices=["tokens", "characters"],
+        default="tokens",
+        help="How the input is chunked: packed to a token budget at sentence boundaries, or sliced every --chunk_length characters. Default is tokens.",
+    )
     parser.add_argument(
         "--chunk_length",
         type=int,
         default=6000,
         action=CheckRange,
-        help="Number of characters for the description length (default: 8000, max: 30000)",
+        help="Number of characters per chunk with --chunking characters (default: 6000, max: 30000)",
+    )
+    parser.add_argument(
+        "--context_window",
+        type=int,
+        default=None,
+        help="Context window of the model in tokens. Defaults to the tokenizer's model_max_length, or 4096 if it is not set.",
+    )
+    parser.add_argument(
+        "--chunk_tokens",
+        type=int,
+        default=None,
+        help="Upper limit on the tokens per chunk with --chunking tokens. Default is to fill the context window.",
+    )
+    parser.add_argument(
+        "--chunk_overlap",
+        type=int,
+        default=64,
+        help="Tokens of trailing sentences repeated at the start of the next chunk with --chunking tokens. Default is 64.",
     )
     parser.add_argument(
         "--output_format",
@@ -41,10 +66,100 @@ def parse_arguments():
         default=True,
         help="Set to True for batching, will execute the requests concurrently based on the context limit of model. Default is False, will execute the requests into parallel mode",
     )
+    parser.add_argument(
+        "--constrained_decoding",
+        type=str,
+        choices=["off", "auto", "server", "local"],
+        default="off",
+        help="Constrain responses to the output schema. server: send it as a grammar (TGI grammar, vLLM guided_json). local: stream responses through an incremental JSON or YAML parser and stop them once the answer is complete or invalid. auto: server if supported, otherwise local. Default is off.",
+    )
+    parser.add_argument(
+        "--prompt_layout",
+        type=str,
+        choices=["inline", "shared_prefix"],
+        default="inline",
+        help="inline: the extraction prompt and the chunk in one user message. shared_prefix: the prompt in a system message, so that every request starts with the same tokens for servers with prefix caching. Default is inline.",
+    )
+    parser.add_argument(
+        "--engine",
+        type=str,
+        choices=["threads", "asyncio", "microbatch"],
+        default="threads",
+        help="How batched requests are executed: a thread pool, a single asyncio event loop, or micro-batches of several prompts per dispatch. Default is threads.",
+    )
+    parser.add_argument(
+        "--max_in_flight",
+        type=int,
+        default=64,
+        help="Maximum number of requests outstanding at once when batching. Default is 64.",
+    )
+    parser.add_argument(
+        "--no_adaptive_concurrency",
+        action="store_true",
+        help="Keep max_in_flight requests outstanding, instead of a limit that adapts to server overload (429, 503, timeouts) and latency.",
+    )
+    parser.add_argument(
+        "--micro_batch_size",
+        type=int,
+        default=16,
+        help="With --engine microbatch, the most prompts sent in one batch. Default is 16.",
+    )
+    parser.add_argument(
+        "--micro_batch_wait_ms",
+        type=float,
+        default=20.0,
+        help="With --engine microbatch, how long a batch waits to fill up before it is sent. Default is 20.",
+    )
+    parser.add_argument(
+        "--batch_api",
+        type=str,
+        choices=["auto", "completions", "generate"],
+        default="auto",
+        help="With --engine microbatch, send each batch as one /v1/completions request (vLLM) or as concurrent /generate requests (TGI). Default is auto, which detects the server.",
+    )
+    parser.add_argument(
+        "--cache_file",
+        type=str,
+        default="./cache/responses.sqlite",
+        help="SQLite file caching deterministic responses between runs. Default is './cache/responses.sqlite'.",
+    )
+    parser.add_argument(
+        "--cache_max_mb",
+        type=int,
+        default=512,
+        help="Size limit of the response cache file in MB, least recently used responses are evicted. Default is 512.",
+    )
+    parser.add_argument(
+        "--no_cache",
+        action="store_true",
+        help="Disable the response cache and always send requests to the server.",
+    )
+    parser.add_argument(
+        "--checkpoint",
+        action="store_true",
+        help="Journal every validated chunk output, and resume from the journal of an earlier run over the same input file.",
+    )
+    parser.add_argument(
+        "--checkpoint_dir",
+        type=str,
+        default="./checkpoints",
+        help="Directory of the checkpoint journals, one per input file hash. Default is './checkpoints'.",
+    )
+    parser.add_argument(
+        "--mmap",
+        action="store_true",
+        help="Memory-map the input file instead of reading it through file buffers.",
+    )
     parser.add_argument(
         "--input_file_name",
         type=str,
         default="berkshire23_12.5k.txt",
         help="Input file name, default is 'berkshire23_12.5k.txt'.",
     )
+    parser.add_argument(
+        "--input_batch",
+        type=str,
+        default=None,
+        help="Directory (all .txt files) or glob pattern of input files to extract in one run, instead of --input_file_name.",
+    )
     return parser.parse_args()
@@ -0,0 +1,96 @@
+import os
+import glob
+import json
+from typing import Any, Callable, List, Optional
+
+from aggregation import merge_aggregators
+from checkpoint import ExtractionJournal
+
+
+def resolve_input_files(input_batch: str) -> List[str]:
+    """Returns the .txt files of a directory, or the files matching a glob pattern, sorted."""
+    if os.path.isdir(input_batch):
+        input_batch = os.path.join(input_batch, "*.txt")
+    return sorted(path for path in glob.glob(input_batch) if os.path.isfile(path))
+
+
+def document_names(input_files: List[str]) -> List[str]:
+    """
+    Returns a unique name for each input file: its path relative to the common
+    directory of the files, without extension (kept when two files differ only
+    by it), e.g. a/report and b/report for a/report.txt and b/report.txt.
+    """
+    paths = [os.path.abspath(input_file) for input_file in input_files]
+    root = os.path.commonpath([os.path.dirname(path) for path in paths])
+    relative_paths = [os.path.relpath(path, root) for path in paths]
+    names = [os.path.splitext(path)[0] for path in relative_paths]
+    return [
+        relative_path if names.count(name) > 1 else name
+        for name, relative_path in zip(names, relative_paths)
+    ]
+
+
+class ExtractionDocument:
+    """
+    One input document of an extraction run, with its own aggregator and journal.
+
+    In batch mode the chunks of every document are dispatched from one shared
+    work queue, and each chunk result is routed back to the aggregator of the
+    document it came from.
+
+    Attributes
+    ----------
+    input_file : str
+        path of the input text file
+    name : str
+        name of the per-document output, by default the file name without extension
+    aggregator : JsonAggregator or YamlAggregator
+        aggregates the validated outputs of this document's chunks
+    journal : ExtractionJournal or None
+        checkpoint journal of this document, if checkpointing is enabled
+    chunks : int
+        number of chunks the document was split into
+    """
+
+    def __init__(
+        self,
+        input_file: str,
+        create_aggregator: Callable[[], Any],
+        checkpoint_dir: Optional[str] = None,
+        name: Optional[str] = None,
+    ):
+        self.input_file = input_file
+        self.name = name or os.path.splitext(os.path.basename(input_file))[0]
+        self.aggregator = create_aggregator()
+        # A name given (in batch mode) keeps the journals of identical files apart
+        self.journal = (
+            ExtractionJournal(checkpoint_dir, input_file, name)
+            if checkpoint_dir
+            else None
+        )
+        self.chunks = 0
+
+    def error_rate(self) -> Optional[float]:
+        total_attempts = self.aggregator.success + self.aggregator.fail
+        return self.aggregator.fail / total_attempts if total_attempts else None
+
+
+def write_batch_summary(documents: List[ExtractionDocument], output_file: str):
+    """Writes per-document statistics and the combined, de-duplicated data of all documents."""
+    summary = {"documents": {}}
+    for document in documents:
+        summary["documents"][document.name] = {
+            "input_file": document.input_file,
+            "chunks": document.chunks,
+            "success": document.aggregator.success,
+            "fail": document.aggregator.fail,
+            "error_rate": document.error_rate(),
+            "errors": dict(document.aggregator.errors),
+        }
+    summary["combined"] = merge_aggregators(
+        [document.aggregator for document in documents]
+    ).final_data()
+
+    with open(output_file, "w") as file:
+        json.dump(summary, file, indent=4)
+    print(f"Batch summary has been written to '{output_file}'.")
@@ -0,0 +1,208 @@
+import time
+import queue
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, List, Optional, Union
+
+import requests
+
+
+class MicroBatcher:
+    """
+    Collects prompts submitted from any thread into batches, and sends each batch at once.
+
+    A batch is dispatched as soon as it holds max_batch_size prompts, or
+    max_wait_ms after its first prompt arrived, whichever comes first. Up to
+    max_concurrent_batches batches are in flight at once. Each submitted prompt
+    gets its own Future, so results map back to the chunk that submitted them
+    whatever the order in which batches complete.
+
+    Attributes
+    ----------
+    batches : int
+        number of batches dispatched so far
+    prompts : int
+        number of prompts dispatched so far
+
+    Methods
+    -------
+    submit(prompt: str)
+        Queues a prompt and returns a Future of its result.
+    close()
+        Dispatches the prompts still queued and waits for every batch to complete.
+    """
+
+    def __init__(
+        self,
+        send_batch: Callable[[List[str]], List[Union[dict, Exception]]],
+        max_batch_size: int = 16,
+        max_wait_ms: float = 20.0,
+        max_concurrent_batches: int = 4,
+    ):
+        self.send_batch = send_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.queue = queue.Queue()
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrent_batches)
+        self.batches = 0
+        self.prompts = 0
+
+        self.thread = threading.Thread(target=self._collect, daemon=True)
+        self.thread.start()
+
+    def submit(self, prompt: str) -> Future:
+        """Queues a prompt and returns a Future of its result."""
+        future = Future()
+        self.queue.put((prompt, future))
+        return future
+
+    def close(self):
+        """Dispatches the prompts still queued and waits for every batch to complete."""
+        self.queue.put(None)
+        self.thread.join()
+        self.executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _collect(self):
+        closed = False
+        while not closed:
+            item = self.queue.get()
+            if item is None:
+                break
+
+            batch = [item]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                try:
+                    item = self.queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    closed = True
+                    break
+                batch.append(item)
+
+            self.batches += 1
+            self.prompts += len(batch)
+            self.executor.submit(self._dispatch, batch)
+
+    def _dispatch(self, batch):
+        try:
+            results = self.send_batch([prompt for prompt, _ in batch])
+        except Exception as exc:
+            for _, future in batch:
+                future.set_exception(exc)
+            return
+
+        for (_, future), result in zip(batch, results):
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+
+class CompletionsBatch:
+    """
+    Sends a batch of prompts as one request to an OpenAI-compatible /v1/completions endpoint.
+
+    vLLM accepts a list of prompts in a single request and schedules them
+    together. Generation parameters are given in TGI form and translated. Results
+    are returned in prompt order, in the form of a TGI /generate response with
+    details (finish_reason, generated_tokens). The usage of the request covers
+    the whole batch, so generated_tokens is only set for a batch of one prompt;
+    it is None otherwise, and token accounting then tokenizes the text.
+    """
+
+    def __init__(self, client, model: str, parameters: dict):
+        self.client = client
+        self.payload = {
+            "model": model,
+            "max_tokens": parameters.get("max_new_tokens", 500),
+            "temperature": parameters.get("temperature", 1.0)
+            if parameters.get("do_sample")
+            else 0,
+        }
+        for name in ("top_p", "repetition_penalty", "stop"):
+            if name in parameters:
+                self.payload[name] = parameters[name]
+        # vLLM takes the JSON schema of a TGI grammar as guided_json
+        if parameters.get("grammar", {}).get("type") == "json":
+            self.payload["guided_json"] = parameters["grammar"]["value"]
+
+    def __call__(self, prompts: List[str]) -> List[dict]:
+        with self.client.router.endpoint() as api_endpoint:
+            response = self.client.session.post(
+                f"{api_endpoint}/v1/completions",
+                json=dict(self.payload, prompt=prompts),
+                timeout=self.client.timeout,
+            )
+            response.raise_for_status()
+            body = response.json()
+
+        usage = body.get("usage") or {}
+        generated_tokens = usage.get("completion_tokens") if len(prompts) == 1 else None
+        # Choices are not guaranteed to come back in prompt order
+        results = [None] * len(prompts)
+        for choice in body["choices"]:
+            results[choice["index"]] = {
+                "generated_text": choice["text"],
+                "details": {
+                    "finish_reason": choice.get("finish_reason"),
+                    "generated_tokens": generated_tokens,
+                },
+            }
+        return [
+            result or ValueError("No completion returned for this prompt")
+            for result in results
+        ]
+
+
+class GenerateBatch:
+    """
+    Sends a batch of prompts as concurrent single /generate requests, for TGI.
+
+    TGI takes one prompt per request; its continuous batcher still sees the
+    whole batch arrive at once. A failed request fails only its own prompt.
+    generate defaults to client.generate, and is called as generate(prompt, parameters).
+    """
+
+    def __init__(
+        self,
+        client,
+        parameters: dict,
+        max_workers: int = 64,
+        generate: Optional[Callable[[str, dict], dict]] = None,
+    ):
+        self.client = client
+        self.parameters = parameters
+        self.generate = generate or client.generate
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def __call__(self, prompts: List[str]) -> List[Union[dict, Exception]]:
+        futures = [
+            self.executor.submit(self.generate, prompt, self.parameters)
+            for prompt in prompts
+        ]
+        return [future.exception() or future.result() for future in futures]
+
+
+def detect_batch_api(client) -> str:
+    """
+    Returns "generate" for a TGI server and "completions" for an OpenAI-compatible one.
+
+    TGI answers GET /info; vLLM does not, but lists its models at GET /v1/models.
+    """
+    api_endpoint = client.api_endpoint
+    try:
+        if client.session.get(f"{api_endpoint}/info", timeout=client.timeout).ok:
+            return "generate"
+        if client.session.get(f"{api_endpoint}/v1/models", timeout=client.timeout).ok:
+            return "completions"
+    except requests.exceptions.RequestException:
+        pass
+    return "generate"
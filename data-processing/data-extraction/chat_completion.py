@@ -1,10 +1,26 @@
 import os
-import subprocess
-import json
+import sys
 import time
+import functools
+from concurrent.futures import Future
 from dotenv import load_dotenv
-from tenacity import retry, wait_random_exponential, stop_after_attempt
-from transformers import AutoTokenizer
+
+# The TGI client, resilience, token usage and tokenizer modules are shared with the inference scripts
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "../../inference"))
+from tgi_client import TGIClient, AsyncTGIClient, EndpointRouter
+from resilience import RetryPolicy, AdaptiveLimiter
+from response_cache import ResponseCache
+from token_usage import TokenUsage
+from tokenizer_registry import get_tokenizer
+from batching import MicroBatcher, CompletionsBatch, GenerateBatch, detect_batch_api
+from prompts import ChunkMessages, read_schema
+from constrained_decoding import (
+    grammar_parameter,
+    detect_grammar_support,
+    generate_validated,
+    generate_validated_async,
+)
+from stream_parser import create_stream_parser
 
 # This loads the variables from .env
 load_dotenv()
@@ -12,67 +28,351 @@ load_dotenv()
 # Retrieve the env variables
 model, api_endpoint = os.getenv("MODEL"), os.getenv("API_ENDPOINT")
 
-tgi_api_base = api_endpoint + "/generate"
+# API_ENDPOINT may list several comma-separated endpoints serving the same model;
+# requests are spread over them by one router shared by the sync and async clients
+router = EndpointRouter(
+    api_endpoint,
+    routing=os.getenv("TGI_ROUTING", "least_outstanding"),
+    health_check_interval=float(os.getenv("TGI_HEALTH_CHECK_INTERVAL", 10)),
+    breaker_reset_timeout=float(os.getenv("TGI_BREAKER_RESET_TIMEOUT", 30)),
+)
+
+# One pooled, keep-alive client shared by every request (and thread)
+client = TGIClient(
+    router,
+    pool_size=int(os.getenv("TGI_POOL_SIZE", 32)),
+    connect_timeout=float(os.getenv("TGI_CONNECT_TIMEOUT", 5)),
+    read_timeout=float(os.getenv("TGI_READ_TIMEOUT", 300)),
+)
+
+
+def get_model_tokenizer():
+    """Returns MODEL's tokenizer, loaded on first use (not at import, e.g. not for --help)."""
+    return get_tokenizer(model)
+
+
+def __getattr__(name):
+    # chat_completion.tokenizer, loaded on first access
+    if name == "tokenizer":
+        return get_model_tokenizer()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-tokenizer = AutoTokenizer.from_pretrained(model, trust_remote_code=True)
 
 # # Manual chat template
 # tokenizer.chat_template = '''{% if not add_generation_prompt is defined %}{% set add_generation_prompt = false %}{% endif %}{%- set ns = namespace(found=false) -%}{%- for message in messages -%}{%- if message['role'] == 'system' -%}{%- set ns.found = true -%}{%- endif -%}{%- endfor -%}{{bos_token}}{%- if not ns.found -%}{# Suppressed System Message #}{%- endif %}{%- for message in messages %}{%- if message['role'] != 'system' %}{%- if message['role'] == 'user' %}{{'### Instruction:\\n' + message['content'] + '\\n'}}{%- else %}{{'### Response:\\n' + message['content'] + '\\n\\n'}}{%- endif %}{%- endif %}{%- endfor %}{% if add_generation_prompt %}{{'### Response:'}}{% endif %}'''
 
-@retry(wait=wait_random_exponential(multiplier=1, max=40), stop=stop_after_attempt(3))
-def chat_completion_request_runpod(messages):
-    # formatted_messages = format_messages(messages)
+# Generation parameters shared by the sync and async request functions
+parameters = {
+    "max_new_tokens": 500,
+    "do_sample": False,
+    # "repetition_penalty": 1.1, #can be useful for json, less so for yaml.
+}
+
+# Exact token counts of every request: generated tokens are reported by TGI
+# (details), prompt tokens are tokenized in batches once the requests are timed
+token_usage = TokenUsage(load_tokenizer=get_model_tokenizer)
+
+
+# Optional response cache, see enable_response_cache
+response_cache = None
 
-    formatted_messages = tokenizer.apply_chat_template(
-        messages, tokenize=False, add_generation_prompt=True
+
+def enable_response_cache(path, max_memory_entries=1024, max_disk_bytes=512 * 1024 * 1024):
+    """Caches deterministic (do_sample False) responses in memory and in a SQLite file."""
+    global response_cache
+    response_cache = ResponseCache(path, max_memory_entries, max_disk_bytes)
+    return response_cache
+
+
+# Retryable failures (429, 503, timeouts, ...) are retried with backoff, within a
+# retry budget shared by every request; other failures are raised straight away
+retry_policy = RetryPolicy(max_attempts=int(os.getenv("TGI_MAX_ATTEMPTS", 3)), max_wait=40)
+
+# Optional adaptive concurrency limit, see enable_adaptive_concurrency
+limiter = None
+
+
+def enable_adaptive_concurrency(max_in_flight):
+    """
+    Limits the requests in flight adaptively, between 1 and max_in_flight.
+
+    The limit grows while requests succeed at a steady latency, and is halved
+    when the server reports overload or latency climbs. The request loops read
+    limiter.current before sending each request.
+    """
+    global limiter
+    limiter = AdaptiveLimiter(initial_limit=max(1, max_in_flight // 4), max_limit=max_in_flight)
+    retry_policy.limiter = limiter
+    return limiter
+
+
+def print_resilience_stats():
+    """Prints the retries, requests shed and final concurrency limit of the run."""
+    print(
+        f"Retries: {retry_policy.retries}, refused by the retry budget: {retry_policy.refused}, "
+        f"shed by open circuits: {retry_policy.shed}"
     )
+    if limiter is not None:
+        print(
+            f"Adaptive concurrency limit: {limiter.current} (cut {limiter.decreases} times)"
+        )
+
+
+# Optional constrained decoding, see enable_constrained_decoding
+constrained_decoding = "off"
+create_parser = None
+
+
+def enable_constrained_decoding(schema_file, mode="auto", data_format="json"):
+    """
+    Constrains responses to the output schema, so that fewer of them are thrown away.
+
+    "server" sends the schema as a grammar (TGI grammar, vLLM guided_json); the
+    server then only generates valid JSON, which YAML parsers read too. "local"
+    streams each response through an incremental JSON or YAML parser, and stops
+    it as soon as the answer is complete or can no longer be valid, for servers
+    without grammar support. "auto" picks "server" when the server supports it.
+    """
+    global constrained_decoding, create_parser
+    schema = read_schema(schema_file)
+    if mode == "auto":
+        mode = "server" if detect_grammar_support(client) else "local"
+    if mode == "server":
+        parameters["grammar"] = grammar_parameter(schema)
+    if mode == "local":
+        create_parser = functools.partial(create_stream_parser, data_format, schema)
+    constrained_decoding = mode
+    print(f"Constrained decoding: {mode}")
+    return mode
+
+
+def generate(formatted_messages, request_parameters):
+    """
+    Sends a /generate request, or streams it and stops it early with local
+    validation, retrying it as the retry policy allows.
+    """
+    if constrained_decoding == "local":
+        return retry_policy.call(
+            generate_validated,
+            client,
+            formatted_messages,
+            request_parameters,
+            create_parser=create_parser,
+        )
+    return retry_policy.call(client.generate, formatted_messages, request_parameters)
+
+
+async def generate_async(async_client, formatted_messages, request_parameters):
+    """The asyncio counterpart of generate."""
+    if constrained_decoding == "local":
+        return await retry_policy.call_async(
+            generate_validated_async,
+            async_client,
+            formatted_messages,
+            request_parameters,
+            create_parser=create_parser,
+        )
+    return await retry_policy.call_async(
+        async_client.generate, formatted_messages, request_parameters
+    )
+
+
+def get_cache_key(formatted_messages):
+    # Sampled responses are not reproducible, so they are never cached
+    if response_cache is None or parameters.get("do_sample"):
+        return None
+    # Local constrained decoding cuts responses short, so they are cached apart
+    key_parameters = (
+        dict(parameters, constrained_decoding="local")
+        if constrained_decoding == "local"
+        else parameters
+    )
+    return response_cache.make_key(model, formatted_messages, key_parameters)
+
+
+def cache_response(cache_key, result, response):
+    # Responses stopped early as invalid by local constrained decoding are
+    # sent again next time rather than replayed from the cache
+    if cache_key and (result.get("details") or {}).get("finish_reason") != "invalid":
+        response_cache.put(cache_key, response)
+
+
+def format_chat_messages(messages):
+    # formatted_messages = format_messages(messages)
+
+    # Chunk prompts of a PromptTemplate are rendered without running the chat template
+    if isinstance(messages, ChunkMessages):
+        formatted_messages = messages.render()
+    else:
+        formatted_messages = get_model_tokenizer().apply_chat_template(
+            messages, tokenize=False, add_generation_prompt=True
+        )
 
     print(formatted_messages)
 
-    # Properly escape the string for JSON and for shell execution
-    json_payload = json.dumps(
-        {
-            "inputs": formatted_messages,
-            "parameters": {
-                "max_new_tokens": 500,
-                "do_sample": False,
-                # "repetition_penalty": 1.1, #can be useful for json, less so for yaml.
-            },
-        }
+    return formatted_messages
+
+
+def record_usage(result, formatted_messages, response_time, messages=None):
+    """Records the token usage of a /generate result and returns its text."""
+    response = result.get("generated_text", "No generated text found")
+    tokens_generated = (result.get("details") or {}).get("generated_tokens")
+    # The static part of a PromptTemplate is tokenized once, so only the chunk is counted
+    if isinstance(messages, ChunkMessages):
+        token_usage.record(
+            messages.chunk,
+            response,
+            response_time,
+            completion_tokens=tokens_generated,
+            static_prompt_tokens=messages.template.static_tokens,
+        )
+    else:
+        token_usage.record(
+            formatted_messages, response, response_time, completion_tokens=tokens_generated
+        )
+    print_response_stats(response, response_time, tokens_generated)
+    return response
+
+
+def print_response_stats(response, response_time, tokens_generated=None):
+    # Servers that do not report details are counted later, see token_usage
+    if tokens_generated is not None:
+        tokens_per_second = tokens_generated / response_time if response_time > 0 else 0
+        print(f"Tokens generated: {tokens_generated}")
+        print(f"Tokens per Second: {tokens_per_second:.2f}")
+
+    # Print time taken
+    print(f"Total Time Taken: {response_time:.2f} seconds")
+    print(response)
+
+
+def print_token_usage(elapsed=None):
+    """Prints the exact token counts of every request sent so far."""
+    usage = token_usage.totals()
+    if not usage["requests"]:
+        return
+    print(
+        f"Prompt tokens: {usage['prompt_tokens']}, completion tokens: {usage['completion_tokens']} in {usage['requests']} requests"
     )
-    escaped_json_payload = json_payload.replace(
-        "'", "'\\''"
-    )  # Escape single quotes for shell
+    print(f"Tokens per Second (per request): {usage['tokens_per_second']:.2f}")
+    if elapsed:
+        print(
+            f"Tokens per Second (overall): {usage['completion_tokens'] / elapsed:.2f} over {elapsed:.1f} seconds"
+        )
+
+
+def chat_completion_request_runpod(messages):
+    formatted_messages = format_chat_messages(messages)
+
+    cache_key = get_cache_key(formatted_messages)
+    if cache_key:
+        cached_response = response_cache.get(cache_key)
+        if cached_response is not None:
+            return cached_response
 
     start_time = time.time()  # Start timing
 
-    try:
-        # Execute the curl command
-        curl_command = f"curl -s {tgi_api_base} -X POST -d '{escaped_json_payload}' -H 'Content-Type: application/json'"
+    # Failed requests raise, once the retry policy gives up on them
+    result = generate(formatted_messages, dict(parameters, details=True))
+    response_time = time.time() - start_time  # Calculate response time
+
+    response = record_usage(result, formatted_messages, response_time, messages)
+
+    cache_response(cache_key, result, response)
+
+    return response
+
+
+def create_async_client(max_in_flight):
+    """Creates an AsyncTGIClient for the asyncio engine. Call from a running event loop."""
+    return AsyncTGIClient(
+        router,
+        pool_size=max_in_flight,
+        connect_timeout=float(os.getenv("TGI_CONNECT_TIMEOUT", 5)),
+        read_timeout=float(os.getenv("TGI_READ_TIMEOUT", 300)),
+    )
 
-        response = subprocess.run(
-            curl_command, shell=True, check=True, stdout=subprocess.PIPE
+
+async def chat_completion_request_runpod_async(messages, async_client):
+    formatted_messages = format_chat_messages(messages)
+
+    cache_key = get_cache_key(formatted_messages)
+    if cache_key:
+        cached_response = response_cache.get(cache_key)
+        if cached_response is not None:
+            return cached_response
+
+    start_time = time.time()  # Start timing
+
+    # Failed requests raise, once the retry policy gives up on them
+    result = await generate_async(
+        async_client, formatted_messages, dict(parameters, details=True)
+    )
+    response_time = time.time() - start_time  # Calculate response time
+
+    response = record_usage(result, formatted_messages, response_time, messages)
+
+    cache_response(cache_key, result, response)
+
+    return response
+
+
+def create_micro_batcher(max_batch_size, max_wait_ms, max_in_flight, batch_api="auto"):
+    """
+    Creates a MicroBatcher sending batches through /v1/completions (vLLM, several
+    prompts per request) or as concurrent /generate requests (TGI).
+    """
+    if batch_api == "auto":
+        batch_api = detect_batch_api(client)
+
+    if batch_api == "completions":
+        # A failed batch is retried as a whole
+        send_batch = functools.partial(
+            retry_policy.call, CompletionsBatch(client, model, parameters)
         )
-        response_time = time.time() - start_time  # Calculate response time
+    else:
+        send_batch = GenerateBatch(
+            client,
+            dict(parameters, details=True),
+            max_workers=max_in_flight,
+            generate=generate,
+        )
+    print(f"Micro-batching up to {max_batch_size} prompts or {max_wait_ms} ms, via {batch_api}")
 
-        response = response.stdout.decode()
+    return MicroBatcher(
+        send_batch,
+        max_batch_size=max_batch_size,
+        max_wait_ms=max_wait_ms,
+        max_concurrent_batches=max(1, max_in_flight // max_batch_size),
+    )
 
-        # print(response)
 
-        response = json.loads(response).get("generated_text", "No generated text found")
+def chat_completion_request_micro_batched(messages, batcher):
+    """Submits a request to a MicroBatcher, and returns a Future of the response text."""
+    formatted_messages = format_chat_messages(messages)
+    response_future = Future()
 
-        # Calculate tokens per second
-        tokens_generated = len(response) / 4  # assuming 4 characters per word
-        tokens_per_second = tokens_generated / response_time if response_time > 0 else 0
+    cache_key = get_cache_key(formatted_messages)
+    if cache_key:
+        cached_response = response_cache.get(cache_key)
+        if cached_response is not None:
+            response_future.set_result(cached_response)
+            return response_future
 
-        # Print time taken and tokens per second
-        print(f"Tokens generated: {tokens_generated:.2f}")
-        print(f"Total Time Taken: {response_time:.2f} seconds")
-        print(f"Tokens per Second: {tokens_per_second:.2f}")
-        print(response)
+    start_time = time.time()  # Start timing, including the wait for the batch to fill
+
+    def on_done(batch_future):
+        try:
+            result = batch_future.result()
+        except Exception as e:
+            response_future.set_exception(e)
+            return
+
+        response_time = time.time() - start_time  # Calculate response time
+        response = record_usage(result, formatted_messages, response_time, messages)
+
+        cache_response(cache_key, result, response)
+        response_future.set_result(response)
 
-        return response
-    except subprocess.CalledProcessError as e:
-        print("Unable to generate ChatCompletion response")
-        print(f"Exception: {e}")
-        return str(e)
+    batcher.submit(formatted_messages).add_done_callback(on_done)
+    return response_future
@@ -0,0 +1,99 @@
+import os
+import json
+import hashlib
+import threading
+from typing import Any, Dict, Optional
+
+
+def hash_file(file_path: str, block_size: int = 1024 * 1024) -> str:
+    """Returns the SHA-256 of a file, read in blocks."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        for block in iter(lambda: file.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def hash_messages(messages) -> str:
+    """Returns the SHA-256 of a chat message list, i.e. of the prompt sent for a chunk."""
+    return hashlib.sha256(json.dumps(messages, sort_keys=True).encode()).hexdigest()
+
+
+class ExtractionJournal:
+    """
+    An append-only journal of the chunks an extraction run has completed.
+
+    Every validated chunk output is appended as one JSON line keyed by
+    (input file hash, chunk index, prompt hash), and flushed to disk straight away.
+    A restarted run over the same input loads the journal, merges the stored
+    outputs into its aggregator and only sends the chunks that are missing. A
+    changed schema, prompt or chunking changes the prompt hash of a chunk, so
+    stale entries are ignored rather than merged.
+
+    Attributes
+    ----------
+    journal_file : str
+        path of the JSON lines file, one per input file hash (and document name, if given)
+    completed : Dict[int, Dict[str, Any]]
+        validated outputs loaded from the journal, by chunk index
+
+    Methods
+    -------
+    is_completed(chunk_index: int, messages: list)
+        Whether the chunk was completed with the same prompt by an earlier run.
+    record(chunk_index: int, messages: list, data: Dict[str, Any])
+        Appends a validated chunk output to the journal.
+    """
+
+    def __init__(self, checkpoint_dir: str, input_file: str, name: Optional[str] = None):
+        os.makedirs(checkpoint_dir, exist_ok=True)
+        self.input_hash = hash_file(input_file)
+        # Identical files of a batch would otherwise share (and interleave) one journal
+        journal_name = (
+            self.input_hash
+            if name is None
+            else f"{self.input_hash}-{hashlib.sha256(name.encode()).hexdigest()[:12]}"
+        )
+        self.journal_file = os.path.join(checkpoint_dir, f"{journal_name}.jsonl")
+        self.completed: Dict[int, Dict[str, Any]] = {}
+        self.prompt_hashes: Dict[int, str] = {}
+        self.lock = threading.Lock()
+
+        if os.path.exists(self.journal_file):
+            self.load()
+
+        self.file = open(self.journal_file, "a")
+
+    def load(self):
+        """Loads the completed chunks of earlier runs."""
+        with open(self.journal_file, "r") as file:
+            for line in file:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # A run that crashed mid-write leaves a truncated last line
+                    continue
+                if entry.get("input_hash") != self.input_hash:
+                    continue
+                self.completed[entry["chunk_index"]] = entry["data"]
+                self.prompt_hashes[entry["chunk_index"]] = entry["prompt_hash"]
+
+    def is_completed(self, chunk_index: int, messages) -> bool:
+        """Whether the chunk was completed with the same prompt by an earlier run."""
+        return self.prompt_hashes.get(chunk_index) == hash_messages(messages)
+
+    def record(self, chunk_index: int, messages, data: Dict[str, Any]):
+        """Appends a validated chunk output to the journal."""
+        entry = {
+            "input_hash": self.input_hash,
+            "chunk_index": chunk_index,
+            "prompt_hash": hash_messages(messages),
+            "data": data,
+        }
+        with self.lock:
+            self.file.write(json.dumps(entry, default=str) + "\n")
+            self.file.flush()
+            os.fsync(self.file.fileno())
+
+    def close(self):
+        self.file.close()
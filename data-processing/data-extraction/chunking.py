@@ -0,0 +1,204 @@
+import re
+from typing import Iterable, Iterator, List
+
+# A sentence ends at terminal punctuation (plus any closing quotes/brackets)
+# followed by whitespace, or at a blank line. The whitespace stays attached to
+# the preceding sentence so that "".join(sentences) == text.
+SENTENCE_BOUNDARY = re.compile(r"[.!?]+[\"')\]]*\s+|\n\s*\n")
+
+# A "sentence" without any boundary is cut at whitespace beyond this length, so
+# that unpunctuated text (e.g. transcripts) does not accumulate in memory
+MAX_SENTENCE_CHARS = 64 * 1024
+
+# A text that is too long for a chunk on its own is split at line breaks, then
+# at whitespace, and only for a single overlong word on token boundaries
+LINE_PIECES = re.compile(r"[^\n]*\n+|[^\n]+")
+WORD_PIECES = re.compile(r"\S+\s*|\s+")
+
+# Tokens kept free of the budget of every chunk: a chunk's first and last tokens
+# may merge with the template text around them, so the rendered prompt can be a
+# token or two longer than its parts counted separately
+CHUNK_TOKEN_MARGIN = 8
+
+# model_max_length is set to a huge sentinel when the tokenizer config has no limit
+UNSET_MODEL_MAX_LENGTH = 1_000_000
+
+
+def split_sentences(text: str) -> Iterator[str]:
+    """Yields the sentences of a text, keeping trailing whitespace with each sentence."""
+    return iter_sentences([text])
+
+
+def iter_sentences(
+    blocks: Iterable[str], max_sentence_chars: int = MAX_SENTENCE_CHARS
+) -> Iterator[str]:
+    """
+    Yields the sentences of a text that arrives in blocks, e.g. from utils.iter_text_file.
+
+    A sentence may span blocks: the text after the last boundary of a block is
+    carried over to the next one. A boundary that touches the end of a block is
+    not trusted yet, since the next block may continue it.
+    """
+    buffer = ""
+    for block in blocks:
+        buffer += block
+        start = 0
+        for match in SENTENCE_BOUNDARY.finditer(buffer):
+            if match.end() == len(buffer):
+                break
+            yield buffer[start : match.end()]
+            start = match.end()
+        buffer = buffer[start:]
+
+        while len(buffer) > max_sentence_chars:
+            cut = buffer.rfind(" ", 0, max_sentence_chars) + 1 or max_sentence_chars
+            yield buffer[:cut]
+            buffer = buffer[cut:]
+
+    if buffer:
+        yield buffer
+
+
+def iter_character_chunks(blocks: Iterable[str], chunk_length: int) -> Iterator[str]:
+    """Yields chunks of exactly chunk_length characters (the last may be shorter) from text blocks."""
+    buffer = ""
+    for block in blocks:
+        buffer += block
+        for start in range(0, len(buffer) - chunk_length + 1, chunk_length):
+            yield buffer[start : start + chunk_length]
+        buffer = buffer[len(buffer) - len(buffer) % chunk_length :]
+    if buffer:
+        yield buffer
+
+
+def model_context_window(tokenizer, default: int = 4096) -> int:
+    """Returns the tokenizer's context window, or the default if it is not configured."""
+    max_length = getattr(tokenizer, "model_max_length", None)
+    if not max_length or max_length >= UNSET_MODEL_MAX_LENGTH:
+        return default
+    return max_length
+
+
+def render_prompt_ids(tokenizer, messages) -> List[int]:
+    """Returns the token ids of a chat rendered with the tokenizer's chat template."""
+    rendered = tokenizer.apply_chat_template(
+        messages, tokenize=False, add_generation_prompt=True
+    )
+    # The template already renders any special tokens, as in apply_chat_template(tokenize=True)
+    return tokenizer(rendered, add_special_tokens=False)["input_ids"]
+
+
+def count_prompt_tokens(tokenizer, messages) -> int:
+    """Counts the tokens of a chat rendered with the tokenizer's chat template."""
+    return len(render_prompt_ids(tokenizer, messages))
+
+
+def shared_prefix_length(tokenizer, messages, other_messages) -> int:
+    """Counts the leading tokens that two rendered chats have in common."""
+    ids = render_prompt_ids(tokenizer, messages)
+    other_ids = render_prompt_ids(tokenizer, other_messages)
+    length = 0
+    for token_id, other_token_id in zip(ids, other_ids):
+        if token_id != other_token_id:
+            break
+        length += 1
+    return length
+
+
+def pack_chunks(
+    sentences: Iterable[str],
+    tokenizer,
+    max_tokens: int,
+    overlap_tokens: int = 0,
+    batch_size: int = 256,
+) -> Iterator[str]:
+    """
+    Packs sentences into chunks of at most max_tokens tokens.
+
+    Chunk boundaries snap to sentence boundaries. The last sentences of a chunk
+    (up to overlap_tokens tokens) are repeated at the start of the next chunk, so
+    that names spanning a boundary are seen whole at least once. A sentence that is
+    longer than max_tokens on its own (e.g. unpunctuated transcripts) is packed
+    line by line instead, and a line that is still too long word by word, so that
+    chunks do not end mid-word; only a single word longer than max_tokens is split
+    on token boundaries.
+
+    Sentences are tokenized in batches of batch_size, without special tokens. Token
+    counts of separately tokenized sentences add up to at least the count of their
+    concatenation for the usual BPE/SentencePiece tokenizers, so a chunk never
+    exceeds the budget.
+    """
+    if overlap_tokens >= max_tokens:
+        raise ValueError("overlap_tokens must be smaller than max_tokens")
+
+    current: List[str] = []
+    current_counts: List[int] = []
+    current_tokens = 0
+
+    for batch in _batched(sentences, batch_size):
+        token_ids = tokenizer(batch, add_special_tokens=False)["input_ids"]
+
+        pieces = (
+            piece
+            for sentence, ids in zip(batch, token_ids)
+            for piece in (
+                [(sentence, len(ids))]
+                if len(ids) <= max_tokens
+                else _split_text(tokenizer, sentence, max_tokens, batch_size)
+            )
+        )
+        for sentence, count in pieces:
+            if current_tokens + count > max_tokens:
+                yield "".join(current)
+
+                # Carry the tail of the chunk over as overlap, leaving room for the new sentence
+                carried = 0
+                keep = 0
+                for carried_count in reversed(current_counts):
+                    if carried + carried_count > min(overlap_tokens, max_tokens - count):
+                        break
+                    carried += carried_count
+                    keep += 1
+                current = current[len(current) - keep :]
+                current_counts = current_counts[len(current_counts) - keep :]
+                current_tokens = carried
+
+            current.append(sentence)
+            current_counts.append(count)
+            current_tokens += count
+
+    if current:
+        yield "".join(current)
+
+
+def _split_text(tokenizer, text, max_tokens, batch_size, patterns=(LINE_PIECES, WORD_PIECES)):
+    # Yields (piece, token count) pairs of at most max_tokens tokens that join up to text
+    if not patterns:
+        yield from _split_tokens(tokenizer, text, max_tokens)
+        return
+    for batch in _batched(patterns[0].findall(text), batch_size):
+        token_ids = tokenizer(batch, add_special_tokens=False)["input_ids"]
+        for piece, ids in zip(batch, token_ids):
+            if len(ids) <= max_tokens:
+                yield piece, len(ids)
+            else:
+                yield from _split_text(tokenizer, piece, max_tokens, batch_size, patterns[1:])
+
+
+def _split_tokens(tokenizer, text, max_tokens):
+    # Last resort for a single word longer than a chunk
+    ids = tokenizer(text, add_special_tokens=False)["input_ids"]
+    for start in range(0, len(ids), max_tokens):
+        piece_ids = ids[start : start + max_tokens]
+        yield tokenizer.decode(piece_ids), len(piece_ids)
+
+
+def _batched(iterable, batch_size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
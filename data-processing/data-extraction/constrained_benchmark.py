@@ -0,0 +1,124 @@
+import os
+import sys
+import json
+import yaml
+import argparse
+import functools
+import concurrent.futures
+
+# The TGI client and the mock server live with the inference scripts
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "../../inference"))
+from tgi_client import TGIClient
+from prompts import read_schema
+from schema_validation import CompiledValidator
+from constrained_decoding import grammar_parameter, generate_validated
+from stream_parser import create_stream_parser
+from mock_tgi_server import serve_in_background
+
+# Compares the completion tokens wasted per valid record without constrained
+# decoding, with the schema sent as a TGI grammar, and with local stop-early
+# validation of the stream (stream_parser.py). Runs against the mock TGI server,
+# where a share of unconstrained responses ramble before or after the answer up
+# to max_new_tokens. Wasted tokens are those of invalid responses, and those
+# after a valid answer. With --flow_style, the YAML answer is in flow style
+# ({names: [...], ...}), as is JSON.
+# Usage: python constrained_benchmark.py --requests 200 --invalid_rate 0.3 --output_format yaml
+
+SAMPLE_RESPONSES = {
+    "json": '{"names": ["Warren Buffett", "Charlie Munger"], "organisations": ["Berkshire Hathaway"]}',
+    "yaml": "names:\n- Warren Buffett\n- Charlie Munger\norganisations:\n- Berkshire Hathaway\n",
+    "yaml_flow": "{names: [Warren Buffett, Charlie Munger], organisations: [Berkshire Hathaway]}",
+}
+
+
+def send(client, mode, parameters, create_parser):
+    if mode == "local":
+        return generate_validated(
+            client, "Extract names and organisations.", parameters, create_parser=create_parser
+        )
+    return client.generate("Extract names and organisations.", parameters)
+
+
+def parse(text, output_format):
+    # The grammar makes the server answer in JSON, which the YAML parser reads too
+    return json.loads(text) if output_format == "json" else yaml.safe_load(text)
+
+
+def measure(client, mode, parameters, args, validator, create_parser):
+    requests = args.requests
+    with concurrent.futures.ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        results = list(
+            executor.map(
+                lambda _: send(client, mode, parameters, create_parser), range(requests)
+            )
+        )
+
+    valid = 0
+    generated_tokens = 0
+    wasted_tokens = 0
+    for result in results:
+        tokens = result["details"]["generated_tokens"]
+        generated_tokens += tokens
+        try:
+            data = parse(result["generated_text"], args.output_format)
+        except (json.JSONDecodeError, yaml.YAMLError):
+            wasted_tokens += tokens
+            continue
+        if validator(data) is not None:
+            wasted_tokens += tokens
+            continue
+        valid += 1
+        # Tokens beyond the answer; a valid response is expected to stop after it
+        wasted_tokens += max(0, tokens - answer_tokens)
+
+    print(
+        f"{mode:<7} valid {valid}/{requests} ({valid / requests:.0%}), "
+        f"completion tokens {generated_tokens}, wasted {wasted_tokens}, "
+        f"wasted per valid record {wasted_tokens / valid if valid else float('inf'):.1f}"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Measure wasted completion tokens with and without constrained decoding."
+    )
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--invalid_rate", type=float, default=0.3)
+    parser.add_argument("--max_new_tokens", type=int, default=500)
+    parser.add_argument("--token_latency", type=float, default=0.0005)
+    parser.add_argument("--output_format", choices=["json", "yaml"], default="json")
+    parser.add_argument(
+        "--flow_style", action="store_true", help="Answer YAML in flow style."
+    )
+    args = parser.parse_args()
+
+    schema_file = {
+        "json": "./json_files/json_schema.json",
+        "yaml": "./yaml_files/yaml_schema.yaml",
+    }[args.output_format]
+    schema = read_schema(schema_file)
+    validator = CompiledValidator(schema)
+    create_parser = functools.partial(create_stream_parser, args.output_format, schema)
+    # The mock generates one token per word
+    sample_response = SAMPLE_RESPONSES[
+        "yaml_flow" if args.flow_style and args.output_format == "yaml" else args.output_format
+    ]
+    answer_tokens = len(sample_response.split(" "))
+
+    server, base_url = serve_in_background(
+        generated_text=sample_response,
+        token_latency=args.token_latency,
+        invalid_rate=args.invalid_rate,
+    )
+    parameters = {"max_new_tokens": args.max_new_tokens, "do_sample": False, "details": True}
+
+    with TGIClient(base_url, pool_size=args.concurrency) as client:
+        for mode, mode_parameters in [
+            ("off", parameters),
+            ("server", dict(parameters, grammar=grammar_parameter(schema))),
+            ("local", parameters),
+        ]:
+            measure(client, mode, mode_parameters, args, validator, create_parser)
+
+    server.shutdown()
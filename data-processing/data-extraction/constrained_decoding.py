@@ -0,0 +1,109 @@
+import os
+import re
+import sys
+from typing import Callable, Optional
+
+import requests
+
+# The TGI client, resilience, token usage and tokenizer modules are shared with the inference scripts
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "../../inference"))
+from tgi_client import StreamTimings
+from stream_parser import StreamParser, JsonStreamParser
+
+# TGI accepts a JSON schema as a grammar from version 1.4.3
+TGI_GRAMMAR_VERSION = (1, 4, 3)
+
+
+def grammar_parameter(schema: dict) -> dict:
+    """
+    Returns the TGI grammar parameter constraining generation to a JSON schema.
+
+    Requests to vLLM's /v1/completions send the same schema as guided_json, see
+    CompletionsBatch.
+    """
+    return {"type": "json", "value": schema}
+
+
+def detect_grammar_support(client) -> bool:
+    """
+    Whether the server constrains generation to a schema.
+
+    True for TGI 1.4.3 or later (GET /info reports its version), and for
+    OpenAI-compatible servers listing their models at GET /v1/models (vLLM
+    supports guided_json since 0.4).
+    """
+    api_endpoint = client.api_endpoint
+    try:
+        response = client.session.get(f"{api_endpoint}/info", timeout=client.timeout)
+        if response.ok:
+            version = re.findall(r"\d+", str(response.json().get("version", "")))
+            return tuple(int(number) for number in version[:3]) >= TGI_GRAMMAR_VERSION
+        return client.session.get(f"{api_endpoint}/v1/models", timeout=client.timeout).ok
+    except (requests.exceptions.RequestException, ValueError):
+        return False
+
+
+def generate_validated(
+    client,
+    inputs: str,
+    parameters: Optional[dict] = None,
+    timings: Optional[StreamTimings] = None,
+    create_parser: Callable[[], StreamParser] = JsonStreamParser,
+) -> dict:
+    """
+    Streams a generation through a stream parser, and stops it once the top-level
+    value has closed or the output can no longer be valid.
+
+    Closing the stream makes TGI stop generating, so neither the text after the
+    answer nor the rest of a malformed response costs GPU time. Returns a result
+    in the form of a /generate response, with the text up to the end of the answer.
+    """
+    parser = create_parser()
+    text = ""
+    tokens = 0
+    stream = client.generate_stream(inputs, parameters, timings)
+    try:
+        for token in stream:
+            tokens += 1
+            text += token
+            if parser.feed(token) != "incomplete":
+                break
+    finally:
+        stream.close()
+    return validated_result(parser, text, tokens)
+
+
+async def generate_validated_async(
+    async_client,
+    inputs: str,
+    parameters: Optional[dict] = None,
+    timings: Optional[StreamTimings] = None,
+    create_parser: Callable[[], StreamParser] = JsonStreamParser,
+) -> dict:
+    """The asyncio counterpart of generate_validated."""
+    parser = create_parser()
+    text = ""
+    tokens = 0
+    stream = async_client.generate_stream(inputs, parameters, timings)
+    try:
+        async for token in stream:
+            tokens += 1
+            text += token
+            if parser.feed(token) != "incomplete":
+                break
+    finally:
+        await stream.aclose()
+    return validated_result(parser, text, tokens)
+
+
+def validated_result(parser: StreamParser, text: str, tokens: int) -> dict:
+    if parser.status == "complete":
+        text = text[: parser.end]
+    return {
+        "generated_text": text,
+        "details": {
+            # "incomplete" means the server stopped first, e.g. at max_new_tokens
+            "finish_reason": parser.status,
+            "generated_tokens": tokens,
+        },
+    }
@@ -0,0 +1,96 @@
+import os
+import sys
+import re
+import time
+import argparse
+import statistics
+import subprocess
+
+# The mock server lives with the inference scripts
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "../../inference"))
+from mock_tgi_server import serve_in_background
+
+# Compares the execution engines of the extraction script (--engine threads and
+# --engine asyncio) on the same input, against a mock TGI server with a fixed
+# latency per request: the wall time of each run and its peak RSS, each run in
+# a fresh process. Both engines keep max_in_flight requests outstanding (the
+# thread pool has as many workers), with the adaptive concurrency limit and the
+# response cache off, so that every run sends every chunk (of chunk_length
+# characters).
+# The time spent sending requests is read from the script's token usage report.
+# Usage: python engine_benchmark.py --input_file_name berkshire23.txt --chunk_length 1000 --max_in_flight 64
+
+
+# "Tokens per Second (overall): ... over 1.2 seconds", printed by print_token_usage
+REQUEST_TIME = re.compile(r"over ([\d.]+) seconds")
+
+
+def run(engine, base_url, args):
+    """
+    Runs the extraction script once, returns its wall time and the time spent
+    sending requests (in seconds), and its peak RSS (in MB).
+    """
+    command = [
+        sys.executable,
+        "tgi-data-extraction.py",
+        "--input_file_name", args.input_file_name,
+        "--chunking", "characters",
+        "--chunk_length", str(args.chunk_length),
+        "--engine", engine,
+        "--max_in_flight", str(args.max_in_flight),
+        "--no_adaptive_concurrency",
+        "--no_cache",
+        "--output_file_name", "engine_benchmark",
+    ]  # fmt: skip
+    # Connection pools as large as the requests in flight, for either engine
+    env = dict(os.environ, API_ENDPOINT=base_url, TGI_POOL_SIZE=str(args.max_in_flight))
+
+    start_time = time.perf_counter()
+    process = subprocess.Popen(
+        command, env=env, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+    )
+    output = process.stdout.read().decode()
+    # wait4 returns the resource usage of this child alone
+    _, status, usage = os.wait4(process.pid, 0)
+    elapsed = time.perf_counter() - start_time
+    if os.waitstatus_to_exitcode(status) != 0:
+        raise SystemExit(f"{' '.join(command)} failed")
+    match = REQUEST_TIME.search(output)
+    return elapsed, float(match.group(1)) if match else float("nan"), usage.ru_maxrss / 1024
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Measure the wall time and peak memory of the execution engines."
+    )
+    parser.add_argument("--input_file_name", type=str, default="berkshire23.txt")
+    parser.add_argument("--chunk_length", type=int, default=1000)
+    parser.add_argument("--max_in_flight", type=int, default=64)
+    parser.add_argument("--latency", type=float, default=0.2, help="Mock server latency per request.")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--engines", nargs="+", default=["threads", "asyncio"])
+    args = parser.parse_args()
+
+    if not os.getenv("MODEL"):
+        raise SystemExit("Set MODEL (or a .env file) to load the tokenizer")
+
+    server, base_url = serve_in_background(latency=args.latency)
+    size_kb = os.path.getsize(f"./input_files/{args.input_file_name}") / 1024
+    print(
+        f"{args.input_file_name} ({size_kb:.0f} KB) in chunks of {args.chunk_length} characters, "
+        f"{args.max_in_flight} requests in flight, {args.latency} s per request"
+    )
+    try:
+        for engine in args.engines:
+            results = [run(engine, base_url, args) for _ in range(args.runs)]
+            print(
+                f"{engine:<8} {statistics.median(result[0] for result in results):.2f} s, "
+                f"{statistics.median(result[1] for result in results):.2f} s sending requests, "
+                f"peak RSS {max(result[2] for result in results):.0f} MB "
+                f"(median and max of {args.runs} runs)"
+            )
+    finally:
+        server.shutdown()
+        output_file = "./outputs/engine_benchmark.json"
+        if os.path.exists(output_file):
+            os.remove(output_file)
@@ -0,0 +1,141 @@
+import os
+import sys
+import time
+import argparse
+import resource
+import subprocess
+import tempfile
+
+from utils import read_text_file, iter_text_file
+from chunking import iter_character_chunks, iter_sentences, split_sentences, pack_chunks
+from prompts import json_extract_prompt
+
+# The tokenizer registry lives with the inference scripts
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "../../inference"))
+from tokenizer_registry import get_tokenizer
+
+# Compares the peak memory of building every chunk prompt of a large input up
+# front (the previous pipeline) against the streaming pipeline, on a synthetic
+# corpus made by repeating berkshire23.txt, with character chunks and with
+# token chunks (sentences packed with the MODEL tokenizer, as --chunking
+# tokens does; the peak RSS then includes the tokenizer). No requests are sent.
+# Usage: python memory_benchmark.py --size_gb 2
+
+
+def create_messages(chunk):
+    return [
+        {
+            "role": "user",
+            "content": f"""{json_extract_prompt}\n\n[TEXT_START]\n\n...{chunk}...\n\n[TEXT_END]\n\nNow, answer immediately and only in json format.""",
+        }
+    ]
+
+
+def build_corpus(corpus_file, size_bytes, source_file="./input_files/berkshire23.txt"):
+    with open(source_file, "r") as file:
+        source = file.read()
+    with open(corpus_file, "w") as file:
+        written = 0
+        while written < size_bytes:
+            written += file.write(source)
+
+
+def run_eager(corpus_file, chunk_length):
+    text = read_text_file(corpus_file)
+    message_lists = [
+        create_messages(text[i : i + chunk_length])
+        for i in range(0, len(text), chunk_length)
+    ]
+    return len(message_lists)
+
+
+def run_eager_tokens(corpus_file, chunk_tokens):
+    text = read_text_file(corpus_file)
+    chunks = list(pack_chunks(split_sentences(text), get_tokenizer(os.getenv("MODEL")), chunk_tokens))
+    message_lists = [create_messages(chunk) for chunk in chunks]
+    return len(message_lists)
+
+
+def run_streaming(corpus_file, chunk_length, use_mmap, chunk_tokens=None):
+    chunk_count = 0
+    blocks = iter_text_file(corpus_file, use_mmap=use_mmap)
+    chunks = (
+        pack_chunks(iter_sentences(blocks), get_tokenizer(os.getenv("MODEL")), chunk_tokens)
+        if chunk_tokens
+        else iter_character_chunks(blocks, chunk_length)
+    )
+    for chunk in chunks:
+        # Each prompt is built just before dispatch and dropped afterwards
+        create_messages(chunk)
+        chunk_count += 1
+    return chunk_count
+
+
+def measure(mode, corpus_file, chunk_length, chunk_tokens):
+    # Each mode runs in its own process, so that peak RSS is not shared
+    output = subprocess.run(
+        [
+            sys.executable,
+            __file__,
+            "--run",
+            mode,
+            "--corpus_file",
+            corpus_file,
+            "--chunk_length",
+            str(chunk_length),
+            "--chunk_tokens",
+            str(chunk_tokens),
+        ],
+        check=True,
+        stdout=subprocess.PIPE,
+    ).stdout.decode()
+    print(output.strip())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Measure the peak memory of eager and streaming prompt construction."
+    )
+    parser.add_argument("--size_gb", type=float, default=1.0)
+    parser.add_argument("--chunk_length", type=int, default=6000)
+    parser.add_argument("--chunk_tokens", type=int, default=2000)
+    parser.add_argument(
+        "--modes",
+        nargs="+",
+        choices=["eager", "streaming", "streaming-mmap", "eager-tokens", "streaming-tokens"],
+        default=["streaming", "streaming-mmap", "eager", "streaming-tokens", "eager-tokens"],
+    )
+    parser.add_argument("--corpus_file", type=str, default=None)
+    parser.add_argument("--run", type=str, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        start_time = time.perf_counter()
+        if args.run == "eager":
+            chunk_count = run_eager(args.corpus_file, args.chunk_length)
+        elif args.run == "eager-tokens":
+            chunk_count = run_eager_tokens(args.corpus_file, args.chunk_tokens)
+        elif args.run == "streaming-tokens":
+            chunk_count = run_streaming(args.corpus_file, None, False, args.chunk_tokens)
+        else:
+            chunk_count = run_streaming(
+                args.corpus_file, args.chunk_length, args.run == "streaming-mmap"
+            )
+        elapsed = time.perf_counter() - start_time
+        peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        print(
+            f"{args.run:<17} {chunk_count} chunks in {elapsed:.1f} seconds, peak RSS {peak_rss_mb:.0f} MB"
+        )
+        sys.exit()
+
+    if any(mode.endswith("tokens") for mode in args.modes) and not os.getenv("MODEL"):
+        raise SystemExit("Set MODEL to load the tokenizer for the token chunking modes")
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        corpus_file = args.corpus_file or os.path.join(temp_dir, "corpus.txt")
+        if not os.path.exists(corpus_file):
+            build_corpus(corpus_file, int(args.size_gb * 1024**3))
+        print(f"Corpus: {os.path.getsize(corpus_file) / 1024**2:.0f} MB")
+
+        for mode in args.modes:
+            measure(mode, corpus_file, args.chunk_length, args.chunk_tokens)
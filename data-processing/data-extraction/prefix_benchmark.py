@@ -0,0 +1,78 @@
+import os
+import argparse
+
+from dotenv import load_dotenv
+from transformers import AutoTokenizer
+
+from utils import iter_text_file
+from chunking import iter_character_chunks, render_prompt_ids, shared_prefix_length
+from prompts import get_extract_prompt, create_chunk_messages
+
+# Compares the prefill tokens of one extraction run with the inline and the
+# shared_prefix prompt layouts, without and with server prefix caching. Prefix
+# caching is simulated as in vLLM: the prompt is split into blocks of block_size
+# tokens, and a block is reused when it and every block before it have been seen.
+# No requests are sent.
+# Usage: python prefix_benchmark.py --input_file ./input_files/berkshire23.txt
+
+
+def cached_prefill_tokens(prompt_ids, cache, block_size):
+    """Returns the tokens of a prompt that are not in the cache, and caches its full blocks."""
+    cached_tokens = 0
+    block_hash = None
+    reusing = True
+    for start in range(0, len(prompt_ids) - block_size + 1, block_size):
+        block_hash = hash((block_hash, tuple(prompt_ids[start : start + block_size])))
+        if reusing and block_hash in cache:
+            cached_tokens += block_size
+        else:
+            reusing = False
+            cache.add(block_hash)
+    return len(prompt_ids) - cached_tokens
+
+
+def measure(tokenizer, chunks, prompt, data_format, layout, block_size):
+    prompt_tokens = 0
+    prefill_tokens = 0
+    cache = set()
+    for chunk in chunks:
+        prompt_ids = render_prompt_ids(
+            tokenizer, create_chunk_messages(prompt, chunk, data_format, layout)
+        )
+        prompt_tokens += len(prompt_ids)
+        prefill_tokens += cached_prefill_tokens(prompt_ids, cache, block_size)
+
+    # Leading tokens every chunk has in common
+    shared_prefix = shared_prefix_length(
+        tokenizer,
+        create_chunk_messages(prompt, "A", data_format, layout),
+        create_chunk_messages(prompt, "B", data_format, layout),
+    )
+    print(
+        f"{layout:<14} shared prefix {shared_prefix} tokens, prompt tokens {prompt_tokens}, "
+        f"prefilled with prefix caching {prefill_tokens} ({prefill_tokens / prompt_tokens:.0%})"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Measure prefill tokens per run of the inline and shared_prefix prompt layouts."
+    )
+    parser.add_argument("--input_file", type=str, default="./input_files/berkshire23.txt")
+    parser.add_argument("--output_format", choices=["json", "yaml"], default="json")
+    parser.add_argument("--chunk_length", type=int, default=6000)
+    parser.add_argument("--block_size", type=int, default=16)
+    args = parser.parse_args()
+
+    load_dotenv()
+    tokenizer = AutoTokenizer.from_pretrained(os.getenv("MODEL"), trust_remote_code=True)
+
+    prompt = get_extract_prompt(args.output_format)
+    chunks = list(iter_character_chunks(iter_text_file(args.input_file), args.chunk_length))
+    print(f"{len(chunks)} chunks of {args.chunk_length} characters, block size {args.block_size}")
+
+    for layout in ("inline", "shared_prefix"):
+        try:
+            measure(tokenizer, chunks, prompt, args.output_format, layout, args.block_size)
+        except Exception as exc:
+            print(f"{layout:<14} not supported by the chat template ({exc})")
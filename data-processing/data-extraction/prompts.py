@@ -1,5 +1,7 @@
 import json
 import yaml
+import hashlib
+import functools
 
 def read_schema(file_path):
     """Reads a JSON or YAML schema from a given file path."""
@@ -67,9 +69,145 @@ def create_extract_prompt(schema, data_format):
     )
     return prompt
 
-# Example usage
-json_schema = read_schema("./json_files/json_schema.json")
-yaml_schema = read_schema("./yaml_files/yaml_schema.yaml")
+def create_chunk_messages(extract_prompt, chunk, data_format, layout="inline"):
+    """
+    Wraps a chunk of text and the extraction prompt into a chat message list.
 
-json_extract_prompt = create_extract_prompt(json_schema, "JSON")
-yaml_extract_prompt = create_extract_prompt(yaml_schema, "YAML")
+    "inline" puts the prompt and the chunk in a single user message. "shared_prefix"
+    puts the prompt in a system message and only the chunk in the user message, so
+    that the static instructions and schema render to the same leading tokens for
+    every chunk, which servers with prefix caching prefill only once.
+    """
+    text = f"[TEXT_START]\n\n...{chunk}...\n\n[TEXT_END]\n\nNow, answer immediately and only in {data_format} format."
+    if layout == "shared_prefix":
+        return [
+            {"role": "system", "content": extract_prompt},
+            {"role": "user", "content": text},
+        ]
+    return [{"role": "user", "content": f"{extract_prompt}\n\n{text}"}]
+
+# Schema files of each output format, read only when that format's prompt is first used
+SCHEMA_FILES = {
+    "json": "./json_files/json_schema.json",
+    "yaml": "./yaml_files/yaml_schema.yaml",
+}
+
+def get_extract_prompt(data_format, schema_file=None):
+    """
+    Returns the extraction prompt of a data format, built on first use.
+
+    Prompts are cached by the SHA-256 of the schema file, so editing the schema
+    rebuilds the prompt while unchanged schemas are only read and rendered once.
+    """
+    data_format = data_format.lower()
+    schema_file = schema_file or SCHEMA_FILES[data_format]
+    with open(schema_file, "rb") as f:
+        schema_hash = hashlib.sha256(f.read()).hexdigest()
+    return _cached_extract_prompt(schema_file, data_format.upper(), schema_hash)
+
+@functools.lru_cache(maxsize=None)
+def _cached_extract_prompt(schema_file, data_format, schema_hash):
+    return create_extract_prompt(read_schema(schema_file), data_format)
+
+def __getattr__(name):
+    # The module-level prompts and schemas of earlier versions, built lazily on access
+    if name in ("json_extract_prompt", "yaml_extract_prompt"):
+        return get_extract_prompt(name.split("_")[0])
+    if name in ("json_schema", "yaml_schema"):
+        return read_schema(SCHEMA_FILES[name.split("_")[0]])
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+class ChunkMessages(list):
+    """A chat message list built by a PromptTemplate, which remembers its chunk."""
+
+    def __init__(self, messages, template, chunk):
+        super().__init__(messages)
+        self.template = template
+        self.chunk = chunk
+
+    def render(self):
+        """Renders the chat template, without running it again."""
+        return self.template.render(self.chunk)
+
+class PromptTemplate:
+    """
+    The chat-templated extraction prompt of a run, rendered and tokenized once.
+
+    The chat template is rendered once with a placeholder chunk and split around
+    it, into the static text before and after the chunk. Their token ids are
+    computed up front, so that rendering a chunk's prompt is a concatenation and
+    counting its tokens only tokenizes the chunk. Counts are exact unless the
+    first or last characters of a chunk merge into one token with the template
+    text around them, which the "..." delimiters make unlikely.
+
+    Chat templates that modify message contents (so that the placeholder is not
+    found) are rendered and tokenized in full for every chunk instead.
+
+    Attributes
+    ----------
+    prefix_ids : List[int]
+        token ids of the rendered prompt before the chunk (None if not splittable)
+    suffix_ids : List[int]
+        token ids of the rendered prompt after the chunk (None if not splittable)
+    static_tokens : int
+        tokens of the rendered prompt without its chunk
+
+    Methods
+    -------
+    messages(chunk: str)
+        Returns the chat message list of a chunk.
+    render(chunk: str)
+        Returns the chat-templated prompt of a chunk.
+    count_tokens(chunk: str)
+        Counts the tokens of the chat-templated prompt of a chunk.
+    """
+
+    placeholder = "\x00CHUNK\x00"
+
+    def __init__(self, tokenizer, extract_prompt, data_format, layout="inline"):
+        self.tokenizer = tokenizer
+        self.extract_prompt = extract_prompt
+        self.data_format = data_format
+        self.layout = layout
+
+        rendered = self._apply_chat_template(self.placeholder)
+        if rendered.count(self.placeholder) == 1:
+            self.prefix, self.suffix = rendered.split(self.placeholder)
+            self.prefix_ids = self._token_ids(self.prefix)
+            self.suffix_ids = self._token_ids(self.suffix)
+            self.static_tokens = len(self.prefix_ids) + len(self.suffix_ids)
+        else:
+            self.prefix = self.suffix = self.prefix_ids = self.suffix_ids = None
+            self.static_tokens = len(self._token_ids(self._apply_chat_template("")))
+
+    def messages(self, chunk):
+        """Returns the chat message list of a chunk."""
+        messages = create_chunk_messages(
+            self.extract_prompt, chunk, self.data_format, self.layout
+        )
+        if self.prefix is None:
+            return messages
+        return ChunkMessages(messages, self, chunk)
+
+    def render(self, chunk):
+        """Returns the chat-templated prompt of a chunk."""
+        if self.prefix is None:
+            return self._apply_chat_template(chunk)
+        return f"{self.prefix}{chunk}{self.suffix}"
+
+    def count_tokens(self, chunk):
+        """Counts the tokens of the chat-templated prompt of a chunk."""
+        if self.prefix is None:
+            return len(self._token_ids(self._apply_chat_template(chunk)))
+        return self.static_tokens + len(self._token_ids(chunk))
+
+    def _apply_chat_template(self, chunk):
+        return self.tokenizer.apply_chat_template(
+            create_chunk_messages(self.extract_prompt, chunk, self.data_format, self.layout),
+            tokenize=False,
+            add_generation_prompt=True,
+        )
+
+    def _token_ids(self, text):
+        # The template already renders any special tokens
+        return self.tokenizer(text, add_special_tokens=False)["input_ids"]
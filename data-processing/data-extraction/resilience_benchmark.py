@@ -0,0 +1,125 @@
+import os
+import sys
+import time
+import argparse
+import threading
+import concurrent.futures
+
+from tenacity import retry, wait_random_exponential, stop_after_attempt
+
+# The TGI client and the mock server live with the inference scripts
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "../../inference"))
+from tgi_client import TGIClient
+from resilience import RetryPolicy, AdaptiveLimiter, status_of
+from mock_tgi_server import serve_in_background
+
+# Compares the former blanket retries (tenacity, every error retried up to three
+# times, a fixed number of requests in flight) with the retry policy of
+# resilience.py (retryable errors only, within a retry budget, and an adaptive
+# concurrency limit) against an overloaded mock TGI server: it generates
+# max_concurrency requests at once, queues up to max_requests, and answers
+# further requests with a 429. Counts the requests sent, turned away and failed.
+# Usage: python resilience_benchmark.py --requests 500 --concurrency 64 --max_requests 16
+
+
+class CountingClient:
+    """Counts the requests sent through a TGIClient, and the responses by status."""
+
+    def __init__(self, client):
+        self.client = client
+        self.lock = threading.Lock()
+        self.sent = 0
+        self.rejected = 0
+
+    def generate(self, inputs, parameters):
+        with self.lock:
+            self.sent += 1
+        try:
+            return self.client.generate(inputs, parameters)
+        except Exception as exc:
+            if status_of(exc) in (429, 503):
+                with self.lock:
+                    self.rejected += 1
+            raise
+
+
+def run(mode, base_url, args):
+    parameters = {"max_new_tokens": args.max_new_tokens, "details": True}
+    limiter = None
+    with TGIClient(base_url, pool_size=args.concurrency) as tgi_client:
+        client = CountingClient(tgi_client)
+        if mode == "tenacity":
+            send = retry(
+                wait=wait_random_exponential(multiplier=args.base_wait, max=args.max_wait),
+                stop=stop_after_attempt(3),
+            )(client.generate)
+        else:
+            limiter = AdaptiveLimiter(
+                initial_limit=max(1, args.concurrency // 4), max_limit=args.concurrency
+            )
+            policy = RetryPolicy(
+                max_attempts=3, base_wait=args.base_wait, max_wait=args.max_wait, limiter=limiter
+            )
+
+            def send(inputs, parameters):
+                return policy.call(client.generate, inputs, parameters)
+
+        def concurrency_limit():
+            return limiter.current if limiter else args.concurrency
+
+        succeeded = failed = 0
+        start_time = time.perf_counter()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            pending = iter(range(args.requests))
+            futures = set()
+            while True:
+                while len(futures) < concurrency_limit():
+                    if next(pending, None) is None:
+                        break
+                    futures.add(executor.submit(send, "Extract names.", parameters))
+                if not futures:
+                    break
+                done, futures = concurrent.futures.wait(
+                    futures, return_when=concurrent.futures.FIRST_COMPLETED
+                )
+                for future in done:
+                    if future.exception() is None:
+                        succeeded += 1
+                    else:
+                        failed += 1
+        elapsed = time.perf_counter() - start_time
+
+    print(
+        f"{mode:<9} succeeded {succeeded}/{args.requests}, failed {failed}, "
+        f"sent {client.sent} ({client.sent / args.requests:.2f} per request), "
+        f"turned away {client.rejected}, {elapsed:.1f} s"
+        + (f", final limit {limiter.current}" if limiter else "")
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Measure retry amplification against an overloaded server."
+    )
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--max_concurrency", type=int, default=8)
+    parser.add_argument("--max_requests", type=int, default=16)
+    parser.add_argument("--tokens", type=int, default=20)
+    parser.add_argument("--token_latency", type=float, default=0.002)
+    parser.add_argument("--max_new_tokens", type=int, default=100)
+    # Waits scaled down from the extraction script's (1 s, up to 40 s)
+    parser.add_argument("--base_wait", type=float, default=0.1)
+    parser.add_argument("--max_wait", type=float, default=4.0)
+    args = parser.parse_args()
+
+    server, base_url = serve_in_background(
+        tokens=args.tokens,
+        token_latency=args.token_latency,
+        max_concurrency=args.max_concurrency,
+        max_requests=args.max_requests,
+    )
+    for mode in ["tenacity", "adaptive"]:
+        run(mode, base_url, args)
+
+    server.shutdown()
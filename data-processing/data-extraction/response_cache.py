@@ -0,0 +1,149 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+
+class ResponseCache:
+    """
+    A content-addressed cache for LLM responses, with two tiers.
+
+    Responses are keyed on a hash of (model, formatted prompt, generation parameters).
+    Lookups go to an in-memory LRU first, then to a SQLite file on disk, so that
+    re-running the same extraction after a crash or a schema tweak does not send
+    identical requests to the GPU server again. The disk tier is trimmed back to
+    max_disk_bytes by evicting the least recently used responses. Safe to share
+    between threads.
+
+    Attributes
+    ----------
+    hits_memory, hits_disk, misses : int
+        lookup counters, also available through stats()
+
+    Methods
+    -------
+    make_key(model: str, prompt: str, parameters: dict)
+        Returns the cache key of a request.
+    get(key: str)
+        Returns the cached response, or None.
+    put(key: str, response: str)
+        Stores a response in both tiers.
+    stats()
+        Returns the hit/miss counters and the disk usage.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_memory_entries: int = 1024,
+        max_disk_bytes: int = 512 * 1024 * 1024,
+    ):
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_bytes = max_disk_bytes
+        self.memory: "OrderedDict[str, str]" = OrderedDict()
+        self.lock = threading.Lock()
+
+        self.hits_memory = 0
+        self.hits_disk = 0
+        self.misses = 0
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS responses "
+            "(key TEXT PRIMARY KEY, response TEXT, size INTEGER, last_access REAL)"
+        )
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)"
+        )
+        self.connection.commit()
+        self.disk_bytes = self.connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()[0]
+
+    @staticmethod
+    def make_key(model: str, prompt: str, parameters: Dict[str, Any]) -> str:
+        """Returns the cache key of a request."""
+        payload = json.dumps([model, prompt, parameters], sort_keys=True)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """Returns the cached response, or None."""
+        with self.lock:
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                self.hits_memory += 1
+                return self.memory[key]
+
+            row = self.connection.execute(
+                "SELECT response FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+
+            self.connection.execute(
+                "UPDATE responses SET last_access = ? WHERE key = ?",
+                (time.time(), key),
+            )
+            self.connection.commit()
+            self.hits_disk += 1
+            self._remember(key, row[0])
+            return row[0]
+
+    def put(self, key: str, response: str):
+        """Stores a response in both tiers."""
+        size = len(response.encode())
+        with self.lock:
+            self._remember(key, response)
+
+            previous = self.connection.execute(
+                "SELECT size FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            self.connection.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)",
+                (key, response, size, time.time()),
+            )
+            self.disk_bytes += size - (previous[0] if previous else 0)
+            self._evict_disk()
+            self.connection.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        """Returns the hit/miss counters and the disk usage."""
+        lookups = self.hits_memory + self.hits_disk + self.misses
+        return {
+            "hits_memory": self.hits_memory,
+            "hits_disk": self.hits_disk,
+            "misses": self.misses,
+            "hit_rate": (self.hits_memory + self.hits_disk) / lookups if lookups else 0.0,
+            "disk_bytes": self.disk_bytes,
+        }
+
+    def close(self):
+        self.connection.close()
+
+    def _remember(self, key, response):
+        self.memory[key] = response
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_memory_entries:
+            self.memory.popitem(last=False)
+
+    def _evict_disk(self):
+        # Drop the least recently used responses until the disk tier fits again
+        while self.disk_bytes > self.max_disk_bytes:
+            rows = self.connection.execute(
+                "SELECT key, size FROM responses ORDER BY last_access LIMIT 64"
+            ).fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                if self.disk_bytes <= self.max_disk_bytes:
+                    break
+                self.connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self.memory.pop(key, None)
+                self.disk_bytes -= size
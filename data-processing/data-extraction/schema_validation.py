@@ -0,0 +1,67 @@
+from typing import Any, Dict, Optional
+
+from jsonschema.validators import validator_for
+
+# Keywords the fast path understands; any other keyword falls back to jsonschema
+FAST_PATH_OBJECT_KEYWORDS = {"type", "properties", "required", "$schema", "title", "description"}
+FAST_PATH_ARRAY_KEYWORDS = {"type", "items", "description"}
+
+
+class CompiledValidator:
+    """
+    A JSON Schema validator that is built once and reused for every response.
+
+    jsonschema.validate() checks the schema and builds a new validator on each
+    call. Here the schema is checked once, the validator class is resolved once
+    and, for the object-of-string-arrays schemas used for extraction, validation
+    is compiled down to plain isinstance checks. Calling the validator returns
+    None for valid data, or the name of the failed keyword (e.g. "required",
+    "type") so that callers can count errors by kind.
+
+    Attributes
+    ----------
+    fast_path : bool
+        whether the specialized object-of-string-arrays validator is used
+    """
+
+    def __init__(self, schema: Dict[str, Any]):
+        validator_class = validator_for(schema)
+        validator_class.check_schema(schema)
+        self.validator = validator_class(schema)
+
+        self.fast_path = _is_string_array_object(schema)
+        if self.fast_path:
+            self.required = tuple(schema.get("required", ()))
+            self.array_keys = tuple(schema["properties"])
+
+    def __call__(self, data: Any) -> Optional[str]:
+        if not self.fast_path:
+            error = next(self.validator.iter_errors(data), None)
+            return None if error is None else error.validator
+
+        if not isinstance(data, dict):
+            return "type"
+        for key in self.required:
+            if key not in data:
+                return "required"
+        for key in self.array_keys:
+            values = data.get(key)
+            if values is None and key not in data:
+                continue
+            if not isinstance(values, list):
+                return "type"
+            for value in values:
+                if not isinstance(value, str):
+                    return "type"
+        return None
+
+
+def _is_string_array_object(schema):
+    if schema.get("type") != "object" or not set(schema) <= FAST_PATH_OBJECT_KEYWORDS:
+        return False
+    for value in schema.get("properties", {}).values():
+        if not isinstance(value, dict) or not set(value) <= FAST_PATH_ARRAY_KEYWORDS:
+            return False
+        if value.get("type") != "array" or value.get("items") != {"type": "string"}:
+            return False
+    return True
@@ -0,0 +1,83 @@
+import os
+import re
+import sys
+import time
+import argparse
+import statistics
+import subprocess
+
+# Measures the cold start of the extraction script, each run in a fresh process:
+# the wall time of --help, the cumulative import times reported by
+# python -X importtime for chat_completion, and the time until the tokenizer is
+# loaded. The "eager" run imports transformers up front, as chat_completion did
+# before the tokenizer was loaded on first use. No requests are sent.
+# Usage: python startup_benchmark.py --runs 5
+
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)")
+
+
+def wall_time(command, runs):
+    """Returns the median wall time of a command over several runs, in seconds."""
+    times = []
+    for _ in range(runs):
+        start_time = time.perf_counter()
+        subprocess.run(command, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        times.append(time.perf_counter() - start_time)
+    return statistics.median(times)
+
+
+def import_times(statement):
+    """
+    Returns the cumulative import times in seconds reported by python -X importtime,
+    of the modules a statement imports (depth 0) and of the modules they import (depth 1).
+    """
+    output = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        check=True,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+    ).stderr.decode()
+
+    times = {0: {}, 1: {}}
+    for line in output.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        # Each level of nesting is indented by two more spaces
+        depth = (len(match.group(3)) - 1) // 2 if match else None
+        if depth in times:
+            times[depth][match.group(4)] = int(match.group(2)) / 1e6
+    return times
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Measure the cold start of the extraction script."
+    )
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=8, help="Slowest imports to list.")
+    args = parser.parse_args()
+
+    if not os.getenv("MODEL") or not os.getenv("API_ENDPOINT"):
+        print("Set MODEL and API_ENDPOINT (or a .env file) to load the tokenizer")
+
+    commands = {
+        "--help": [sys.executable, "tgi-data-extraction.py", "--help"],
+        "import (lazy)": [sys.executable, "-c", "import chat_completion"],
+        "import (eager)": [sys.executable, "-c", "import transformers, chat_completion"],
+        "first tokenizer": [
+            sys.executable,
+            "-c",
+            "import chat_completion; chat_completion.get_model_tokenizer()",
+        ],
+    }
+    for name, command in commands.items():
+        print(f"{name:<16} {wall_time(command, args.runs):.3f} s (median of {args.runs})")
+
+    for name, statement in [
+        ("lazy", "import chat_completion"),
+        ("eager", "import transformers, chat_completion"),
+    ]:
+        times = import_times(statement)
+        print(f"\nSlowest imports ({name}), {sum(times[0].values()):.3f} s in total:")
+        slowest = sorted({**times[1], **times[0]}.items(), key=lambda item: -item[1])
+        for module, seconds in slowest[: args.top]:
+            print(f"  {module:<28} {seconds:.3f} s")
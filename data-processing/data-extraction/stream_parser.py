@@ -0,0 +1,288 @@
+import re
+from abc import ABC, abstractmethod
+from typing import Iterable, Optional
+
+JSON_NUMBER = re.compile(r"-?(0|[1-9][0-9]*)(\.[0-9]+)?([eE][+-]?[0-9]+)?")
+JSON_LITERALS = {"t": "true", "f": "false", "n": "null"}
+HEX_DIGITS = set("0123456789abcdefABCDEF")
+
+# A top-level YAML mapping key, e.g. "names:" or "names: [a, b]"
+YAML_KEY = re.compile(r"""(?:"([^"]*)"|'([^']*)'|([^\s#'"\-?:,\[\]{}&*!|>%@`][^:#]*?))\s*:(?:\s|$)""")
+
+
+class StreamParser(ABC):
+    """
+    Follows a response as it streams in, to stop its generation as early as possible.
+
+    Text is fed in pieces (e.g. one token at a time). The status turns
+    "complete" once the top-level value has closed, and end is then the length of
+    the text up to there: anything after it would only be discarded. It turns
+    "invalid" as soon as the text can no longer parse, e.g. a response that
+    starts with prose. Complete responses still go through the full parser and
+    schema validation.
+
+    Attributes
+    ----------
+    status : str
+        "incomplete", "complete" or "invalid"
+    end : int or None
+        length of the text up to the end of the top-level value, once complete
+
+    Methods
+    -------
+    feed(text: str)
+        Follows more text and returns the status.
+    """
+
+    def __init__(self):
+        self.status = "incomplete"
+        self.end = None
+        self.length = 0
+
+    @abstractmethod
+    def feed(self, text: str) -> str:
+        """Follows more text and returns the status."""
+
+
+class JsonStreamParser(StreamParser):
+    """
+    An incremental JSON parser for a top-level object.
+
+    Follows the full JSON grammar one character at a time: structure, strings
+    and escapes, numbers and literals. The object is complete at its closing
+    brace.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.stack = []  # "{" and "[" of the open containers
+        self.expect = "value"  # value, value_or_end, key, key_or_end, colon or comma
+        self.string = None  # "key" or "value" while in a string
+        self.escape = False
+        self.hex_digits = 0  # left to read in a \uXXXX escape
+        self.scalar = ""  # number or literal being read
+
+    def feed(self, text: str) -> str:
+        for i, char in enumerate(text):
+            if self.status != "incomplete":
+                break
+            self._feed_char(char)
+            if self.status == "complete":
+                self.end = self.length + i + 1
+        self.length += len(text)
+        return self.status
+
+    def _feed_char(self, char):
+        if self.string:
+            self._feed_string_char(char)
+            return
+
+        if self.scalar:
+            if char.isalnum() or char in "+-.":
+                self.scalar += char
+                literal = JSON_LITERALS.get(self.scalar[0])
+                if literal and not literal.startswith(self.scalar):
+                    self.status = "invalid"
+                return
+            # Any other character ends the scalar, and is then parsed as structure
+            literal = JSON_LITERALS.get(self.scalar[0])
+            if self.scalar != literal and not JSON_NUMBER.fullmatch(self.scalar):
+                self.status = "invalid"
+                return
+            self.scalar = ""
+            self._end_value()
+
+        if char in " \t\n\r":
+            return
+
+        expect = self.expect
+        if expect in ("value", "value_or_end"):
+            if char == "]" and expect == "value_or_end":
+                self.stack.pop()
+                self._end_value()
+            elif not self.stack and char != "{":
+                # The schema's top level is an object
+                self.status = "invalid"
+            elif char == "{":
+                self.stack.append("{")
+                self.expect = "key_or_end"
+            elif char == "[":
+                self.stack.append("[")
+                self.expect = "value_or_end"
+            elif char == '"':
+                self.string = "value"
+            elif char == "-" or char.isdigit() or char in JSON_LITERALS:
+                self.scalar = char
+            else:
+                self.status = "invalid"
+        elif expect in ("key", "key_or_end"):
+            if char == '"':
+                self.string = "key"
+            elif char == "}" and expect == "key_or_end":
+                self.stack.pop()
+                self._end_value()
+            else:
+                self.status = "invalid"
+        elif expect == "colon":
+            if char == ":":
+                self.expect = "value"
+            else:
+                self.status = "invalid"
+        elif expect == "comma":
+            if char == ",":
+                self.expect = "key" if self.stack[-1] == "{" else "value"
+            elif char == ("}" if self.stack[-1] == "{" else "]"):
+                self.stack.pop()
+                self._end_value()
+            else:
+                self.status = "invalid"
+
+    def _feed_string_char(self, char):
+        if self.hex_digits:
+            if char not in HEX_DIGITS:
+                self.status = "invalid"
+            self.hex_digits -= 1
+        elif self.escape:
+            self.escape = False
+            if char == "u":
+                self.hex_digits = 4
+            elif char not in '"\\/bfnrt':
+                self.status = "invalid"
+        elif char == "\\":
+            self.escape = True
+        elif char == '"':
+            if self.string == "key":
+                self.expect = "colon"
+                self.string = None
+            else:
+                self.string = None
+                self._end_value()
+        elif char < " ":
+            # Control characters must be escaped in JSON strings
+            self.status = "invalid"
+
+    def _end_value(self):
+        if self.stack:
+            self.expect = "comma"
+        else:
+            self.status = "complete"
+
+
+class YamlStreamParser(StreamParser):
+    """
+    An incremental check of a top-level YAML mapping, one line at a time.
+
+    YAML has no closing bracket, so the mapping is complete when a line at
+    indentation 0 cannot continue it: a document marker (--- or ...), a code
+    fence, prose, or a key that is not in allowed_keys or was already given;
+    end is then the start of that line. Only new keys and "- " list items
+    continue it at indentation 0. A response whose first line is not a key of
+    the mapping is invalid. Indented lines (values and list items) are left to
+    the full parser.
+
+    A document that opens with "{" or "[" is in flow style instead (JSON
+    included, e.g. "{names: [Alice], organisations: [Acme]}"), and is complete
+    where its brackets balance; only the brackets and quoted scalars are
+    followed, and the rest is left to the full parser.
+    """
+
+    def __init__(self, allowed_keys: Optional[Iterable[str]] = None):
+        super().__init__()
+        self.allowed_keys = set(allowed_keys) if allowed_keys else None
+        self.keys = set()
+        self.line = ""
+        self.line_start = 0
+        self.started = False
+        self.flow = None  # "{" and "[" of the open flow collections, in flow style
+        self.quote = None  # the quote of the flow scalar being read, if quoted
+        self.escape = False
+        self.previous = "{"  # the last character in flow style
+
+    def feed(self, text: str) -> str:
+        for i, char in enumerate(text):
+            if self.status != "incomplete":
+                break
+            if self.flow is None and char in "{[" and not self.started and not self.line.strip():
+                self.flow = []
+            if self.flow is not None:
+                self._feed_flow_char(char)
+                if self.status == "complete":
+                    self.end = self.length + i + 1
+                continue
+            self.line += char
+            if char == "\n":
+                self._feed_line(self.line)
+                self.line_start += len(self.line)
+                self.line = ""
+            elif self.allowed_keys is not None:
+                self._feed_partial_line(self.line)
+        self.length += len(text)
+        return self.status
+
+    def _feed_flow_char(self, char):
+        if self.quote:
+            if self.escape:
+                self.escape = False
+            elif char == "\\" and self.quote == '"':
+                self.escape = True
+            elif char == self.quote:
+                self.quote = None
+        elif char in "'\"" and self.previous in "[{,: \t\r\n" or char == self.previous == "'":
+            # Quotes only open a scalar at its start, not in e.g. O'Brien; a ''
+            # escape in single quotes closes the scalar and reopens it
+            self.quote = char
+        elif char in "{[":
+            self.flow.append(char)
+        elif char in "}]":
+            if not self.flow or self.flow.pop() != ("{" if char == "}" else "["):
+                self.status = "invalid"
+            elif not self.flow:
+                self.status = "complete"
+        self.previous = char
+
+    def _feed_partial_line(self, line):
+        # With known keys, a line at indentation 0 that cannot become one of the
+        # keys left is decided on without waiting for the end of the line. YAML
+        # allows spaces between a key and its colon, so "names " may still become
+        # "names :"
+        if line[0] in " \t#-.'\"" or ":" in line:
+            return
+        name = line.rstrip(" \t")
+        if not any(
+            key.startswith(line) or key == name for key in self.allowed_keys - self.keys
+        ):
+            self._end_mapping()
+
+    def _feed_line(self, line):
+        content = line.rstrip()
+        if not content or content.lstrip().startswith("#") or line[0] in " \t":
+            return
+
+        if content == "---" and not self.started:
+            return  # the document start marker
+        if self.started and (content == "-" or content.startswith("- ")):
+            return  # a list item of the last key, which YAML allows at indentation 0
+        key = YAML_KEY.match(content)
+        key = key and next(group for group in key.groups() if group is not None).strip()
+        if key and (self.allowed_keys is None or key in self.allowed_keys) and key not in self.keys:
+            self.keys.add(key)
+            self.started = True
+        else:
+            self._end_mapping()
+
+    def _end_mapping(self):
+        # The line cannot continue the mapping: it ended before this line, if it started
+        if self.started:
+            self.status = "complete"
+            self.end = self.line_start
+        else:
+            self.status = "invalid"
+
+
+def create_stream_parser(data_format: str, schema: Optional[dict] = None) -> StreamParser:
+    """Returns a stream parser for a response in JSON or YAML format."""
+    if data_format.lower() == "json":
+        return JsonStreamParser()
+    if data_format.lower() == "yaml":
+        return YamlStreamParser((schema or {}).get("properties"))
+    raise ValueError("Unsupported data format. Please use 'JSON' or 'YAML'.")
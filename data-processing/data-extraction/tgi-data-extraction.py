@@ -1,14 +1,41 @@
+import os
+import time
 import yaml
 import json
+import asyncio
+import itertools
 
 from tqdm import tqdm
 
+import contextlib
 import concurrent.futures
 
 from arg_parser import parse_arguments
-from utils import read_text_file, check_output_file_format
-from chat_completion import chat_completion_request_runpod
-from prompts import json_extract_prompt, yaml_extract_prompt
+from utils import iter_text_file, check_output_file_format
+from chat_completion import (
+    get_model_tokenizer,
+    parameters,
+    chat_completion_request_runpod,
+    chat_completion_request_runpod_async,
+    chat_completion_request_micro_batched,
+    create_async_client,
+    create_micro_batcher,
+    enable_response_cache,
+    enable_constrained_decoding,
+    enable_adaptive_concurrency,
+    print_token_usage,
+    print_resilience_stats,
+)
+from batch import ExtractionDocument, document_names, resolve_input_files, write_batch_summary
+from chunking import (
+    iter_sentences,
+    iter_character_chunks,
+    pack_chunks,
+    model_context_window,
+    shared_prefix_length,
+    CHUNK_TOKEN_MARGIN,
+)
+from prompts import get_extract_prompt, PromptTemplate
 from json_files.json_validation_aggregation import JsonAggregator
 from yaml_files.yaml_validation_aggregation import YamlAggregator
 
@@ -20,97 +47,362 @@ args.output_file_name = check_output_file_format(
     args.output_file_name, args.output_format
 )
 
-# Read the text file
-text = read_text_file(f"./input_files/{args.input_file_name}")
+# Cache deterministic responses, so re-runs only send requests that are not cached yet
+response_cache = (
+    None
+    if args.no_cache
+    else enable_response_cache(
+        args.cache_file, max_disk_bytes=args.cache_max_mb * 1024 * 1024
+    )
+)
 
 # # Define variables
 block_size: int = args.chunk_length
 
+# Loaded here rather than at import, so that --help and argument errors are instant
+tokenizer = get_model_tokenizer()
+
 if args.output_format == "json":
-    prompt = f"{json_extract_prompt}"
+    schema_file = "./json_files/json_schema.json"
+    prompt = get_extract_prompt("json", schema_file)
+
+    # Initialize the JsonAggregator class, once per document
+    def create_aggregator():
+        return JsonAggregator(schema_file)
 
-    # Initialize the JsonAggregator class
-    aggregator = JsonAggregator("./json_files/json_schema.json")
 elif args.output_format == "yaml":
-    prompt = f"{yaml_extract_prompt}"
+    schema_file = "./yaml_files/yaml_schema.yaml"
+    prompt = get_extract_prompt("yaml", schema_file)
+
+    # Initialize the YamlAggregator class, once per document
+    def create_aggregator():
+        return YamlAggregator(schema_file)
+
+# Constrain responses to the schema, so that fewer chunks are generated for nothing
+if args.constrained_decoding != "off":
+    enable_constrained_decoding(
+        schema_file, args.constrained_decoding, args.output_format
+    )
+
+
+# Batch mode extracts every file of a directory or glob, otherwise one input file
+if args.input_batch:
+    input_files = resolve_input_files(args.input_batch)
+    if not input_files:
+        raise SystemExit(f"No input files match '{args.input_batch}'")
+else:
+    input_files = [f"./input_files/{args.input_file_name}"]
+
+# In batch mode, documents are named by their path relative to the input
+# directory, so that a/report.txt and b/report.txt get separate outputs
+names = document_names(input_files) if args.input_batch else [None]
 
-    # Initialize the YamlAggregator class
-    aggregator = YamlAggregator("./yaml_files/yaml_schema.yaml")
+# Journal completed chunks, so a restarted run only sends the missing ones
+documents = [
+    ExtractionDocument(
+        input_file,
+        create_aggregator,
+        args.checkpoint_dir if args.checkpoint else None,
+        name,
+    )
+    for input_file, name in zip(input_files, names)
+]
+
+
+# Adapt the requests in flight to the server's load, up to max_in_flight
+limiter = (
+    None
+    if args.no_adaptive_concurrency or not args.batching
+    else enable_adaptive_concurrency(args.max_in_flight)
+)
+
+
+def concurrency_limit():
+    return min(args.max_in_flight, limiter.current) if limiter else args.max_in_flight
 
 
 # Define a function to send a request
-def send_request(message):
-    chat_response = chat_completion_request_runpod([message])
-    return chat_response, message
+def send_request(messages):
+    return chat_completion_request_runpod(messages)
+
+
+# Define a coroutine that keeps up to max_in_flight requests outstanding
+async def send_requests_async(message_lists, max_in_flight):
+    request_counter = 0
+    pending_messages = iter(message_lists)
+    exhausted = False
+
+    async with create_async_client(max_in_flight) as async_client:
+
+        async def worker(index):
+            nonlocal request_counter, exhausted
+            while True:
+                # Workers beyond the adaptive concurrency limit wait for it to grow
+                while not exhausted and index >= concurrency_limit():
+                    await asyncio.sleep(0.05)
+
+                # The workers share one iterator, so each message list is sent exactly once
+                item = next(pending_messages, None)
+                if item is None:
+                    exhausted = True
+                    break
+                document, chunk_index, messages = item
+
+                try:
+                    chat_response = await chat_completion_request_runpod_async(
+                        messages, async_client
+                    )
+                except Exception as exc:
+                    handle_request_error(document, messages, exc)
+                else:
+                    request_counter += 1
+
+                    # Validate and aggregate as soon as each result streams in
+                    handle_chat_response(document, chunk_index, messages, chat_response)
+
+        await asyncio.gather(*(worker(index) for index in range(max_in_flight)))
+
+    return request_counter
 
 
-# Define a function to process the chat response
-def process_chat_response(chat_response, output_format):
+# Define a function to process the chat response, returns the data if it is valid
+def process_chat_response(chat_response, output_format, aggregator):
     try:
         chat_response_dict = (
             json.loads(chat_response)
             if output_format == "json"
             else yaml.safe_load(chat_response.strip())
         )
-        aggregator.aggregate_json(
-            chat_response_dict
-        ) if output_format == "json" else aggregator.aggregate_yaml(chat_response_dict)
+        is_valid = aggregator.aggregate(chat_response_dict)
+        return chat_response_dict if is_valid else None
     except (json.JSONDecodeError, yaml.YAMLError):
-        print(f"Invalid {output_format.upper()} in chat response: {chat_response}")
+        aggregator.errors[f"invalid_{output_format}"] += 1
         aggregator.fail += 1
+        return None
 
 
-# Create messages
-message_lists = [
-    [
-        {
-            "role": "user",
-            "content": f"""{prompt}\n\n[TEXT_START]\n\n...{text[i : i + block_size]}...\n\n[TEXT_END]\n\nNow, answer immediately and only in {args.output_format} format.""",
-        }
-    ]
-    for i in range(0, len(text), block_size)
-]
+# Define a function to count a request that failed, after any retries
+def handle_request_error(document, messages, exc):
+    print(f"{messages[0]} generated an exception: {exc}")
+    document.aggregator.errors["request_failed"] += 1
+    document.aggregator.fail += 1
+
+
+# Define a function to process the chat response of a chunk and journal it
+def handle_chat_response(document, chunk_index, messages, chat_response):
+    data = process_chat_response(chat_response, args.output_format, document.aggregator)
+    if document.journal and data is not None:
+        document.journal.record(chunk_index, messages, data)
+
+
+# Render and tokenize the static part of the prompt once, for every chunk
+try:
+    prompt_template = PromptTemplate(
+        tokenizer, prompt, args.output_format, args.prompt_layout
+    )
+except Exception as exc:
+    # Some chat templates reject system messages; fall back to a single user message
+    if args.prompt_layout != "shared_prefix":
+        raise
+    print(f"The chat template does not accept a system message ({exc}), using the inline prompt layout")
+    args.prompt_layout = "inline"
+    prompt_template = PromptTemplate(tokenizer, prompt, args.output_format, "inline")
+
+
+# Define a function to wrap a chunk of text into a chat message list
+def create_messages(chunk):
+    return prompt_template.messages(chunk)
+
 
-if args.batching:
+# Leading prompt tokens identical for every chunk, which servers with prefix
+# caching (e.g. vLLM --enable-prefix-caching) prefill only once
+print(
+    f"Shared prompt prefix ({args.prompt_layout} layout): {shared_prefix_length(tokenizer, create_messages('A'), create_messages('B'))} tokens"
+)
+
+
+if args.chunking == "tokens":
+    # Token budget per chunk: whatever the context window leaves after the
+    # templated prompt (tokenized once, without a chunk), the generated tokens and
+    # a small margin for tokens merging across the chunk boundaries
+    context_window = args.context_window or model_context_window(tokenizer)
+    prompt_tokens = prompt_template.static_tokens
+    chunk_tokens = (
+        context_window - prompt_tokens - parameters["max_new_tokens"] - CHUNK_TOKEN_MARGIN
+    )
+    if args.chunk_tokens:
+        chunk_tokens = min(chunk_tokens, args.chunk_tokens)
+    if chunk_tokens <= args.chunk_overlap:
+        raise SystemExit(
+            f"No room for text: the context window ({context_window}) minus prompt tokens ({prompt_tokens}) and max_new_tokens ({parameters['max_new_tokens']}) leaves {chunk_tokens} tokens per chunk."
+        )
+    print(
+        f"Context window: {context_window}, prompt tokens: {prompt_tokens}, chunk tokens: {chunk_tokens}"
+    )
+
+
+# Define a generator of a document's chunks, reading the file lazily one block at a time
+def iter_chunks(input_file):
+    text_blocks = iter_text_file(input_file, use_mmap=args.mmap)
+    if args.chunking == "tokens":
+        return pack_chunks(
+            iter_sentences(text_blocks), tokenizer, chunk_tokens, args.chunk_overlap
+        )
+    return iter_character_chunks(text_blocks, block_size)
+
+
+# Define a generator that builds each chunk's messages just before it is dispatched
+def iter_message_lists(document):
+    resumed = 0
+    for chunk_index, chunk in enumerate(iter_chunks(document.input_file)):
+        messages = create_messages(chunk)
+        document.chunks += 1
+
+        # Merge the outputs of chunks completed by earlier runs, and skip sending them
+        journal = document.journal
+        if journal and journal.is_completed(chunk_index, messages):
+            document.aggregator.aggregate(journal.completed[chunk_index])
+            resumed += 1
+            continue
+
+        yield document, chunk_index, messages
+
+    if document.journal:
+        print(f"Resumed {resumed} completed chunks from {document.journal.journal_file}")
+
+
+# Create messages, lazily. The chunks of all documents share one work queue, so
+# the next document's chunks are dispatched while the last requests of the
+# previous one are still in flight.
+message_lists = itertools.chain.from_iterable(
+    iter_message_lists(document) for document in documents
+)
+
+start_time = time.perf_counter()
+
+if args.batching and args.engine == "asyncio":
+    request_counter = asyncio.run(
+        send_requests_async(message_lists, args.max_in_flight)
+    )
+
+    print(f"Total number of requests: {request_counter}")
+
+elif args.batching:
     # Initialize a counter
     request_counter = 0
 
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        # Send the requests in parallel
-        future_to_chat_response = {
-            executor.submit(send_request, messages[0]): messages for messages in message_lists
-        }
-
-        for future in concurrent.futures.as_completed(future_to_chat_response):
-            messages = future_to_chat_response[future]
-            try:
-                chat_response, _ = future.result()
-            except Exception as exc:
-                print(f"{messages[0]} generated an exception: {exc}")
-            else:
-                # Increment the counter
-                request_counter += 1
-
-                # Process the chat response
-                process_chat_response(chat_response, args.output_format)
+    with contextlib.ExitStack() as stack:
+        if args.engine == "microbatch":
+            # Prompts are grouped into batches of up to micro_batch_size, each
+            # dispatched at once; every chunk still gets its own future
+            batcher = stack.enter_context(
+                create_micro_batcher(
+                    args.micro_batch_size,
+                    args.micro_batch_wait_ms,
+                    args.max_in_flight,
+                    args.batch_api,
+                )
+            )
+
+            def submit(messages):
+                return chat_completion_request_micro_batched(messages, batcher)
+
+        else:
+            # One thread per request in flight, as many as the asyncio engine's workers
+            executor = stack.enter_context(
+                concurrent.futures.ThreadPoolExecutor(max_workers=args.max_in_flight)
+            )
+
+            def submit(messages):
+                return executor.submit(send_request, messages)
+
+        # Send the requests in parallel, submitting at most max_in_flight (or the
+        # adaptive concurrency limit) at a time so that only the prompts of
+        # outstanding requests are in memory
+        future_to_chat_response = {}
+        pending_messages = iter(message_lists)
+
+        while True:
+            while len(future_to_chat_response) < concurrency_limit():
+                item = next(pending_messages, None)
+                if item is None:
+                    break
+                future_to_chat_response[submit(item[2])] = item
+
+            if not future_to_chat_response:
+                break
+
+            done, _ = concurrent.futures.wait(
+                future_to_chat_response, return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            for future in done:
+                document, chunk_index, messages = future_to_chat_response.pop(future)
+                try:
+                    chat_response = future.result()
+                except Exception as exc:
+                    handle_request_error(document, messages, exc)
+                else:
+                    # Increment the counter
+                    request_counter += 1
+
+                    # Process the chat response
+                    handle_chat_response(document, chunk_index, messages, chat_response)
 
     print(f"Total number of requests: {request_counter}")
+    if args.engine == "microbatch" and batcher.batches:
+        print(
+            f"Micro-batches: {batcher.batches}, {batcher.prompts / batcher.batches:.1f} prompts per batch"
+        )
 
 else:
-    for messages in tqdm(message_lists):
-        chat_response = chat_completion_request_runpod(messages)
+    for document, chunk_index, messages in tqdm(message_lists):
+        try:
+            chat_response = chat_completion_request_runpod(messages)
+        except Exception as exc:
+            handle_request_error(document, messages, exc)
+            continue
 
         # Process the chat response
-        process_chat_response(chat_response, args.output_format)
+        handle_chat_response(document, chunk_index, messages, chat_response)
 
-# Write the aggregated data to a file
-aggregator.write_aggregated_data(f"./outputs/{args.output_file_name}")
-if not aggregator.success:
-    print("All validations failed")
+# Exact prompt and completion token counts (cached responses are not counted)
+print_token_usage(time.perf_counter() - start_time)
+print_resilience_stats()
+
+# Write the aggregated data to a file, one per document in batch mode
+if args.input_batch:
+    output_dir = f"./outputs/{os.path.splitext(args.output_file_name)[0]}"
+    output_files = [
+        f"{output_dir}/{document.name}.{args.output_format}" for document in documents
+    ]
+    # Outputs of files in subdirectories go to the same subdirectories
+    for output_file in output_files:
+        os.makedirs(os.path.dirname(output_file), exist_ok=True)
 else:
-    total_attempts = aggregator.success + aggregator.fail
-    if total_attempts > 0:
-        error_rate = aggregator.fail / total_attempts
-        print(f"Error rate is {error_rate}")
+    output_files = [f"./outputs/{args.output_file_name}"]
+
+for document, output_file in zip(documents, output_files):
+    aggregator = document.aggregator
+    aggregator.write_aggregated_data(output_file)
+    if not aggregator.success:
+        print(f"All validations failed for {document.input_file}")
     else:
-        print("No attempts were made, so the error rate cannot be calculated.")
+        error_rate = document.error_rate()
+        if error_rate is not None:
+            print(f"Error rate is {error_rate}")
+        else:
+            print("No attempts were made, so the error rate cannot be calculated.")
+    if aggregator.errors:
+        print(f"Errors by kind: {dict(aggregator.errors.most_common())}")
+
+    if document.journal:
+        document.journal.close()
+
+if args.input_batch:
+    write_batch_summary(documents, f"{output_dir}/summary.json")
+
+if response_cache:
+    cache_stats = response_cache.stats()
+    print(
+        f"Response cache: {cache_stats['hits_memory'] + cache_stats['hits_disk']} hits, {cache_stats['misses']} misses, hit rate {cache_stats['hit_rate']:.2f}"
+    )
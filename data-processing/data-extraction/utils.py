@@ -1,5 +1,8 @@
 from termcolor import colored
 import os
+import io
+import mmap
+import codecs
 
 
 def pretty_print_conversation(messages):
@@ -51,6 +54,41 @@ def read_text_file(text_file):
     return text
 
 
+def iter_text_file(text_file, block_size=1024 * 1024, use_mmap=False):
+    """Yields the text of a file in blocks of about block_size characters.
+
+    Unlike read_text_file, only one block is held in memory at a time. With
+    use_mmap the file is memory-mapped and decoded incrementally, which avoids
+    copying it through Python's file buffers.
+    """
+    if not use_mmap:
+        with open(text_file, "r") as file:
+            for block in iter(lambda: file.read(block_size), ""):
+                yield block
+        return
+
+    # Decode UTF-8 and translate newlines incrementally, as open() would
+    decoder = io.IncrementalNewlineDecoder(
+        codecs.getincrementaldecoder("utf-8")(), translate=True
+    )
+    with open(text_file, "rb") as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            return
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            for start in range(0, len(mapped), block_size):
+                block = decoder.decode(mapped[start : start + block_size])
+                # Drop the pages of decoded blocks, otherwise they count towards RSS
+                if hasattr(mmap, "MADV_DONTNEED") and start % mmap.PAGESIZE == 0:
+                    mapped.madvise(
+                        mmap.MADV_DONTNEED, start, min(block_size, len(mapped) - start)
+                    )
+                if block:
+                    yield block
+            block = decoder.decode(b"", final=True)
+            if block:
+                yield block
+
+
 def check_output_file_format(output_file_name, output_format):
     # Check if output_file has an extension
     _, file_extension = os.path.splitext(output_file_name)
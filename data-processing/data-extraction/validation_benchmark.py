@@ -0,0 +1,81 @@
+import json
+import time
+import random
+import argparse
+
+import jsonschema
+from jsonschema.validators import validator_for
+
+from schema_validation import CompiledValidator
+
+# Times schema validation of synthetic chat responses: jsonschema.validate() per
+# response (the previous aggregators), a validator compiled once, and the
+# specialized fast path for object-of-string-arrays schemas.
+# Usage: python validation_benchmark.py --responses 100000
+
+
+def make_responses(schema, count, invalid_ratio, seed=0):
+    rng = random.Random(seed)
+    keys = list(schema["properties"])
+    responses = []
+    for i in range(count):
+        response = {
+            key: [f"{key} {i} {j}" for j in range(rng.randint(0, 8))] for key in keys
+        }
+        if rng.random() < invalid_ratio:
+            # Mix in the failures seen in practice: a missing key or a wrong type
+            if rng.random() < 0.5:
+                del response[rng.choice(keys)]
+            else:
+                response[rng.choice(keys)] = "not a list"
+        responses.append(response)
+    return responses
+
+
+def run_validate(schema, responses):
+    valid = 0
+    for response in responses:
+        try:
+            jsonschema.validate(instance=response, schema=schema)
+            valid += 1
+        except jsonschema.exceptions.ValidationError:
+            pass
+    return valid
+
+
+def run_compiled(schema, responses):
+    validator = validator_for(schema)(schema)
+    return sum(1 for response in responses if validator.is_valid(response))
+
+
+def run_fast_path(schema, responses):
+    validator = CompiledValidator(schema)
+    return sum(1 for response in responses if validator(response) is None)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Measure the throughput of per-call, compiled and fast-path schema validation."
+    )
+    parser.add_argument("--responses", type=int, default=100_000)
+    parser.add_argument("--invalid_ratio", type=float, default=0.1)
+    parser.add_argument(
+        "--schema_file", type=str, default="./json_files/json_schema.json"
+    )
+    args = parser.parse_args()
+
+    with open(args.schema_file, "r") as file:
+        schema = json.load(file)
+    responses = make_responses(schema, args.responses, args.invalid_ratio)
+
+    for name, run in [
+        ("validate", run_validate),
+        ("compiled", run_compiled),
+        ("fast-path", run_fast_path),
+    ]:
+        start_time = time.perf_counter()
+        valid = run(schema, responses)
+        elapsed = time.perf_counter() - start_time
+        print(
+            f"{name:<10} {valid} valid of {len(responses)} in {elapsed:.2f} seconds, {len(responses) / elapsed:.0f} responses/s"
+        )
@@ -0,0 +1,194 @@
+from typing import List, Optional
+
+# Template constructs through which a message's rendering may depend on the
+# other messages (its position, an earlier message, state carried across the
+# loop), so that the new messages cannot be rendered on their own
+POSITION_DEPENDENT = ("loop.", "messages[", "messages|", "namespace(")
+# Those that only depend on the position, which stand-ins of the earlier
+# messages reproduce
+POSITION_ONLY = ("loop.index", "loop.revindex", "loop.first", "loop.last", "loop.length")
+
+
+class IncrementalChatRenderer:
+    """
+    Renders (and optionally tokenizes) a growing conversation with the chat template, one turn at a time.
+
+    Multi-turn clients send the whole history on every turn, so
+    apply_chat_template would re-render it, large function metadata included,
+    each time. This keeps the rendered text of the messages seen so far, and
+    renders only the messages appended since, so that the work per turn does
+    not grow with the length of the conversation. The new messages are
+    rendered after a single stand-in of the last earlier message (same role,
+    empty content), whose rendering, along with any text the template renders
+    once up front (e.g. the BOS token), is cached per role and stripped from
+    the front: one template render per turn, as for a full render.
+
+    That holds when each message renders the same whatever comes before it.
+    Templates that look at positions (loop.index0, loop.first, ...) instead
+    render the new messages after stand-ins of the earlier ones (same roles,
+    empty content), which costs two renders of the whole (stubbed)
+    conversation per turn. Templates that look at other messages
+    (messages[0], loop.previtem, a namespace carried across the loop) are
+    rendered in full.
+
+    Each render costs a fixed overhead whatever its length, so this only pays
+    off over long conversations with large messages, or when tokenizing (see
+    chat_renderer_benchmark.py); a few turns are cheaper rendered in full.
+
+    With verify_turns, the first incremental renders are also compared against
+    a full render (a debugging aid, which costs a full render each); on any
+    difference the renderer switches from the first method to the second,
+    then to full rendering for good. When the messages no longer start with
+    the cached ones (e.g. a new conversation), the cache starts over.
+
+    With tokenize, the new text is tokenized on its own and appended to the
+    cached token ids, for callers that need the ids (the verification then
+    also compares them with the ids of the full prompt).
+
+    Attributes
+    ----------
+    mode : str
+        "suffix" (after one stand-in), "stubs" (after stand-ins of every message) or "full"
+    token_ids : List[int] or None
+        token ids of the last prompt rendered, when tokenizing
+    full_renders : int
+        renders of a whole conversation
+    incremental_renders : int
+        renders of only the new messages
+
+    Methods
+    -------
+    render(messages: List[dict], add_generation_prompt: bool)
+        Returns the prompt of a conversation, as apply_chat_template(tokenize=False) would.
+    """
+
+    def __init__(self, tokenizer, tokenize: bool = False, verify_turns: int = 0):
+        self.tokenizer = tokenizer
+        self.tokenize = tokenize
+        self.verify_turns = verify_turns
+        self.mode = self._mode(getattr(tokenizer, "chat_template", None))
+        self.turns_to_verify = verify_turns
+        self.messages = []  # copies of the messages rendered so far
+        self.text = ""  # their rendering, without the generation prompt
+        self.ids = []  # its token ids, when tokenizing
+        self.bases = {}  # rendering of the stand-in of a message, by role, in suffix mode
+        # Text appended by add_generation_prompt: None until known, False if not separable
+        self.generation_prompt = None
+        self.token_ids = None
+        self.full_renders = 0
+        self.incremental_renders = 0
+
+    def render(self, messages: List[dict], add_generation_prompt: bool = True) -> str:
+        """Returns the prompt of a conversation, as apply_chat_template(tokenize=False) would."""
+        while self.mode != "full" and self._extends_cache(messages):
+            new_messages = messages[len(self.messages) :]
+            try:
+                rendered = self._render_new(new_messages, add_generation_prompt)
+            except Exception:
+                rendered = None
+            if rendered is None:
+                self._downgrade()
+                continue
+
+            new_text, generation_prompt = rendered
+            text = self.text + new_text
+            ids = self.ids + self._encode(new_text) if self.tokenize else []
+            prompt_ids = ids + self._encode(generation_prompt) if self.tokenize else None
+
+            if self.turns_to_verify > 0:
+                full_prompt = self._apply(messages, add_generation_prompt)
+                if full_prompt != text + generation_prompt or (
+                    self.tokenize and self._encode(full_prompt) != prompt_ids
+                ):
+                    self._downgrade()
+                    continue
+                self.turns_to_verify -= 1
+
+            self.incremental_renders += 1
+            self.messages += [dict(message) for message in new_messages]
+            self.text, self.ids, self.token_ids = text, ids, prompt_ids
+            return text + generation_prompt
+
+        return self._render_full(messages, add_generation_prompt)
+
+    def _render_new(self, new_messages, add_generation_prompt):
+        # Returns the text of the new messages and the generation prompt, or None.
+        # Stand-ins for the earlier messages, so that only the new ones are templated
+        earlier = self.messages[-1:] if self.mode == "suffix" else self.messages
+        stubs = [dict(message, content="") for message in earlier]
+        if self.mode == "suffix":
+            role = stubs[0]["role"]
+            if role not in self.bases:
+                self.bases[role] = self._apply(stubs, False)
+            base = self.bases[role]
+        else:
+            base = self._apply(stubs, False)
+        prompt = self._apply(stubs + new_messages, add_generation_prompt)
+        new_text = self._strip_generation_prompt(prompt, add_generation_prompt)
+        if new_text is None or not new_text.startswith(base):
+            return None
+        return new_text[len(base) :], prompt[len(new_text) :]
+
+    @staticmethod
+    def _mode(template):
+        # The cheapest method that renders the template's messages right
+        if not isinstance(template, str):
+            return "full"
+        if not any(marker in template for marker in POSITION_DEPENDENT):
+            return "suffix"
+        for marker in POSITION_ONLY:
+            template = template.replace(marker, "")
+        return "full" if any(marker in template for marker in POSITION_DEPENDENT) else "stubs"
+
+    def _downgrade(self):
+        # suffix -> stubs -> full; the next method is verified from scratch
+        self.mode = "stubs" if self.mode == "suffix" else "full"
+        self.turns_to_verify = self.verify_turns
+
+    def _extends_cache(self, messages):
+        # Whether the messages start with the ones already rendered; otherwise the cache starts over
+        if len(messages) >= len(self.messages) and all(
+            cached == message for cached, message in zip(self.messages, messages)
+        ):
+            return bool(self.messages)
+        return False
+
+    def _render_full(self, messages, add_generation_prompt):
+        self.full_renders += 1
+        prompt = self._apply(messages, add_generation_prompt)
+        self.token_ids = self._encode(prompt) if self.tokenize else None
+        if self.mode != "full":
+            text = self._strip_generation_prompt(prompt, add_generation_prompt)
+            if text is None:
+                text = self._apply(messages, False)
+            self.messages = [dict(message) for message in messages]
+            self.text = text
+            self.ids = self._encode(self.text) if self.tokenize else []
+        return prompt
+
+    def _strip_generation_prompt(self, prompt, add_generation_prompt):
+        # The prompt without the generation prompt, which the template appends
+        # after the messages whatever they are; None if it does not end with it
+        if not add_generation_prompt:
+            return prompt
+        if self.generation_prompt is None:
+            stub = [{"role": "user", "content": ""}]
+            try:
+                without, with_prompt = self._apply(stub, False), self._apply(stub, True)
+            except Exception:
+                without, with_prompt = None, ""
+            self.generation_prompt = (
+                with_prompt[len(without) :] if without is not None and with_prompt.startswith(without) else False
+            )
+        if self.generation_prompt is False or not prompt.endswith(self.generation_prompt):
+            return None
+        return prompt[: len(prompt) - len(self.generation_prompt)]
+
+    def _apply(self, messages, add_generation_prompt):
+        return self.tokenizer.apply_chat_template(
+            messages, tokenize=False, add_generation_prompt=add_generation_prompt
+        )
+
+    def _encode(self, text) -> Optional[List[int]]:
+        # The chat template already holds the special tokens (e.g. the BOS token)
+        return self.tokenizer(text, add_special_tokens=False)["input_ids"] if text else []
@@ -0,0 +1,81 @@
+import os
+import json
+import time
+import argparse
+
+from dotenv import load_dotenv
+
+from tokenizer_registry import get_tokenizer
+from chat_renderer import IncrementalChatRenderer
+
+# Compares preparing the prompt of every turn of a tool-using conversation with
+# apply_chat_template over the whole history against the IncrementalChatRenderer,
+# which only renders the messages appended since the last turn (and with
+# --tokenize, also tokenizes the prompts, e.g. to count prompt tokens). The
+# function metadata holds tools.json repeated --tool_copies times, as a large
+# tool catalog would. --stubs renders as for templates that depend on message
+# positions. No requests are sent.
+# Usage: python chat_renderer_benchmark.py --turns 20 --tool_copies 50
+
+TOOL_CALL = '{"name": "get_current_weather", "arguments": {"city": "London"}}'
+TOOL_RESULT = '{"temperature": "15 C", "condition": "Cloudy"}'
+
+
+def conversations(tools, turns):
+    """Yields the history sent at each turn of one conversation."""
+    messages = [
+        {"role": "function_metadata", "content": json.dumps(tools, indent=4)},
+        {"role": "user", "content": "What is the weather in London, and what should I wear?"},
+    ]
+    for _ in range(turns):
+        yield messages
+        messages = messages + [
+            {"role": "function_call", "content": TOOL_CALL},
+            {"role": "function_response", "content": TOOL_RESULT},
+        ]
+
+
+def full_render(tokenizer, messages, tokenize):
+    prompt = tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+    return prompt, tokenizer(prompt, add_special_tokens=False)["input_ids"] if tokenize else None
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Measure multi-turn prompt preparation.")
+    parser.add_argument("--model", type=str, default=os.getenv("MODEL"))
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument("--tool_copies", type=int, default=50)
+    parser.add_argument("--tokenize", action="store_true")
+    parser.add_argument("--stubs", action="store_true")
+    args = parser.parse_args()
+
+    tokenizer = get_tokenizer(args.model)
+    with open("./functions/tools.json", "r") as file:
+        tools = json.load(file) * args.tool_copies
+
+    start_time = time.perf_counter()
+    expected = [
+        full_render(tokenizer, messages, args.tokenize)
+        for messages in conversations(tools, args.turns)
+    ]
+    full_time = time.perf_counter() - start_time
+
+    renderer = IncrementalChatRenderer(tokenizer, tokenize=args.tokenize)
+    if args.stubs:
+        renderer.mode = "stubs"
+    start_time = time.perf_counter()
+    rendered = [
+        (renderer.render(messages), renderer.token_ids)
+        for messages in conversations(tools, args.turns)
+    ]
+    incremental_time = time.perf_counter() - start_time
+
+    print(f"Prompt characters at the last turn: {len(expected[-1][0])}")
+    print(f"full         {full_time / args.turns * 1000:.2f} ms per turn")
+    print(
+        f"incremental  {incremental_time / args.turns * 1000:.2f} ms per turn "
+        f"({renderer.mode} mode, {renderer.full_renders} full renders, "
+        f"{renderer.incremental_renders} incremental)"
+    )
+    print(f"Identical prompts{' and token ids' if args.tokenize else ''}: {rendered == expected}")
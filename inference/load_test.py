@@ -0,0 +1,592 @@
+import os
+import csv
+import json
+import math
+import time
+import random
+import asyncio
+import argparse
+
+import aiohttp
+from dotenv import load_dotenv
+
+from mock_tgi_server import serve_in_background
+
+# Load generator for TGI and OpenAI-compatible (vLLM) servers, to find the load at
+# which a serving config saturates. Requests follow an open-loop Poisson process,
+# a closed loop of virtual users, or a step/ramp profile of arrival rates. Reports
+# p50/p90/p99 latency, time-to-first-token (TTFT), inter-token latency (ITL),
+# output tokens/sec and error rate per stage, and exports them to JSON/CSV.
+# Latency and TTFT are measured from the scheduled arrival of each request, so
+# that time spent queueing on the client side is not hidden.
+# Usage:
+#   python load_test.py --mock --load poisson --rate 8 --duration 30
+#   python load_test.py --backend openai --load closed --users 1,8,32 --step_duration 60
+#   python load_test.py --load step --rates 1,2,4,8,16 --step_duration 30 --output_json results.json
+
+
+def percentile(values, q):
+    """Linearly interpolated q-th percentile (0-100) of values, or None if empty."""
+    if not values:
+        return None
+    values = sorted(values)
+    position = (len(values) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+class Stage:
+    """A period of constant load: an arrival rate (open loop) or a number of users (closed loop)."""
+
+    def __init__(self, duration, rate=None, users=None):
+        self.duration = duration
+        self.rate = rate
+        self.users = users
+        self.started = None
+        self.ended = None
+
+    @property
+    def offered(self):
+        return self.rate if self.users is None else self.users
+
+    @property
+    def name(self):
+        if self.users is None:
+            return f"{self.rate:g} req/s"
+        return f"{self.users} users"
+
+
+class RequestResult:
+    """Timings of one request, in seconds from its scheduled arrival."""
+
+    def __init__(self, stage, scheduled):
+        self.stage = stage
+        self.scheduled = scheduled
+        self.latency = None
+        self.ttft = None
+        self.inter_token_latencies = []
+        self.prompt_tokens = None
+        self.output_tokens = 0
+        self.text = None  # kept only when the server reports no token count
+        self.error = None
+
+    def to_dict(self, start_time):
+        return {
+            "stage": self.stage,
+            "scheduled": self.scheduled - start_time,
+            "latency": self.latency,
+            "ttft": self.ttft,
+            "mean_itl": sum(self.inter_token_latencies) / len(self.inter_token_latencies)
+            if self.inter_token_latencies
+            else None,
+            "prompt_tokens": self.prompt_tokens,
+            "output_tokens": self.output_tokens,
+            "error": self.error,
+        }
+
+
+def parse_values(value, type=float):
+    return [type(item) for item in str(value).split(",") if item.strip()]
+
+
+def build_stages(args):
+    if args.load == "closed":
+        users = parse_values(args.users, int)
+        duration = args.duration if len(users) == 1 else args.step_duration
+        return [Stage(duration, users=count) for count in users]
+    if args.load == "poisson":
+        return [Stage(args.duration, rate=args.rate)]
+    if args.load == "step":
+        return [Stage(args.step_duration, rate=rate) for rate in parse_values(args.rates)]
+
+    # ramp: a linear increase from start_rate to rate, in steps of step_duration
+    steps = max(1, math.ceil(args.duration / args.step_duration))
+    return [
+        Stage(
+            args.step_duration,
+            rate=args.start_rate
+            + (args.rate - args.start_rate) * (i / (steps - 1) if steps > 1 else 1),
+        )
+        for i in range(steps)
+    ]
+
+
+def load_tokenizer(args):
+    """Loads MODEL's tokenizer, or returns None when running offline or without a model."""
+    if args.mock or not args.model:
+        return None
+
+    from tokenizer_registry import get_tokenizer
+
+    return get_tokenizer(args.model)
+
+
+def format_prompt(args, tokenizer):
+    """Returns the text to send: chat-formatted with MODEL's template for TGI, raw otherwise."""
+    if args.backend != "tgi" or tokenizer is None:
+        return args.prompt
+    return tokenizer.apply_chat_template(
+        [{"role": "user", "content": args.prompt}],
+        tokenize=False,
+        add_generation_prompt=True,
+    )
+
+
+def build_request(args, prompt):
+    """Returns the path and payload of a request to the chosen backend."""
+    if args.backend == "tgi":
+        parameters = {"max_new_tokens": args.max_new_tokens, "do_sample": False}
+        if args.stream:
+            return "/generate_stream", {"inputs": prompt, "parameters": parameters}
+        return "/generate", {"inputs": prompt, "parameters": dict(parameters, details=True)}
+
+    payload = {
+        "model": args.model,
+        "messages": [{"role": "user", "content": prompt}],
+        "max_tokens": args.max_new_tokens,
+        "temperature": 0,
+        "stream": args.stream,
+    }
+    if args.stream:
+        payload["stream_options"] = {"include_usage": True}
+    return "/v1/chat/completions", payload
+
+
+def parse_usage(body, backend):
+    """Returns the (prompt, completion) token counts a response or event reports, or None."""
+    if backend == "tgi":
+        return None, (body.get("details") or {}).get("generated_tokens")
+    usage = body.get("usage") or {}
+    return usage.get("prompt_tokens"), usage.get("completion_tokens")
+
+
+def parse_event(event, backend):
+    """Returns the token text of a streamed event, or None."""
+    if backend == "tgi":
+        token = event.get("token") or {}
+        return None if token.get("special") else token.get("text")
+    choices = event.get("choices") or [{}]
+    return (choices[0].get("delta") or {}).get("content")
+
+
+def parse_text(body, backend):
+    if backend == "tgi":
+        return body.get("generated_text")
+    choices = body.get("choices") or [{}]
+    return (choices[0].get("message") or {}).get("content")
+
+
+async def send_request(session, url, payload, args, result):
+    try:
+        async with session.post(url, json=payload) as response:
+            if response.status >= 400:
+                await response.read()
+                result.error = f"HTTP {response.status}"
+                return
+
+            if not args.stream:
+                body = await response.json()
+                prompt_tokens, output_tokens = parse_usage(body, args.backend)
+                result.prompt_tokens = prompt_tokens or result.prompt_tokens
+                if output_tokens is None:
+                    result.output_tokens = None
+                    result.text = parse_text(body, args.backend)
+                else:
+                    result.output_tokens = output_tokens
+                return
+
+            last_token_time = None
+            async for line in response.content:
+                if not line.startswith(b"data:"):
+                    continue
+                data = line[len(b"data:") :].strip()
+                if data == b"[DONE]":
+                    break
+
+                event = json.loads(data)
+                text = parse_event(event, args.backend)
+                prompt_tokens, output_tokens = parse_usage(event, args.backend)
+                now = time.perf_counter()
+                if text:
+                    if last_token_time is None:
+                        result.ttft = now - result.scheduled
+                    else:
+                        result.inter_token_latencies.append(now - last_token_time)
+                    last_token_time = now
+                    result.output_tokens += 1
+                # One event per token, unless the server reports the exact count
+                if output_tokens is not None:
+                    result.output_tokens = output_tokens
+                result.prompt_tokens = prompt_tokens or result.prompt_tokens
+    except (aiohttp.ClientError, asyncio.TimeoutError) as exc:
+        result.error = type(exc).__name__
+    finally:
+        result.latency = time.perf_counter() - result.scheduled
+
+
+class LoadGenerator:
+    """
+    Drives the stages of a load test against one endpoint and collects the results.
+
+    Open-loop stages schedule arrivals independently of completions, so requests
+    pile up once the server saturates; closed-loop stages keep a fixed number of
+    users, each sending its next request when the previous one has completed.
+
+    Methods
+    -------
+    run(stages: list)
+        Runs every stage in order and returns the RequestResult of each request.
+    """
+
+    def __init__(self, session, url, payload, args, prompt_tokens=None):
+        self.session = session
+        self.url = url
+        self.payload = payload
+        self.args = args
+        self.prompt_tokens = prompt_tokens
+        self.results = []
+        self.sent = 0
+        self.rng = random.Random(args.seed)
+
+    def _budget_left(self):
+        return self.args.requests is None or self.sent < self.args.requests
+
+    async def _send(self, stage_index, scheduled):
+        result = RequestResult(stage_index, scheduled)
+        result.prompt_tokens = self.prompt_tokens
+        self.results.append(result)
+        await send_request(self.session, self.url, self.payload, self.args, result)
+
+    async def _run_open(self, stage_index, stage, tasks):
+        arrival = stage.started
+        end_time = stage.started + stage.duration
+        while self._budget_left():
+            if self.args.arrival == "poisson":
+                arrival += self.rng.expovariate(stage.rate)
+            else:
+                arrival += 1 / stage.rate
+            if arrival > end_time:
+                break
+            await asyncio.sleep(max(0.0, arrival - time.perf_counter()))
+            self.sent += 1
+            tasks.append(asyncio.ensure_future(self._send(stage_index, arrival)))
+        if self._budget_left():
+            await asyncio.sleep(max(0.0, end_time - time.perf_counter()))
+
+    async def _run_closed(self, stage_index, stage):
+        end_time = stage.started + stage.duration
+
+        async def user():
+            while time.perf_counter() < end_time and self._budget_left():
+                self.sent += 1
+                await self._send(stage_index, time.perf_counter())
+                if self.args.think_time:
+                    await asyncio.sleep(self.rng.expovariate(1 / self.args.think_time))
+
+        await asyncio.gather(*(user() for _ in range(stage.users)))
+
+    async def run(self, stages):
+        tasks = []
+        for stage_index, stage in enumerate(stages):
+            if not self._budget_left():
+                break
+            stage.started = time.perf_counter()
+            if stage.users is None:
+                await self._run_open(stage_index, stage, tasks)
+            else:
+                await self._run_closed(stage_index, stage)
+            # Earlier than planned if the request budget ran out
+            stage.ended = time.perf_counter()
+        await asyncio.gather(*tasks)
+        return self.results
+
+
+def summarize(name, offered, results, window):
+    """Aggregates the results of a stage (or of the whole run) over a window of seconds."""
+    completed = [result for result in results if result.error is None]
+    latencies = [result.latency for result in completed]
+    ttfts = [result.ttft for result in completed if result.ttft is not None]
+    itls = [itl for result in completed for itl in result.inter_token_latencies]
+    output_tokens = sum(result.output_tokens or 0 for result in completed)
+    prompt_tokens = [result.prompt_tokens for result in completed if result.prompt_tokens]
+
+    summary = {
+        "stage": name,
+        "offered": offered,
+        "requests": len(results),
+        "errors": len(results) - len(completed),
+        "error_rate": (len(results) - len(completed)) / len(results) if results else None,
+        "requests_per_second": len(completed) / window if window else None,
+        "output_tokens_per_second": output_tokens / window if window else None,
+        "output_tokens": output_tokens,
+        "mean_prompt_tokens": sum(prompt_tokens) / len(prompt_tokens)
+        if prompt_tokens
+        else None,
+    }
+    for metric, values in [("latency", latencies), ("ttft", ttfts), ("itl", itls)]:
+        for q in (50, 90, 99):
+            summary[f"{metric}_p{q}"] = percentile(values, q)
+    return summary
+
+
+def summarize_stages(stages, results, think_time=0.0):
+    summaries = []
+    for stage_index, stage in enumerate(stages):
+        stage_results = [result for result in results if result.stage == stage_index]
+        if stage.started is None:
+            break
+
+        if stage.users is not None:
+            # Little's law: in steady state each user completes one request per
+            # (latency + think time), whatever happens at the stage boundaries
+            cycle = sum(result.latency for result in stage_results) / max(
+                len(stage_results), 1
+            ) + think_time
+            window = len(stage_results) * cycle / stage.users
+        else:
+            # Completions lag arrivals by at least the fastest latency; any backlog
+            # left when the stage ends stretches the window and lowers the throughput
+            finished = max(
+                [result.scheduled + result.latency for result in stage_results],
+                default=stage.ended,
+            )
+            fastest = min([result.latency for result in stage_results], default=0.0)
+            window = max(stage.ended - stage.started, finished - stage.started - fastest)
+        summaries.append(summarize(stage.name, stage.offered, stage_results, window))
+    return summaries
+
+
+def find_saturation(stages, summaries, max_error_rate=0.01):
+    """
+    Returns the name of the first saturated stage, or None.
+
+    An open-loop stage is saturated when it completes less than 90% of its actual
+    arrival rate (rather than the nominal one, which short stages deviate from), or fails more than max_error_rate of its requests. A closed-loop
+    stage is saturated when adding users raises output tokens/sec by less than 10%.
+    """
+    previous = None
+    for stage, summary in zip(stages, summaries):
+        if summary["error_rate"] and summary["error_rate"] > max_error_rate:
+            return summary["stage"]
+        if stage.users is None:
+            elapsed = stage.ended - stage.started
+            if elapsed <= 0:
+                continue  # finished within the timer's resolution, no rate to compare
+            arrival_rate = summary["requests"] / elapsed
+            if (summary["requests_per_second"] or 0) < 0.9 * arrival_rate:
+                return summary["stage"]
+        elif previous is not None:
+            if (summary["output_tokens_per_second"] or 0) < 1.1 * (
+                previous["output_tokens_per_second"] or 0
+            ):
+                return summary["stage"]
+        previous = summary
+    return None
+
+
+def print_summaries(summaries):
+    def ms(value):
+        return "-" if value is None else f"{value * 1000:.0f}"
+
+    header = f"{'stage':<14}{'reqs':>6}{'err%':>7}{'req/s':>8}{'tok/s':>9}  {'latency p50/p90/p99':>21}  {'ttft p50/p90/p99':>18}  {'itl p50/p90/p99':>16}"
+    print(header)
+    print("-" * len(header))
+    for summary in summaries:
+        error_rate = summary["error_rate"] or 0
+        print(
+            f"{summary['stage']:<14}{summary['requests']:>6}{error_rate * 100:>6.1f}%"
+            f"{summary['requests_per_second'] or 0:>8.2f}{summary['output_tokens_per_second'] or 0:>9.1f}"
+            f"  {'/'.join(ms(summary[f'latency_p{q}']) for q in (50, 90, 99)) + ' ms':>21}"
+            f"  {'/'.join(ms(summary[f'ttft_p{q}']) for q in (50, 90, 99)) + ' ms':>18}"
+            f"  {'/'.join(ms(summary[f'itl_p{q}']) for q in (50, 90, 99)) + ' ms':>16}"
+        )
+
+
+def write_csv(output_file, summaries):
+    with open(output_file, "w", newline="") as file:
+        writer = csv.DictWriter(file, fieldnames=list(summaries[0].keys()))
+        writer.writeheader()
+        writer.writerows(summaries)
+    print(f"Results have been written to '{output_file}'.")
+
+
+def count_tokens(tokenizer, texts, batch_size=256):
+    """Counts the tokens of each text, tokenizing in batches."""
+    counts = []
+    for start in range(0, len(texts), batch_size):
+        token_ids = tokenizer(texts[start : start + batch_size], add_special_tokens=False)
+        counts.extend(len(ids) for ids in token_ids["input_ids"])
+    return counts
+
+
+def count_missing_tokens(results, tokenizer):
+    """Tokenizes, after the run, the outputs of requests whose server reported no token count."""
+    missing = [result for result in results if result.output_tokens is None]
+    if not missing:
+        return
+    if tokenizer is None:
+        print(f"Warning: {len(missing)} responses have no token count and no tokenizer is loaded")
+        counts = [0] * len(missing)
+    else:
+        counts = count_tokens(tokenizer, [result.text or "" for result in missing])
+    for result, count in zip(missing, counts):
+        result.output_tokens = count
+        result.text = None
+
+
+async def run_load_test(args, base_url):
+    stages = build_stages(args)
+    tokenizer = load_tokenizer(args)
+    prompt = format_prompt(args, tokenizer)
+    path, payload = build_request(args, prompt)
+
+    # The prompt is the same for every request, so its tokens are counted once, up
+    # front; OpenAI-compatible servers report their own (chat-formatted) count
+    prompt_tokens = None
+    if tokenizer is not None and args.backend == "tgi":
+        prompt_tokens = count_tokens(tokenizer, [prompt])[0]
+
+    connector = aiohttp.TCPConnector(limit=args.max_connections)
+    timeout = aiohttp.ClientTimeout(total=args.timeout)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        start_time = time.perf_counter()
+        generator = LoadGenerator(
+            session, base_url.rstrip("/") + path, payload, args, prompt_tokens
+        )
+        results = await generator.run(stages)
+        elapsed = time.perf_counter() - start_time
+
+    count_missing_tokens(results, tokenizer)
+    return stages, results, start_time, elapsed
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Load test a TGI or OpenAI-compatible server and report latency percentiles, TTFT and throughput."
+    )
+    parser.add_argument("--backend", choices=["tgi", "openai"], default="tgi")
+    parser.add_argument("--api_endpoint", type=str, default=os.getenv("API_ENDPOINT"))
+    parser.add_argument("--model", type=str, default=os.getenv("MODEL"))
+    parser.add_argument(
+        "--load",
+        choices=["poisson", "closed", "step", "ramp"],
+        default="poisson",
+        help="poisson: open-loop arrivals at --rate. closed: --users virtual users. step: open-loop stages at --rates. ramp: open-loop rate rising from --start_rate to --rate.",
+    )
+    parser.add_argument(
+        "--arrival",
+        choices=["poisson", "constant"],
+        default="poisson",
+        help="Inter-arrival times of open-loop loads.",
+    )
+    parser.add_argument("--rate", type=float, default=4.0, help="Requests per second.")
+    parser.add_argument("--start_rate", type=float, default=1.0)
+    parser.add_argument("--rates", type=str, default="1,2,4,8,16")
+    parser.add_argument(
+        "--users", type=str, default="8", help="Virtual users, or a comma-separated list of stages."
+    )
+    parser.add_argument(
+        "--think_time",
+        type=float,
+        default=0.0,
+        help="Mean seconds a closed-loop user waits between requests.",
+    )
+    parser.add_argument("--duration", type=float, default=60.0, help="Seconds.")
+    parser.add_argument(
+        "--step_duration", type=float, default=30.0, help="Seconds per step/ramp stage."
+    )
+    parser.add_argument(
+        "--requests", type=int, default=None, help="Stop after this many requests."
+    )
+    parser.add_argument(
+        "--prompt", type=str, default="Write a long essay on the topic of spring."
+    )
+    parser.add_argument("--max_new_tokens", type=int, default=500)
+    parser.add_argument(
+        "--no_stream",
+        dest="stream",
+        action="store_false",
+        help="Use non-streaming requests; TTFT and ITL are not measured.",
+    )
+    parser.add_argument(
+        "--max_error_rate",
+        type=float,
+        default=0.01,
+        help="Error rate above which a stage counts as saturated.",
+    )
+    parser.add_argument("--max_connections", type=int, default=1024)
+    parser.add_argument("--timeout", type=float, default=300.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output_json", type=str, default=None)
+    parser.add_argument("--output_csv", type=str, default=None)
+
+    mock = parser.add_argument_group("mock server")
+    mock.add_argument(
+        "--mock", action="store_true", help="Run against the bundled mock server, offline."
+    )
+    mock.add_argument("--mock_latency", type=float, default=0.05)
+    mock.add_argument("--mock_token_latency", type=float, default=0.01)
+    mock.add_argument("--mock_tokens", type=int, default=100)
+    mock.add_argument("--mock_error_rate", type=float, default=0.0)
+    mock.add_argument("--mock_max_concurrency", type=int, default=32)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    load_dotenv()
+    args = parse_arguments(argv)
+
+    server = None
+    if args.mock:
+        server, base_url = serve_in_background(
+            latency=args.mock_latency,
+            token_latency=args.mock_token_latency,
+            tokens=args.mock_tokens,
+            error_rate=args.mock_error_rate,
+            max_concurrency=args.mock_max_concurrency,
+        )
+        args.model = args.model or "mock"
+    elif args.api_endpoint:
+        base_url = args.api_endpoint
+    else:
+        raise SystemExit("Set API_ENDPOINT or pass --api_endpoint (or --mock)")
+
+    stages, results, start_time, elapsed = asyncio.run(run_load_test(args, base_url))
+    if server:
+        server.shutdown()
+
+    summaries = summarize_stages(stages, results, args.think_time)
+    overall = summarize("overall", None, results, elapsed)
+    print_summaries(summaries + ([overall] if len(summaries) > 1 else []))
+
+    saturation = find_saturation(stages, summaries, args.max_error_rate)
+    peak = max(summaries, key=lambda summary: summary["output_tokens_per_second"] or 0)
+    print(
+        f"\nPeak throughput: {peak['output_tokens_per_second'] or 0:.1f} output tokens/sec at {peak['stage']}"
+    )
+    print(f"Saturation point: {saturation or 'not reached'}")
+    if overall["mean_prompt_tokens"]:
+        print(f"Prompt tokens per request: {overall['mean_prompt_tokens']:.0f}")
+
+    if args.output_json:
+        with open(args.output_json, "w") as file:
+            json.dump(
+                {
+                    "config": vars(args),
+                    "stages": summaries,
+                    "overall": overall,
+                    "saturation": saturation,
+                    "requests": [result.to_dict(start_time) for result in results],
+                },
+                file,
+                indent=4,
+            )
+        print(f"Results have been written to '{args.output_json}'.")
+    if args.output_csv:
+        write_csv(args.output_csv, summaries + [overall])
+    return summaries
+
+
+if __name__ == "__main__":
+    main()
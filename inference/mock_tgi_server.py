@@ -0,0 +1,379 @@
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from contextlib import nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# A minimal stand-in for a TGI server (and for the OpenAI-compatible API of vLLM),
+# used to benchmark the clients offline. Serves /health, /generate,
+# /generate_stream and /v1/chat/completions (with or without streaming), and
+# /v1/completions with a list of prompts. Requests constrained by a grammar
+# (TGI grammar, vLLM guided_json) never get the rambling responses of --invalid_rate.
+# Usage: python mock_tgi_server.py --port 8080 --latency 0.05 --token_latency 0.01
+
+
+class MockTGIHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 so that clients can keep connections alive between requests
+    protocol_version = "HTTP/1.1"
+
+    latency = 0.0  # seconds before the first token
+    token_latency = 0.0  # seconds between tokens
+    tokens = None  # tokens per response, defaults to the words of generated_text
+    error_rate = 0.0  # share of requests answered with a 503
+    invalid_rate = 0.0  # share of unconstrained responses that ramble up to the token limit
+    slots = None  # caps concurrent generations, like the batch size of a real server
+    admission = None  # caps requests generating or waiting, beyond which they get a 429
+    generated_text = "Spring is the season of renewal."
+    rambling = "Sure! Here is the information you asked for, in the requested format:"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _start_events(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+    def _send_event(self, data):
+        body = f"data: {data if isinstance(data, str) else json.dumps(data)}\n\n".encode()
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(body), body))
+        self.wfile.flush()
+
+    def _end_events(self):
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _completion_tokens(self, max_new_tokens, constrained=False):
+        words = self.generated_text.split(" ")
+        count = self.tokens or len(words)
+        # Unless constrained by a grammar, some responses ramble before or after
+        # the answer, and only stop at the token limit
+        if not constrained and self.invalid_rate and random.random() < self.invalid_rate:
+            rambling = self.rambling.split(" ")
+            if random.random() < 0.5:
+                words = rambling[:-1] + [rambling[-1] + "\n\n" + words[0]] + words[1:]
+            else:
+                words = words[:-1] + [words[-1] + "\n\n" + rambling[0]] + rambling[1:]
+            count = max_new_tokens or max(count, len(words))
+        if max_new_tokens:
+            count = min(count, max_new_tokens)
+        # One token per word, with the separating space in front as in BPE vocabularies
+        return [words[0]] + [" " + words[i % len(words)] for i in range(1, count)]
+
+    def _generate_tokens(self, max_new_tokens, constrained=False):
+        """Yields the tokens of a response, sleeping to simulate prefill and decoding."""
+        tokens = self._completion_tokens(max_new_tokens, constrained)
+        if self.latency:
+            time.sleep(self.latency)
+        for i, token in enumerate(tokens):
+            if i and self.token_latency:
+                time.sleep(self.token_latency)
+            yield token
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._send_json(200, {})
+        elif self.path == "/v1/models":
+            self._send_json(200, {"object": "list", "data": [{"id": "mock", "object": "model"}]})
+        else:
+            self._send_json(404, {"error": "Not found"})
+
+    def do_POST(self):
+        routes = {
+            "/generate": self._generate,
+            "/generate_stream": self._generate_stream,
+            "/v1/chat/completions": self._chat_completions,
+            "/v1/completions": self._completions,
+        }
+        if self.path not in routes:
+            self._send_json(404, {"error": "Not found"})
+            return
+
+        payload = self._read_json()
+        if self.error_rate and random.random() < self.error_rate:
+            self._send_json(503, {"error": "Model is overloaded"})
+            return
+        # Like TGI's --max-concurrent-requests, turn requests away once the queue is full
+        if self.admission and not self.admission.acquire(blocking=False):
+            self._send_json(429, {"error": "Model is overloaded"})
+            return
+        try:
+            with self.slots or nullcontext():
+                routes[self.path](payload)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client closed a stream early; like TGI, stop generating
+            self.close_connection = True
+        finally:
+            if self.admission:
+                self.admission.release()
+
+    def _generate(self, payload):
+        parameters = payload.get("parameters", {})
+        tokens = list(
+            self._generate_tokens(
+                parameters.get("max_new_tokens"), bool(parameters.get("grammar"))
+            )
+        )
+        response = {"generated_text": "".join(tokens)}
+        if parameters.get("details"):
+            response["details"] = {"finish_reason": "length", "generated_tokens": len(tokens)}
+        self._send_json(200, response)
+
+    def _generate_stream(self, payload):
+        parameters = payload.get("parameters", {})
+        self._start_events()
+        tokens = []
+        generated = self._generate_tokens(
+            parameters.get("max_new_tokens"), bool(parameters.get("grammar"))
+        )
+        for i, token in enumerate(generated):
+            tokens.append(token)
+            self._send_event(
+                {
+                    "token": {"id": i, "text": token, "logprob": 0.0, "special": False},
+                    "generated_text": None,
+                    "details": None,
+                }
+            )
+        # As in TGI, the last event also carries the full text and the details
+        self._send_event(
+            {
+                "token": {"id": 0, "text": "", "logprob": 0.0, "special": True},
+                "generated_text": "".join(tokens),
+                "details": {"finish_reason": "length", "generated_tokens": len(tokens)},
+            }
+        )
+        self._end_events()
+
+    def _completions(self, payload):
+        prompts = payload.get("prompt", "")
+        if isinstance(prompts, str):
+            prompts = [prompts]
+        # The prompts of one request are generated together, as one batch
+        tokens = list(
+            self._generate_tokens(payload.get("max_tokens"), bool(payload.get("guided_json")))
+        )
+        self._send_json(
+            200,
+            {
+                "id": "cmpl-mock",
+                "object": "text_completion",
+                "created": int(time.time()),
+                "model": payload.get("model", "mock"),
+                "choices": [
+                    {"index": i, "text": "".join(tokens), "finish_reason": "length"}
+                    for i in range(len(prompts))
+                ],
+                "usage": {
+                    "prompt_tokens": sum(len(prompt.split()) for prompt in prompts),
+                    "completion_tokens": len(tokens) * len(prompts),
+                    "total_tokens": sum(len(prompt.split()) for prompt in prompts)
+                    + len(tokens) * len(prompts),
+                },
+            },
+        )
+
+    def _chat_completions(self, payload):
+        model = payload.get("model", "mock")
+        prompt_tokens = sum(
+            len(str(message.get("content", "")).split())
+            for message in payload.get("messages", [])
+        )
+        tokens = self._generate_tokens(
+            payload.get("max_tokens"), bool(payload.get("guided_json"))
+        )
+
+        if not payload.get("stream"):
+            tokens = list(tokens)
+            text = "".join(tokens)
+            completion_tokens = len(tokens)
+            self._send_json(
+                200,
+                {
+                    "id": "chatcmpl-mock",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [
+                        {
+                            "index": 0,
+                            "message": {"role": "assistant", "content": text},
+                            "finish_reason": "length",
+                        }
+                    ],
+                    "usage": {
+                        "prompt_tokens": prompt_tokens,
+                        "completion_tokens": completion_tokens,
+                        "total_tokens": prompt_tokens + completion_tokens,
+                    },
+                },
+            )
+            return
+
+        self._start_events()
+        chunk = {
+            "id": "chatcmpl-mock",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+        }
+        completion_tokens = 0
+        for token in tokens:
+            completion_tokens += 1
+            self._send_event(
+                dict(
+                    chunk,
+                    choices=[
+                        {"index": 0, "delta": {"content": token}, "finish_reason": None}
+                    ],
+                )
+            )
+        self._send_event(
+            dict(chunk, choices=[{"index": 0, "delta": {}, "finish_reason": "length"}])
+        )
+        if payload.get("stream_options", {}).get("include_usage"):
+            self._send_event(
+                dict(
+                    chunk,
+                    choices=[],
+                    usage={
+                        "prompt_tokens": prompt_tokens,
+                        "completion_tokens": completion_tokens,
+                        "total_tokens": prompt_tokens + completion_tokens,
+                    },
+                )
+            )
+        self._send_event("[DONE]")
+        self._end_events()
+
+
+class MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Open-loop load tests can open hundreds of connections at once
+    request_queue_size = 1024
+
+    def handle_error(self, request, client_address):
+        # Clients closing streams (or kept-alive connections) early is expected
+        if not isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            super().handle_error(request, client_address)
+
+
+def make_server(
+    port=0,
+    latency=0.0,
+    generated_text=None,
+    token_latency=0.0,
+    tokens=None,
+    error_rate=0.0,
+    max_concurrency=None,
+    invalid_rate=0.0,
+    max_requests=None,
+):
+    """Creates a mock server bound to localhost. Port 0 picks a free port."""
+    handler = type(
+        "ConfiguredMockTGIHandler",
+        (MockTGIHandler,),
+        {
+            "latency": latency,
+            "token_latency": token_latency,
+            "tokens": tokens,
+            "error_rate": error_rate,
+            "invalid_rate": invalid_rate,
+            "slots": threading.BoundedSemaphore(max_concurrency)
+            if max_concurrency
+            else None,
+            "admission": threading.BoundedSemaphore(max_requests) if max_requests else None,
+            "generated_text": generated_text or MockTGIHandler.generated_text,
+        },
+    )
+    return MockServer(("127.0.0.1", port), handler)
+
+
+def serve_in_background(port=0, latency=0.0, generated_text=None, **options):
+    """Starts a mock server on a daemon thread and returns (server, base_url)."""
+    server = make_server(port, latency, generated_text, **options)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a mock TGI server.")
+    parser.add_argument("--port", type=int, default=8080, help="Port to listen on.")
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.0,
+        help="Seconds to sleep before the first token of each response.",
+    )
+    parser.add_argument(
+        "--token_latency",
+        type=float,
+        default=0.0,
+        help="Seconds to sleep between tokens.",
+    )
+    parser.add_argument(
+        "--tokens",
+        type=int,
+        default=None,
+        help="Tokens per response (capped by max_new_tokens/max_tokens).",
+    )
+    parser.add_argument(
+        "--error_rate",
+        type=float,
+        default=0.0,
+        help="Share of requests answered with a 503.",
+    )
+    parser.add_argument(
+        "--max_concurrency",
+        type=int,
+        default=None,
+        help="Requests generated at once; further requests wait for a free slot.",
+    )
+    parser.add_argument(
+        "--max_requests",
+        type=int,
+        default=None,
+        help="Requests generating or waiting at once; further requests are answered with a 429.",
+    )
+    parser.add_argument(
+        "--invalid_rate",
+        type=float,
+        default=0.0,
+        help="Share of responses that ramble around the answer up to the token limit, unless constrained by a grammar (TGI grammar, vLLM guided_json).",
+    )
+    parser.add_argument(
+        "--generated_text",
+        type=str,
+        default=None,
+        help="Text of each response, one token per word.",
+    )
+    args = parser.parse_args()
+
+    server = make_server(
+        args.port,
+        args.latency,
+        generated_text=args.generated_text,
+        token_latency=args.token_latency,
+        tokens=args.tokens,
+        error_rate=args.error_rate,
+        max_concurrency=args.max_concurrency,
+        invalid_rate=args.invalid_rate,
+        max_requests=args.max_requests,
+    )
+    print(f"Mock TGI server listening on http://127.0.0.1:{server.server_address[1]}")
+    server.serve_forever()
@@ -0,0 +1,399 @@
+import time
+import random
+import asyncio
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Optional
+
+# Statuses worth retrying: the request was fine, the server could not take it now.
+# Other 4xx (e.g. 422, a prompt that is too long) fail the same way every time.
+RETRYABLE_STATUS = {408, 429, 502, 503, 504}
+# Statuses (and timeouts) that mean the server is overloaded, and load should drop
+OVERLOAD_STATUS = {429, 503}
+
+# Connection errors of the openai client, matched by name so as not to import it
+CONNECTION_ERROR_NAMES = {"APIConnectionError", "APITimeoutError"}
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of sending a request while the circuit of every endpoint is open."""
+
+
+def status_of(exc: Exception) -> Optional[int]:
+    """Returns the HTTP status of a requests, aiohttp or openai error, if it has one."""
+    status = getattr(getattr(exc, "response", None), "status_code", None)
+    if status is None:
+        status = getattr(exc, "status", None)  # aiohttp.ClientResponseError
+    if status is None:
+        status = getattr(exc, "status_code", None)  # openai.APIStatusError
+    return status if isinstance(status, int) else None
+
+
+def is_timeout(exc: Exception) -> bool:
+    # requests.Timeout, aiohttp.ServerTimeoutError and asyncio.TimeoutError all qualify
+    return isinstance(exc, (TimeoutError, asyncio.TimeoutError)) or "Timeout" in type(exc).__name__
+
+
+def is_retryable(exc: Exception) -> bool:
+    """
+    Whether a failed request may succeed if sent again.
+
+    Retryable: 408, 429, 502, 503 and 504 responses, timeouts and connection
+    errors. Fatal: every other status, open circuits, and errors that are not
+    about transport (e.g. a response that does not decode).
+    """
+    if isinstance(exc, CircuitOpenError):
+        return False
+    status = status_of(exc)
+    if status is not None:
+        return status in RETRYABLE_STATUS
+    return (
+        is_timeout(exc)
+        or isinstance(exc, ConnectionError)
+        or "ConnectionError" in type(exc).__name__  # requests, aiohttp
+        or type(exc).__name__ in CONNECTION_ERROR_NAMES
+    )
+
+
+def is_overload(exc: Exception) -> bool:
+    """Whether a failed request says the server is overloaded (429, 503 or a timeout)."""
+    return status_of(exc) in OVERLOAD_STATUS or is_timeout(exc)
+
+
+def retry_after(exc: Exception) -> Optional[float]:
+    """Returns the seconds of a Retry-After header sent with an error response, if any."""
+    headers = getattr(getattr(exc, "response", None), "headers", None) or getattr(
+        exc, "headers", None
+    )
+    try:
+        return float(headers.get("Retry-After")) if headers else None
+    except (TypeError, ValueError):
+        return None
+
+
+class CircuitBreaker:
+    """
+    Stops sending requests to an endpoint that keeps failing.
+
+    Closed, requests go through. After failure_threshold consecutive failures the
+    circuit opens: no request is sent for reset_timeout seconds. It then lets a
+    single probe request through (half-open); the circuit closes if the probe
+    succeeds, and opens again if it fails. Safe to share between threads.
+
+    Methods
+    -------
+    available()
+        Whether a request may be sent now, without taking the probe.
+    allow()
+        Whether a request may be sent now; takes the probe when half-open.
+    record_success()
+        Closes the circuit.
+    record_failure()
+        Counts a failure, opening the circuit at failure_threshold.
+    """
+
+    def __init__(self, failure_threshold: int = 3, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.lock = threading.Lock()
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if self.probing or time.monotonic() - self.opened_at < self.reset_timeout:
+            return "open"
+        return "half_open"
+
+    def available(self) -> bool:
+        """Whether a request may be sent now, without taking the probe."""
+        return self.state != "open"
+
+    def allow(self) -> bool:
+        """Whether a request may be sent now; takes the probe when half-open."""
+        with self.lock:
+            state = self.state
+            if state == "half_open":
+                self.probing = True
+            return state != "open"
+
+    def record_success(self):
+        """Closes the circuit."""
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+
+    def record_failure(self):
+        """Counts a failure, opening the circuit at failure_threshold."""
+        with self.lock:
+            self.failures += 1
+            if self.probing or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+                self.probing = False
+
+
+class RetryBudget:
+    """
+    Caps retries to a share of the requests, so that retries cannot multiply load.
+
+    Every request deposits ratio of a retry, and every retry withdraws a whole
+    one; the balance starts at min_retries and is capped at max_balance. With the
+    default ratio of 0.2, at most one request in five is retried in the long run
+    however many fail, instead of every failure being retried up to three times.
+    Safe to share between threads.
+    """
+
+    def __init__(self, ratio: float = 0.2, min_retries: float = 10.0, max_balance: float = 100.0):
+        self.ratio = ratio
+        self.max_balance = max_balance
+        self.balance = min_retries
+        self.lock = threading.Lock()
+
+    def record_request(self):
+        with self.lock:
+            self.balance = min(self.max_balance, self.balance + self.ratio)
+
+    def try_withdraw(self) -> bool:
+        """Takes one retry from the budget, returns False if there is none left."""
+        with self.lock:
+            if self.balance < 1:
+                return False
+            self.balance -= 1
+            return True
+
+
+class AdaptiveLimiter:
+    """
+    An adaptive concurrency limit, raised and cut in the manner of TCP congestion control (AIMD).
+
+    Until the first cut, each successful request raises the limit by one (slow
+    start: it doubles with every limit requests completed); afterwards by
+    1 / limit, i.e. by one for every limit requests completed. The limit is cut
+    by backoff (halved by default) when the server reports overload (429, 503,
+    timeouts), or when the recent latency (a fast moving average) exceeds
+    latency_tolerance times the long-term latency (a slow one), i.e. requests
+    start to queue on the server. Latency only counts after warmup_samples
+    successful requests, whose mean starts the long-term latency, so that the
+    noise of the first few requests is not taken for queueing. Cuts happen at
+    most once per recent latency, so a burst of failures from one overload
+    counts once. The callers dispatching requests read current and keep no
+    more requests in flight. Each request holds a slot from acquire to
+    release, which records its outcome; a request cancelled midway releases
+    its slot without one. Safe to share between threads.
+
+    Attributes
+    ----------
+    current : int
+        the number of requests that may be in flight now
+    in_flight : int
+        the requests acquired and not yet released
+
+    Methods
+    -------
+    acquire()
+        Takes a slot for a request about to be sent.
+    release(latency: float, overloaded: bool)
+        Frees the slot of a request, recording its latency if it succeeded.
+    """
+
+    def __init__(
+        self,
+        initial_limit: int = 8,
+        min_limit: int = 1,
+        max_limit: int = 64,
+        latency_tolerance: Optional[float] = 3.0,
+        backoff: float = 0.5,
+        smoothing: float = 0.2,
+        baseline_smoothing: float = 0.01,
+        warmup_samples: int = 20,
+    ):
+        self.limit = float(min(max(initial_limit, min_limit), max_limit))
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_tolerance = latency_tolerance
+        self.backoff = backoff
+        self.smoothing = smoothing
+        self.baseline_smoothing = baseline_smoothing
+        self.warmup_samples = warmup_samples
+        self.samples = 0
+        self.latency = None
+        self.baseline = None
+        self.last_decrease = 0.0
+        self.decreases = 0
+        self.in_flight = 0
+        self.lock = threading.Lock()
+
+    @property
+    def current(self) -> int:
+        return int(self.limit)
+
+    def acquire(self):
+        """Takes a slot for a request about to be sent."""
+        with self.lock:
+            self.in_flight += 1
+
+    def release(self, latency: Optional[float] = None, overloaded: bool = False):
+        """
+        Frees the slot of a request, recording its latency if it succeeded, or
+        the overload if the server rejected it.
+        """
+        with self.lock:
+            self.in_flight -= 1
+        if latency is not None:
+            self.on_success(latency)
+        elif overloaded:
+            self.on_overload()
+
+    def on_success(self, latency: float):
+        """Records the latency of a successful request."""
+        with self.lock:
+            self.samples += 1
+            if self.latency is None:
+                self.latency = self.baseline = latency
+            else:
+                self.latency += self.smoothing * (latency - self.latency)
+                # The mean of the warm-up samples, then a slow moving average
+                self.baseline += max(self.baseline_smoothing, 1 / self.samples) * (
+                    latency - self.baseline
+                )
+            if (
+                self.latency_tolerance
+                and self.samples > self.warmup_samples
+                and self.latency > self.latency_tolerance * self.baseline
+            ):
+                self._decrease()
+            else:
+                increase = 1 if self.decreases == 0 else 1 / self.limit
+                self.limit = min(self.max_limit, self.limit + increase)
+
+    def on_overload(self):
+        """Records a request rejected or timed out by an overloaded server."""
+        with self.lock:
+            self._decrease()
+
+    def _decrease(self):
+        now = time.monotonic()
+        if self.limit <= self.min_limit or now - self.last_decrease < (self.latency or 1.0):
+            return
+        self.last_decrease = now
+        self.decreases += 1
+        self.limit = max(self.min_limit, self.limit * self.backoff)
+
+
+class RetryPolicy:
+    """
+    Retries retryable failures with jittered exponential backoff, within a retry budget.
+
+    Fatal errors are raised straight away. Retryable ones are retried up to
+    max_attempts in total, waiting a random time up to base_wait * 2 ** attempt
+    (capped at max_wait) or the server's Retry-After, as long as the retry
+    budget allows; the last error is raised otherwise. Each attempt holds a
+    slot of the limiter, if any, released with its outcome (the latency of a
+    success, or an overload error) even when the attempt is cancelled.
+
+    Attributes
+    ----------
+    retries : int
+        requests sent again
+    refused : int
+        retries refused by the retry budget
+    shed : int
+        requests not sent because every endpoint's circuit was open
+
+    Methods
+    -------
+    call(function: Callable, *args, **kwargs)
+        Calls a function, retrying it as needed, and returns its result.
+    call_async(function: Callable, *args, **kwargs)
+        Awaits a coroutine function, retrying it as needed, and returns its result.
+    """
+
+    def __init__(
+        self,
+        max_attempts: int = 3,
+        base_wait: float = 1.0,
+        max_wait: float = 40.0,
+        budget: Optional[RetryBudget] = None,
+        limiter: Optional[AdaptiveLimiter] = None,
+    ):
+        self.max_attempts = max_attempts
+        self.base_wait = base_wait
+        self.max_wait = max_wait
+        self.budget = budget or RetryBudget()
+        self.limiter = limiter
+        self.retries = 0
+        self.refused = 0
+        self.shed = 0
+        self.lock = threading.Lock()
+
+    def call(self, function: Callable, *args, **kwargs) -> Any:
+        """Calls a function, retrying it as needed, and returns its result."""
+        self.budget.record_request()
+        attempt = 1
+        while True:
+            try:
+                with self._attempt():
+                    return function(*args, **kwargs)
+            except Exception as exc:
+                wait = self._retry_wait(exc, attempt)
+                if wait is None:
+                    raise
+                time.sleep(wait)
+                attempt += 1
+
+    async def call_async(self, function: Callable, *args, **kwargs) -> Any:
+        """Awaits a coroutine function, retrying it as needed, and returns its result."""
+        self.budget.record_request()
+        attempt = 1
+        while True:
+            try:
+                with self._attempt():
+                    return await function(*args, **kwargs)
+            except Exception as exc:
+                wait = self._retry_wait(exc, attempt)
+                if wait is None:
+                    raise
+                await asyncio.sleep(wait)
+                attempt += 1
+
+    @contextmanager
+    def _attempt(self):
+        # Holds a limiter slot for one attempt; the finally also runs when the
+        # attempt is cancelled (asyncio.CancelledError is not an Exception)
+        if self.limiter is None:
+            yield
+            return
+        self.limiter.acquire()
+        start_time = time.perf_counter()
+        latency, overloaded = None, False
+        try:
+            yield
+            latency = time.perf_counter() - start_time
+        except Exception as exc:
+            overloaded = is_overload(exc)
+            raise
+        finally:
+            self.limiter.release(latency, overloaded)
+
+    def _retry_wait(self, exc, attempt) -> Optional[float]:
+        # Returns the seconds to wait before the next attempt, or None to raise
+        if isinstance(exc, CircuitOpenError):
+            with self.lock:
+                self.shed += 1
+            return None
+        if not is_retryable(exc) or attempt >= self.max_attempts:
+            return None
+        if not self.budget.try_withdraw():
+            with self.lock:
+                self.refused += 1
+            return None
+        with self.lock:
+            self.retries += 1
+        wait = retry_after(exc)
+        if wait is None:
+            wait = random.uniform(0, min(self.max_wait, self.base_wait * 2**attempt))
+        return min(wait, self.max_wait)
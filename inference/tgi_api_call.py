@@ -1,9 +1,10 @@
 import os
-import subprocess
-import json
+import requests
 from termcolor import colored
 from dotenv import load_dotenv
-from tenacity import retry, wait_random_exponential, stop_after_attempt
+
+from tgi_client import TGIClient
+from resilience import RetryPolicy, CircuitOpenError
 
 load_dotenv()  # This loads the variables from .env
 
@@ -11,7 +12,10 @@ load_dotenv()  # This loads the variables from .env
 model = os.getenv('MODEL')
 api_endpoint = os.getenv('API_ENDPOINT')
 
-tgi_api_base = api_endpoint + '/generate'
+client = TGIClient(api_endpoint)
+
+# Retries 429s, 503s, timeouts and connection errors with backoff; raises other errors
+retry_policy = RetryPolicy()
 
 # # SET UP PROMPT FORMAT
 # Llama 2 or Mistral
@@ -62,31 +66,10 @@ def format_messages(messages):
 
     return formatted_string
 
-@retry(wait=wait_random_exponential(multiplier=1, max=40), stop=stop_after_attempt(3))
 def chat_completion_request_runpod(messages):
     formatted_messages = format_messages(messages)
 
-    # Properly escape the string for JSON
-    json_payload = json.dumps({"inputs": formatted_messages, "parameters": {"max_new_tokens": 50}})
-
-    # Construct the curl command
-    curl_command = f"""
-    curl {tgi_api_base} \
-        -X POST \
-        -d '{json_payload}' \
-        -H 'Content-Type: application/json'
-    """
-
-    try:
-        # Execute the curl command
-        response = subprocess.run(curl_command, shell=True, check=True, stdout=subprocess.PIPE)
-        response = response.stdout.decode()
-        response = json.loads(response).get("generated_text", "No generated text found")
-        return response
-    except subprocess.CalledProcessError as e:
-        print("Unable to generate ChatCompletion response")
-        print(f"Exception: {e}")
-        return str(e)
+    return retry_policy.call(client.generate_text, formatted_messages, {"max_new_tokens": 50})
     
 def pretty_print_conversation(messages):
     role_to_color = {
@@ -113,7 +96,12 @@ messages = []
 messages.append({"role": "system", "content": "You are a helpful assistant."})
 messages.append({"role": "user", "content": "Count to ten please?"})
 
-chat_response = chat_completion_request_runpod(messages)
+try:
+    chat_response = chat_completion_request_runpod(messages)
+except (requests.exceptions.RequestException, CircuitOpenError) as e:
+    print("Unable to generate ChatCompletion response")
+    print(f"Exception: {e}")
+    raise SystemExit(1)
 messages.append({"role": "assistant", "content": chat_response})
 
 pretty_print_conversation(messages)
\ No newline at end of file
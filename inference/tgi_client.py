@@ -0,0 +1,530 @@
+import json
+import time
+import threading
+from contextlib import contextmanager
+from typing import AsyncIterator, Iterator, List, Optional, Union
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import aiohttp
+except ImportError:  # only needed for AsyncTGIClient
+    aiohttp = None
+
+from resilience import CircuitBreaker, CircuitOpenError
+
+
+def parse_endpoints(api_endpoints: Union[str, List[str]]) -> List[str]:
+    """Accepts one url, a comma-separated list of urls, or a list of urls."""
+    if isinstance(api_endpoints, str):
+        api_endpoints = api_endpoints.split(",")
+    return [endpoint.strip().rstrip("/") for endpoint in api_endpoints if endpoint.strip()]
+
+
+def is_endpoint_failure(exc: Exception) -> bool:
+    """Whether an exception says something about the endpoint, rather than about the request.
+
+    Connection errors, timeouts and 5xx responses count against an endpoint's
+    health; 4xx responses (e.g. a prompt that is too long) do not.
+    """
+    status = getattr(getattr(exc, "response", None), "status_code", None)
+    if status is None:
+        status = getattr(exc, "status", None)  # aiohttp.ClientResponseError
+    return status is None or status >= 500
+
+
+class StreamError(requests.exceptions.RequestException):
+    """An error event sent by the server in the middle of a stream."""
+
+
+class StreamTimings:
+    """
+    Timings of one streamed generation, in seconds from when the request was sent.
+
+    Filled in by generate_stream while tokens arrive. Time-to-first-token (TTFT)
+    includes queueing and prefill on the server; inter-token latencies measure
+    decoding speed.
+
+    Attributes
+    ----------
+    ttft : float or None
+        seconds until the first token arrived
+    token_times : List[float]
+        arrival time of every token
+    total : float or None
+        seconds until the stream ended
+    details : dict or None
+        the details of the last event (finish_reason, generated_tokens, ...)
+    generated_text : str or None
+        the full generated text, once the stream has ended
+    """
+
+    def __init__(self):
+        self.start_time = time.perf_counter()
+        self.ttft = None
+        self.token_times = []
+        self.total = None
+        self.details = None
+        self.generated_text = None
+
+    def add_token(self):
+        elapsed = time.perf_counter() - self.start_time
+        if self.ttft is None:
+            self.ttft = elapsed
+        self.token_times.append(elapsed)
+
+    def finish(self, event: dict):
+        self.total = time.perf_counter() - self.start_time
+        self.details = event.get("details")
+        self.generated_text = event.get("generated_text")
+
+    @property
+    def inter_token_latencies(self) -> List[float]:
+        return [
+            later - earlier for earlier, later in zip(self.token_times, self.token_times[1:])
+        ]
+
+    @property
+    def tokens_per_second(self) -> float:
+        """Decoding speed after the first token."""
+        decoding_time = self.token_times[-1] - self.ttft if self.token_times else 0.0
+        if decoding_time <= 0:
+            return 0.0
+        return (len(self.token_times) - 1) / decoding_time
+
+
+def parse_stream_event(line: bytes) -> Optional[dict]:
+    """Decodes one line of a server-sent event stream, or returns None for other lines."""
+    if not line.startswith(b"data:"):
+        return None
+    data = line[len(b"data:") :].strip()
+    if not data or data == b"[DONE]":
+        return None
+    event = json.loads(data)
+    if "error" in event:
+        raise StreamError(event["error"])
+    return event
+
+
+def stream_token_text(event: dict, timings: Optional[StreamTimings]) -> Optional[str]:
+    """Returns the text of a TGI stream event's token, recording its timing and the final details."""
+    token = event.get("token") or {}
+    text = None if token.get("special") else token.get("text")
+    if timings is not None:
+        if text:
+            timings.add_token()
+        if event.get("generated_text") is not None:
+            timings.finish(event)
+    return text
+
+
+class EndpointState:
+    """Routing state of one endpoint: in-flight requests, latency, health and circuit breaker."""
+
+    def __init__(self, url: str, breaker: CircuitBreaker):
+        self.url = url
+        self.outstanding = 0
+        self.latency = None  # exponentially weighted moving average, in seconds
+        self.healthy = True
+        self.breaker = breaker
+
+
+class EndpointRouter:
+    """
+    Spreads requests over several TGI/vLLM endpoints of the same model.
+
+    Each request goes to the healthy endpoint with the fewest outstanding requests
+    ("least_outstanding"), or with the lowest outstanding requests times average
+    latency ("latency"). Each endpoint has a circuit breaker, which opens after
+    max_failures consecutive failed requests: the endpoint gets no requests for
+    breaker_reset_timeout seconds, then a single probe request decides whether it
+    is back. A background thread polls GET /health on every endpoint each
+    health_check_interval seconds, and requests avoid endpoints failing it, so no
+    liveness probe is needed before each request. When every endpoint fails its
+    health check, requests are still routed over those with a closed circuit;
+    when every circuit is open, acquire raises CircuitOpenError rather than
+    adding load to endpoints that are down. Safe to share between threads and an
+    event loop.
+
+    Methods
+    -------
+    acquire()
+        Picks an endpoint for a request and counts it as outstanding.
+    release(url: str, latency: float, failed: bool)
+        Records the outcome of a request acquired on url.
+    endpoint()
+        Context manager around acquire/release, yields the endpoint url.
+    healthy_endpoints()
+        Returns the urls of the endpoints that are currently admitted.
+    check_health()
+        Polls every endpoint once, marking it healthy or not.
+    """
+
+    def __init__(
+        self,
+        api_endpoints: Union[str, List[str]],
+        routing: str = "least_outstanding",
+        health_check_interval: float = 10.0,
+        health_check_timeout: float = 2.0,
+        max_failures: int = 3,
+        latency_smoothing: float = 0.2,
+        breaker_reset_timeout: float = 30.0,
+    ):
+        if routing not in ("least_outstanding", "latency"):
+            raise ValueError("routing must be 'least_outstanding' or 'latency'")
+
+        self.endpoints = [
+            EndpointState(url, CircuitBreaker(max_failures, breaker_reset_timeout))
+            for url in parse_endpoints(api_endpoints)
+        ]
+        if not self.endpoints:
+            raise ValueError("At least one endpoint is required")
+
+        self.routing = routing
+        self.health_check_timeout = health_check_timeout
+        self.latency_smoothing = latency_smoothing
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.health_session = requests.Session()
+
+        if health_check_interval:
+            threading.Thread(
+                target=self._health_check_loop,
+                args=(health_check_interval,),
+                daemon=True,
+            ).start()
+
+    def acquire(self) -> str:
+        """Picks an endpoint for a request and counts it as outstanding."""
+        with self.lock:
+            admitted = [state for state in self.endpoints if state.breaker.available()]
+            if not admitted:
+                raise CircuitOpenError("The circuit of every endpoint is open")
+            candidates = [state for state in admitted if state.healthy]
+            state = min(candidates or admitted, key=self._score)
+            # Takes the probe, if the circuit is half-open
+            state.breaker.allow()
+            state.outstanding += 1
+            return state.url
+
+    def release(self, url: str, latency: Optional[float] = None, failed: bool = False):
+        """Records the outcome of a request acquired on url."""
+        with self.lock:
+            state = self._state(url)
+            state.outstanding -= 1
+            if failed:
+                state.breaker.record_failure()
+            else:
+                state.breaker.record_success()
+                if latency is not None:
+                    state.latency = (
+                        latency
+                        if state.latency is None
+                        else self.latency_smoothing * latency
+                        + (1 - self.latency_smoothing) * state.latency
+                    )
+
+    @contextmanager
+    def endpoint(self):
+        """Context manager around acquire/release, yields the endpoint url."""
+        url = self.acquire()
+        start_time = time.perf_counter()
+        latency, failed = None, False
+        try:
+            yield url
+            latency = time.perf_counter() - start_time
+        except Exception as exc:
+            failed = is_endpoint_failure(exc)
+            raise
+        finally:
+            # Requests cancelled midway (e.g. a stream closed early) are released
+            # without a latency sample
+            self.release(url, latency, failed)
+
+    def healthy_endpoints(self) -> List[str]:
+        """Returns the urls of the endpoints that are currently admitted."""
+        with self.lock:
+            return [
+                state.url
+                for state in self.endpoints
+                if state.healthy and state.breaker.available()
+            ]
+
+    def check_health(self):
+        """Polls every endpoint once, marking it healthy or not."""
+        for state in self.endpoints:
+            try:
+                response = self.health_session.get(
+                    f"{state.url}/health", timeout=self.health_check_timeout
+                )
+                healthy = response.status_code == 200
+            except requests.exceptions.RequestException:
+                healthy = False
+
+            with self.lock:
+                state.healthy = healthy
+
+    def close(self):
+        self.stopped.set()
+
+    def _health_check_loop(self, interval):
+        while not self.stopped.is_set():
+            self.check_health()
+            self.stopped.wait(interval)
+
+    def _score(self, state):
+        if self.routing == "latency":
+            return (state.outstanding + 1) * (state.latency or 0.0), state.outstanding
+        return state.outstanding, state.latency or 0.0
+
+    def _state(self, url):
+        for state in self.endpoints:
+            if state.url == url:
+                return state
+        raise KeyError(url)
+
+
+class TGIClient:
+    """
+    A pooled, keep-alive HTTP client for one or more text-generation-inference (TGI) endpoints.
+
+    A single requests.Session is shared by every call, so TCP/TLS connections are
+    reused across requests instead of spawning a curl process (and a new handshake)
+    per request. The session is safe to share between the threads of a
+    ThreadPoolExecutor; pool_size should be at least the number of worker threads.
+    With several endpoints, each request is routed by an EndpointRouter.
+
+    Attributes
+    ----------
+    router : EndpointRouter
+        picks the endpoint of each request and tracks endpoint health
+    timeout : tuple
+        (connect timeout, read timeout) in seconds, passed to every request
+
+    Methods
+    -------
+    generate(inputs: str, parameters: dict)
+        Sends a request to /generate and returns the decoded JSON response.
+    generate_text(inputs: str, parameters: dict)
+        Same as generate, but returns only the generated text.
+    generate_stream(inputs: str, parameters: dict, timings: StreamTimings)
+        Streams from /generate_stream, yielding the text of each token as it arrives.
+    close()
+        Closes all pooled connections and stops the health checks.
+    """
+
+    def __init__(
+        self,
+        api_endpoint: Union[str, List[str], EndpointRouter],
+        pool_size: int = 32,
+        connect_timeout: float = 5.0,
+        read_timeout: float = 300.0,
+        **router_options,
+    ):
+        # A router passed in may be shared with other clients, so only close our own
+        self.owns_router = not isinstance(api_endpoint, EndpointRouter)
+        self.router = (
+            EndpointRouter(api_endpoint, **router_options)
+            if self.owns_router
+            else api_endpoint
+        )
+        self.timeout = (connect_timeout, read_timeout)
+
+        self.session = requests.Session()
+        self.session.headers.update({"Content-Type": "application/json"})
+
+        # pool_block=True makes threads wait for a free connection instead of
+        # opening (and then discarding) extra ones when the pool is exhausted
+        adapter = HTTPAdapter(
+            pool_connections=len(self.router.endpoints),
+            pool_maxsize=pool_size,
+            pool_block=True,
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    @property
+    def api_endpoint(self) -> str:
+        """The first endpoint, for single-endpoint callers."""
+        return self.router.endpoints[0].url
+
+    def generate(self, inputs: str, parameters: dict = None) -> dict:
+        """Sends a request to /generate and returns the decoded JSON response."""
+        with self.router.endpoint() as api_endpoint:
+            response = self.session.post(
+                f"{api_endpoint}/generate",
+                json={"inputs": inputs, "parameters": parameters or {}},
+                timeout=self.timeout,
+            )
+            response.raise_for_status()
+            return response.json()
+
+    def generate_text(self, inputs: str, parameters: dict = None) -> str:
+        """Sends a request to /generate and returns only the generated text."""
+        return self.generate(inputs, parameters).get(
+            "generated_text", "No generated text found"
+        )
+
+    def generate_stream(
+        self,
+        inputs: str,
+        parameters: dict = None,
+        timings: Optional[StreamTimings] = None,
+    ) -> Iterator[str]:
+        """
+        Streams from /generate_stream, yielding the text of each token as it arrives.
+
+        Pass a StreamTimings to record the time-to-first-token and per-token
+        timings. Closing the generator early closes the connection, which makes
+        TGI stop generating.
+        """
+        with self.router.endpoint() as api_endpoint:
+            with self.session.post(
+                f"{api_endpoint}/generate_stream",
+                json={"inputs": inputs, "parameters": parameters or {}},
+                timeout=self.timeout,
+                stream=True,
+            ) as response:
+                response.raise_for_status()
+                for line in response.iter_lines():
+                    event = parse_stream_event(line)
+                    if event is None:
+                        continue
+                    text = stream_token_text(event, timings)
+                    if text:
+                        yield text
+                if timings is not None and timings.total is None:
+                    timings.finish({})
+
+    def close(self):
+        """Closes all pooled connections and stops the health checks."""
+        self.session.close()
+        if self.owns_router:
+            self.router.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class AsyncTGIClient:
+    """
+    An asyncio counterpart of TGIClient, built on a single aiohttp session.
+
+    One event loop can keep hundreds of requests in flight without a thread per
+    request; pool_size caps the number of open connections per endpoint. Must be
+    created and used inside a running event loop, ideally as an async context manager.
+
+    Methods
+    -------
+    generate(inputs: str, parameters: dict)
+        Sends a request to /generate and returns the decoded JSON response.
+    generate_text(inputs: str, parameters: dict)
+        Same as generate, but returns only the generated text.
+    generate_stream(inputs: str, parameters: dict, timings: StreamTimings)
+        Streams from /generate_stream, yielding the text of each token as it arrives.
+    close()
+        Closes the session and all pooled connections.
+    """
+
+    def __init__(
+        self,
+        api_endpoint: Union[str, List[str], EndpointRouter],
+        pool_size: int = 64,
+        connect_timeout: float = 5.0,
+        read_timeout: float = 300.0,
+        **router_options,
+    ):
+        if aiohttp is None:
+            raise ImportError("AsyncTGIClient requires aiohttp: pip install aiohttp")
+
+        # A router passed in may be shared with other clients, so only close our own
+        self.owns_router = not isinstance(api_endpoint, EndpointRouter)
+        self.router = (
+            EndpointRouter(api_endpoint, **router_options)
+            if self.owns_router
+            else api_endpoint
+        )
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=pool_size * len(self.router.endpoints), limit_per_host=pool_size
+            ),
+            timeout=aiohttp.ClientTimeout(
+                sock_connect=connect_timeout, sock_read=read_timeout
+            ),
+            headers={"Content-Type": "application/json"},
+        )
+
+    async def generate(self, inputs: str, parameters: dict = None) -> dict:
+        """Sends a request to /generate and returns the decoded JSON response."""
+        api_endpoint = self.router.acquire()
+        start_time = time.perf_counter()
+        latency, failed = None, False
+        try:
+            async with self.session.post(
+                f"{api_endpoint}/generate",
+                json={"inputs": inputs, "parameters": parameters or {}},
+            ) as response:
+                response.raise_for_status()
+                result = await response.json()
+            latency = time.perf_counter() - start_time
+        except Exception as exc:
+            failed = is_endpoint_failure(exc)
+            raise
+        finally:
+            # Also releases a request cancelled midway (asyncio.CancelledError)
+            self.router.release(api_endpoint, latency, failed)
+        return result
+
+    async def generate_text(self, inputs: str, parameters: dict = None) -> str:
+        """Sends a request to /generate and returns only the generated text."""
+        return (await self.generate(inputs, parameters)).get(
+            "generated_text", "No generated text found"
+        )
+
+    async def generate_stream(
+        self,
+        inputs: str,
+        parameters: dict = None,
+        timings: Optional[StreamTimings] = None,
+    ) -> AsyncIterator[str]:
+        """Streams from /generate_stream, yielding the text of each token as it arrives."""
+        api_endpoint = self.router.acquire()
+        start_time = time.perf_counter()
+        latency, failed = None, False
+        try:
+            async with self.session.post(
+                f"{api_endpoint}/generate_stream",
+                json={"inputs": inputs, "parameters": parameters or {}},
+            ) as response:
+                response.raise_for_status()
+                async for line in response.content:
+                    event = parse_stream_event(line)
+                    if event is None:
+                        continue
+                    text = stream_token_text(event, timings)
+                    if text:
+                        yield text
+                if timings is not None and timings.total is None:
+                    timings.finish({})
+            latency = time.perf_counter() - start_time
+        except Exception as exc:
+            failed = is_endpoint_failure(exc)
+            raise
+        finally:
+            self.router.release(api_endpoint, latency, failed)
+
+    async def close(self):
+        """Closes the session and all pooled connections."""
+        await self.session.close()
+        if self.owns_router:
+            self.router.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
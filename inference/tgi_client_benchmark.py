@@ -0,0 +1,74 @@
+import json
+import time
+import argparse
+import subprocess
+import concurrent.futures
+
+from tgi_client import TGIClient
+from mock_tgi_server import serve_in_background
+
+# Compares requests/sec of the old curl-per-request transport against the pooled
+# TGIClient, using a local mock /generate server so that no GPU is needed.
+# Usage: python tgi_client_benchmark.py --requests 500 --concurrency 8
+
+
+def curl_generate(tgi_api_base, payload):
+    # The transport previously used by the TGI clients: one curl process per request
+    escaped_json_payload = json.dumps(payload).replace("'", "'\\''")
+    curl_command = f"curl -s {tgi_api_base} -X POST -d '{escaped_json_payload}' -H 'Content-Type: application/json'"
+    response = subprocess.run(
+        curl_command, shell=True, check=True, stdout=subprocess.PIPE
+    )
+    return json.loads(response.stdout.decode()).get("generated_text")
+
+
+def run(label, send, total_requests, concurrency):
+    start_time = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(lambda _: send(), range(total_requests)))
+    elapsed = time.perf_counter() - start_time
+
+    requests_per_second = total_requests / elapsed
+    print(
+        f"{label:<8} {total_requests} requests in {elapsed:.2f} seconds, {requests_per_second:.1f} requests/sec"
+    )
+    return requests_per_second
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark curl subprocesses against the pooled TGI client."
+    )
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.0,
+        help="Simulated server latency per request, in seconds.",
+    )
+    args = parser.parse_args()
+
+    server, base_url = serve_in_background(latency=args.latency)
+    payload = {
+        "inputs": "Write a long essay on the topic of spring.",
+        "parameters": {"max_new_tokens": 500, "do_sample": False},
+    }
+
+    before = run(
+        "curl",
+        lambda: curl_generate(base_url + "/generate", payload),
+        args.requests,
+        args.concurrency,
+    )
+
+    with TGIClient(base_url, pool_size=args.concurrency) as client:
+        after = run(
+            "pooled",
+            lambda: client.generate_text(payload["inputs"], payload["parameters"]),
+            args.requests,
+            args.concurrency,
+        )
+
+    print(f"Speed-up: {after / before:.1f}x")
+    server.shutdown()
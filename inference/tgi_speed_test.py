@@ -1,11 +1,14 @@
 import os
-import subprocess
-import json
 import time
+import statistics
+import requests
 from termcolor import colored
 from dotenv import load_dotenv
-from tenacity import retry, wait_random_exponential, stop_after_attempt
-from transformers import AutoTokenizer
+
+from tgi_client import TGIClient, StreamTimings
+from resilience import RetryPolicy, CircuitOpenError
+from token_usage import TokenUsage
+from tokenizer_registry import get_tokenizer
 
 load_dotenv()  # This loads the variables from .env
 
@@ -13,12 +16,17 @@ load_dotenv()  # This loads the variables from .env
 model = os.getenv('MODEL')
 api_endpoint = os.getenv('API_ENDPOINT')
 
-tgi_api_base = api_endpoint + '/generate'
+client = TGIClient(api_endpoint)
+
+# Retries 429s, 503s, timeouts and connection errors with backoff; raises other errors
+retry_policy = RetryPolicy()
 
-tokenizer = AutoTokenizer.from_pretrained(model, trust_remote_code=True)
+# Exact token counts: generated tokens from TGI details, prompt tokens from the
+# tokenizer, which is loaded on first use rather than at import
+token_usage = TokenUsage(load_tokenizer=lambda: get_tokenizer(model))
 
 # # ## Manually adjust the prompt. Not Recommended. Here is Vicuna 1.1 prompt format. System messages not supported.
-# tokenizer.chat_template = "{% set sep = ' ' %}{% set sep2 = '</s>' %}{{ 'A chat between a curious user and an artificial intelligence assistant.\n\nThe assistant gives helpful, detailed, and polite answers to user questions.\n\n' }}{% if messages[0]['role'] == 'system' %}{{ '' }}{% set start_index = 1 %}{% else %}{% set start_index = 0 %}{% endif %}{% for i in range(start_index, messages|length) %}{% if messages[i]['role'] == 'user' %}{{ 'USER:\n' + messages[i]['content'].strip() + (sep if i % 2 == start_index else sep2) }}{% elif messages[i]['role'] == 'assistant' %}{{ 'ASSISTANT:\n' + messages[i]['content'].strip() + (sep if i % 2 == start_index else sep2) }}{% endif %}{% endfor %}{% if add_generation_prompt %}{{ 'ASSISTANT:\n' }}{% endif %}"
+# get_tokenizer(model).chat_template = "{% set sep = ' ' %}{% set sep2 = '</s>' %}{{ 'A chat between a curious user and an artificial intelligence assistant.\n\nThe assistant gives helpful, detailed, and polite answers to user questions.\n\n' }}{% if messages[0]['role'] == 'system' %}{{ '' }}{% set start_index = 1 %}{% else %}{% set start_index = 0 %}{% endif %}{% for i in range(start_index, messages|length) %}{% if messages[i]['role'] == 'user' %}{{ 'USER:\n' + messages[i]['content'].strip() + (sep if i % 2 == start_index else sep2) }}{% elif messages[i]['role'] == 'assistant' %}{{ 'ASSISTANT:\n' + messages[i]['content'].strip() + (sep if i % 2 == start_index else sep2) }}{% endif %}{% endfor %}{% if add_generation_prompt %}{{ 'ASSISTANT:\n' }}{% endif %}"
 
 # # OPTION TO MANUALLY FORMAT MESSAGES (INSTEAD OF USING tokenizer.apply_chat_template)
 # B_SYS = "<<SYS>>\n"
@@ -49,61 +57,86 @@ tokenizer = AutoTokenizer.from_pretrained(model, trust_remote_code=True)
 
     # return formatted_string
 
-@retry(wait=wait_random_exponential(multiplier=1, max=40), stop=stop_after_attempt(3))
 def chat_completion_request_runpod(messages):
     # formatted_messages = format_messages(messages)
 
-    formatted_messages = tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+    formatted_messages = get_tokenizer(model).apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
 
     # print(formatted_messages)
 
-    # Properly escape the string for JSON
-    json_payload = json.dumps({
-        "inputs": formatted_messages,
-        "parameters": {
-            "max_new_tokens": 500,
-            "do_sample": False,
-            # "stop": ["<step>"] #required for codellama 70b
-            }})
+    parameters = {
+        "max_new_tokens": 500,
+        "do_sample": False,
+        "details": True,  # returns the number of generated tokens
+        # "stop": ["<step>"] #required for codellama 70b
+        }
 
     start_time = time.time()  # Start timing
 
-    try:
-        # Execute the curl command
-        curl_command = f"""
-        curl -s {tgi_api_base} \
-            -X POST \
-            -d '{json_payload}' \
-            -H 'Content-Type: application/json'
-        """
-
-        response = subprocess.run(curl_command, shell=True, check=True, stdout=subprocess.PIPE)
-        response_time = time.time() - start_time  # Calculate response time
-
-        response = response.stdout.decode()
-        response = json.loads(response).get("generated_text", "No generated text found")
-
-        # # Log the first and last 25 characters and the response time
-        # print(f"Response Time: {response_time} seconds")
-        # print(f"Start of Response: {response[:25]}")
-        # print(f"End of Response: {response[-25:]}")
-
-        # Calculate tokens per second
-        tokens_generated = len(response)/4  # Assuming each word is a token
-        tokens_per_second = tokens_generated / response_time if response_time > 0 else 0
-        prompt_tokens = chat_response.usage.prompt_tokens if completion_text else 0
-
-        # Print promt and generated tokens, time taken and tokens per second
-        print(f"Total Time: {response_time:.2f} seconds")
-        print(f"Prompt Tokens: {prompt_tokens:.2f}")
-        print(f"Tokens Generated: {tokens_generated:.2f}")
-        print(f"Tokens per Second: {tokens_per_second:.2f}")
-
-        return response
-    except subprocess.CalledProcessError as e:
-        print("Unable to generate ChatCompletion response")
-        print(f"Exception: {e}")
-        return str(e)
+    result = retry_policy.call(client.generate, formatted_messages, parameters)
+    response_time = time.time() - start_time  # Calculate response time
+    response = result.get("generated_text", "No generated text found")
+
+    # # Log the first and last 25 characters and the response time
+    # print(f"Response Time: {response_time} seconds")
+    # print(f"Start of Response: {response[:25]}")
+    # print(f"End of Response: {response[-25:]}")
+
+    # Count this request's tokens now that timing has stopped
+    usage = token_usage.record_request(
+        formatted_messages,
+        response,
+        response_time,
+        completion_tokens=(result.get("details") or {}).get("generated_tokens"),
+    )
+    tokens_per_second = usage["tokens_per_second"]
+
+    # Print promt and generated tokens, time taken and tokens per second
+    print(f"Total Time: {response_time:.2f} seconds")
+    print(f"Prompt Tokens: {usage['prompt_tokens']}")
+    print(f"Tokens Generated: {usage['completion_tokens']}")
+    print(f"Tokens per Second: {tokens_per_second:.2f}")
+
+    return response
+
+def chat_completion_request_runpod_stream(messages):
+    formatted_messages = get_tokenizer(model).apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+
+    parameters = {
+        "max_new_tokens": 500,
+        "do_sample": False,
+        }
+
+    # Records time-to-first-token and the arrival time of every token
+    timings = StreamTimings()
+
+    # Not retried: the tokens already printed cannot be taken back
+    tokens = []
+    for text in client.generate_stream(formatted_messages, parameters, timings):
+        print(text, end="", flush=True)
+        tokens.append(text)
+    print()
+    response = timings.generated_text or "".join(tokens)
+
+    # Count this request's tokens now that timing has stopped
+    usage = token_usage.record_request(
+        formatted_messages,
+        response,
+        timings.total,
+        completion_tokens=(timings.details or {}).get("generated_tokens"),
+    )
+    inter_token_latencies = timings.inter_token_latencies
+
+    # Print time to first token, inter-token latency and decoding speed
+    print(f"Time to First Token: {timings.ttft or 0:.3f} seconds")
+    if inter_token_latencies:
+        print(f"Inter-token Latency: median {statistics.median(inter_token_latencies) * 1000:.1f} ms, max {max(inter_token_latencies) * 1000:.1f} ms")
+    print(f"Total Time: {timings.total:.2f} seconds")
+    print(f"Prompt Tokens: {usage['prompt_tokens']}")
+    print(f"Tokens Generated: {usage['completion_tokens']}")
+    print(f"Tokens per Second (after the first token): {timings.tokens_per_second:.2f}")
+
+    return response
 
 def pretty_print_conversation(messages):
     role_to_color = {
@@ -131,7 +164,18 @@ messages = []
 messages.append({"role": "user", "content": "Write a long essay on the topic of spring."})
 # messages.append({"role": "user", "content": "Write a short piece of python code to add up the first 10 prime fibonacci numbers."})
 
-chat_response = chat_completion_request_runpod(messages)
+# Stream the response to see the time to first token; set to False to use the blocking /generate endpoint
+stream = True
+
+try:
+    if stream:
+        chat_response = chat_completion_request_runpod_stream(messages)
+    else:
+        chat_response = chat_completion_request_runpod(messages)
+except (requests.exceptions.RequestException, CircuitOpenError) as e:
+    print("Unable to generate ChatCompletion response")
+    print(f"Exception: {e}")
+    raise SystemExit(1)
 messages.append({"role": "assistant", "content": chat_response})
 
 pretty_print_conversation(messages)
\ No newline at end of file
@@ -0,0 +1,150 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+
+class TokenUsage:
+    """
+    Exact prompt and completion token counts of a series of timed requests.
+
+    Requests are recorded with their texts and response time only. Texts are
+    tokenized later, in batches of batch_size, by a background thread using the
+    tokenizer the caller has already loaded, so tokenization never runs inside a
+    timed request (nor blocks an event loop). Counts reported by the server (TGI
+    details.generated_tokens, OpenAI usage) are used as-is and not tokenized.
+    Instead of a tokenizer, a load_tokenizer function may be given, which is only
+    called once texts need counting. Safe to share between threads.
+
+    Methods
+    -------
+    record(prompt: str, completion: str, response_time: float, prompt_tokens: int, completion_tokens: int, static_prompt_tokens: int)
+        Records one request; unknown counts are tokenized later.
+    record_request(prompt: str, completion: str, response_time: float, prompt_tokens: int, completion_tokens: int, static_prompt_tokens: int)
+        Records one request, and returns its own usage, tokenized right away.
+    totals()
+        Waits for pending counts and returns the aggregated usage.
+    """
+
+    def __init__(
+        self,
+        tokenizer=None,
+        batch_size: int = 64,
+        load_tokenizer: Optional[Callable[[], object]] = None,
+    ):
+        self.tokenizer = tokenizer
+        self.load_tokenizer = load_tokenizer
+        self.batch_size = batch_size
+        self.lock = threading.Lock()
+        self.pending = []
+        self.batches = []
+        self.executor = ThreadPoolExecutor(max_workers=1)
+
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.response_time = 0.0
+
+    def record(
+        self,
+        prompt: Optional[str],
+        completion: Optional[str],
+        response_time: float,
+        prompt_tokens: Optional[int] = None,
+        completion_tokens: Optional[int] = None,
+        static_prompt_tokens: int = 0,
+    ):
+        """
+        Records one request; counts that are None are tokenized later from the texts.
+
+        static_prompt_tokens are added to the count of the prompt text, for prompts
+        whose static part was tokenized once up front (e.g. a prompt template), so
+        that only the variable part is passed as the prompt and tokenized.
+        """
+        with self.lock:
+            self.requests += 1
+            self.response_time += response_time
+            self.prompt_tokens += static_prompt_tokens
+            self.pending.append(
+                (
+                    prompt if prompt_tokens is None else prompt_tokens,
+                    completion if completion_tokens is None else completion_tokens,
+                )
+            )
+            if len(self.pending) < self.batch_size:
+                return
+            batch, self.pending = self.pending, []
+            self.batches.append(self.executor.submit(self._count, batch))
+
+    def record_request(
+        self,
+        prompt: Optional[str],
+        completion: Optional[str],
+        response_time: float,
+        prompt_tokens: Optional[int] = None,
+        completion_tokens: Optional[int] = None,
+        static_prompt_tokens: int = 0,
+    ) -> dict:
+        """
+        Records one request, and returns its own usage, tokenized right away.
+
+        For reports after each request (e.g. speed tests), where totals() would
+        mix in every earlier request. Counting still runs on the background
+        thread, which loads the tokenizer.
+        """
+        prompt_tokens, completion_tokens = self.executor.submit(
+            lambda: (
+                self._count_texts([prompt if prompt_tokens is None else prompt_tokens])
+                + static_prompt_tokens,
+                self._count_texts([completion if completion_tokens is None else completion_tokens]),
+            )
+        ).result()
+        self.record(None, None, response_time, prompt_tokens, completion_tokens)
+        return {
+            "requests": 1,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "response_time": response_time,
+            "tokens_per_second": completion_tokens / response_time if response_time else 0.0,
+        }
+
+    def totals(self) -> dict:
+        """Waits for pending counts and returns the aggregated usage."""
+        with self.lock:
+            batch, self.pending = self.pending, []
+            batches, self.batches = self.batches, []
+        if batch:
+            batches.append(self.executor.submit(self._count, batch))
+        for future in batches:
+            future.result()
+
+        with self.lock:
+            return {
+                "requests": self.requests,
+                "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens,
+                "response_time": self.response_time,
+                # Per-request decoding speed; concurrent requests overlap in time
+                "tokens_per_second": self.completion_tokens / self.response_time
+                if self.response_time
+                else 0.0,
+            }
+
+    def _count(self, batch):
+        prompt_tokens = self._count_texts([prompt for prompt, _ in batch])
+        completion_tokens = self._count_texts([completion for _, completion in batch])
+        with self.lock:
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+
+    def _count_texts(self, items):
+        # Items are either a count already known, or a text (None if missing)
+        total = sum(item for item in items if isinstance(item, int))
+        texts = [item for item in items if isinstance(item, str) and item]
+        if texts and self.tokenizer is None and self.load_tokenizer is not None:
+            # Counting runs on the single background thread, so this loads once
+            self.tokenizer = self.load_tokenizer()
+        if texts and self.tokenizer is not None:
+            # Chat-formatted prompts already contain any special tokens
+            token_ids = self.tokenizer(texts, add_special_tokens=False)["input_ids"]
+            total += sum(len(ids) for ids in token_ids)
+        return total
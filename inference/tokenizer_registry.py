@@ -0,0 +1,44 @@
+import os
+import threading
+from typing import Dict, Optional
+
+# transformers takes from one to several seconds to import, so it is only
+# imported when a tokenizer is first needed, e.g. not for --help
+
+_tokenizers: Dict[str, object] = {}
+_lock = threading.Lock()
+
+
+def get_tokenizer(model: Optional[str] = None, trust_remote_code: bool = True):
+    """
+    Returns the tokenizer of a model, loaded on first use and shared by the whole process.
+
+    model defaults to the MODEL environment variable. Concurrent first calls load
+    the tokenizer only once.
+    """
+    model = model or os.getenv("MODEL")
+    if not model:
+        raise ValueError("No model given, and the MODEL environment variable is not set")
+
+    tokenizer = _tokenizers.get(model)
+    if tokenizer is None:
+        with _lock:
+            tokenizer = _tokenizers.get(model)
+            if tokenizer is None:
+                tokenizer = _tokenizers[model] = load_tokenizer(model, trust_remote_code)
+    return tokenizer
+
+
+def load_tokenizer(model: str, trust_remote_code: bool = True):
+    """
+    Loads the fast tokenizer of a model through AutoTokenizer.
+
+    AutoTokenizer resolves the model's own tokenizer class (tokenizer_class in
+    tokenizer_config.json), its special tokens and any remote code, so that
+    token counts and chat templates match what the model expects.
+    """
+    from transformers import AutoTokenizer
+
+    return AutoTokenizer.from_pretrained(
+        model, use_fast=True, trust_remote_code=trust_remote_code
+    )
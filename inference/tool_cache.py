@@ -0,0 +1,116 @@
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Hashable
+
+
+class ToolResultCache:
+    """
+    Caches the results of one deterministic tool, and coalesces identical calls in flight.
+
+    Results are kept for ttl seconds, up to max_entries (least recently used
+    first out). While a call is running, identical calls (same key) wait for its
+    result instead of calling the backend again, across threads and event loops.
+    Exceptions are passed to every waiting call and are not cached. Safe to
+    share between threads.
+
+    Attributes
+    ----------
+    hits : int
+        calls answered from the cache
+    misses : int
+        calls that ran the tool
+    coalesced : int
+        calls that waited for an identical call in flight
+
+    Methods
+    -------
+    call(key: Hashable, compute: Callable)
+        Returns the cached result of key, or computes it once.
+    call_async(key: Hashable, compute: Callable)
+        The asyncio counterpart of call, for async tools.
+    """
+
+    def __init__(self, ttl: float = 300.0, max_entries: int = 1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # key -> (expiry time, result)
+        self.in_flight = {}  # key -> Future of the call running
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def _lookup(self, key):
+        # Returns ("hit", result), ("wait", Future of the identical call in flight),
+        # or ("run", new Future) when the caller is to run the tool and set it
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                if entry[0] > time.monotonic():
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return "hit", entry[1]
+                del self.entries[key]
+
+            future = self.in_flight.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return "wait", future
+            self.misses += 1
+            future = self.in_flight[key] = Future()
+            return "run", future
+
+    def _finish(self, key, future, result=None, exc=None):
+        with self.lock:
+            del self.in_flight[key]
+            if exc is None:
+                self.entries[key] = (time.monotonic() + self.ttl, result)
+                self.entries.move_to_end(key)
+                while len(self.entries) > self.max_entries:
+                    self.entries.popitem(last=False)
+        if exc is None:
+            future.set_result(result)
+        else:
+            future.set_exception(exc)
+
+    def call(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        """Returns the cached result of key, or computes it once."""
+        action, value = self._lookup(key)
+        if action == "hit":
+            return value
+        if action == "wait":
+            return value.result()
+        try:
+            result = compute()
+        except BaseException as exc:
+            self._finish(key, value, exc=exc)
+            raise
+        self._finish(key, value, result)
+        return result
+
+    async def call_async(self, key: Hashable, compute: Callable[[], Awaitable]) -> Any:
+        """The asyncio counterpart of call, for async tools."""
+        action, value = self._lookup(key)
+        if action == "hit":
+            return value
+        if action == "wait":
+            return await asyncio.wrap_future(value)
+        try:
+            result = await compute()
+        except BaseException as exc:
+            self._finish(key, value, exc=exc)
+            raise
+        self._finish(key, value, result)
+        return result
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "entries": len(self.entries),
+            }
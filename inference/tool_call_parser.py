@@ -0,0 +1,147 @@
+import re
+import json
+from typing import Any, Container, Dict, Iterator, List, Optional
+
+try:
+    import orjson
+except ImportError:  # optional, several times faster than json for tool-call sized documents
+    orjson = None
+
+# orjson and json both raise ValueError subclasses on invalid JSON
+json_loads = orjson.loads if orjson is not None else json.loads
+
+# Where a JSON object or array may start, and the characters that matter inside one
+JSON_OPEN = re.compile(r"[{\[]")
+JSON_STRUCTURE = re.compile(r'[{}\[\]"\\]')
+
+
+def match_brackets(text: str, start: int, ends: Dict[int, Optional[int]]) -> None:
+    """
+    Finds where the object or array opening at start ends, and where every
+    bracket opening inside it does, recording in ends the index just past each
+    one (None if it is not closed).
+
+    Only brackets, quotes and backslashes are visited (found by a regex), so
+    text between them is skipped at C speed. Brackets are only counted, not
+    matched by kind: the JSON parser checks the candidates. A bracket opening
+    inside the candidate ends where a scan starting from it would, since that
+    scan would see the same strings, so it is never scanned again.
+    """
+    stack = []
+    in_string = False
+    escaped = -1  # index of the character escaped by the last backslash
+    for match in JSON_STRUCTURE.finditer(text, start):
+        index = match.start()
+        if index == escaped:
+            continue
+        char = match.group()
+        if in_string:
+            if char == "\\":
+                escaped = index + 1
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in "{[":
+            stack.append(index)
+        elif char in "}]":
+            ends[stack.pop()] = index + 1
+            if not stack:
+                return
+    for index in stack:
+        ends[index] = None
+
+
+def iter_json_values(text: str) -> Iterator[Any]:
+    """
+    Yields the JSON objects and arrays found anywhere in text, bare or in ``` fences.
+
+    Each value is parsed once its closing bracket is found, and the scan resumes
+    after it. When a candidate is not valid JSON (e.g. braces in prose) or is
+    never closed (e.g. truncated output), the scan resumes just after its
+    opening bracket, so that a value nested in it is still found; the ends of
+    the brackets inside are already known then (see match_brackets), so the
+    text is not scanned again. Only brackets that the scan saw inside a string
+    (e.g. after a stray quote in prose) are scanned from again.
+    """
+    ends: Dict[int, Optional[int]] = {}
+    position = 0
+    while True:
+        match = JSON_OPEN.search(text, position)
+        if match is None:
+            return
+        start = match.start()
+        if start not in ends:
+            match_brackets(text, start, ends)
+        end = ends[start]
+        if end is not None:
+            try:
+                value = json_loads(text[start:end])
+            except ValueError:
+                pass
+            else:
+                yield value
+                position = end
+                continue
+        position = start + 1
+
+
+def normalize_tool_call(
+    value: Any, tool_names: Optional[Container[str]] = None
+) -> Optional[dict]:
+    """
+    Returns {"name": ..., "arguments": {...}} for a tool call, or None for any other value.
+
+    Accepts {"name": ..., "arguments": ...} ("parameters" also goes) and the
+    OpenAI form {"function": {"name": ..., "arguments": "<JSON string>"}};
+    arguments given as a JSON string are decoded. With tool_names, an object
+    is a call when its name is one of them, and missing arguments are taken as
+    {} (a tool without parameters). Without them, an object needs arguments to
+    count as a call, so that an answer such as {"name": "Warren Buffett", ...}
+    is not mistaken for one.
+    """
+    if not isinstance(value, dict):
+        return None
+    if isinstance(value.get("function"), dict) and "name" not in value:
+        value = value["function"]
+    name = value.get("name")
+    if not isinstance(name, str):
+        return None
+    if tool_names is not None and name not in tool_names:
+        return None
+    arguments = value.get("arguments", value.get("parameters"))
+    if arguments is None:
+        if tool_names is None:
+            return None
+        arguments = {}
+    if isinstance(arguments, str):
+        try:
+            arguments = json_loads(arguments) if arguments.strip() else {}
+        except ValueError:
+            pass  # left as is, for the registry to reject
+    return {"name": name, "arguments": arguments}
+
+
+def parse_tool_calls(
+    response: str, tool_names: Optional[Container[str]] = None
+) -> Optional[List[dict]]:
+    """
+    Returns the tool calls of a model response, or None for a plain answer.
+
+    Calls are found anywhere in the response, bare or in ``` fences, after
+    prose or between several fenced blocks: each JSON value that is a call
+    object, a list of call objects, or an object with a "tool_calls" list
+    counts. JSON that is not a call (e.g. an answer given as JSON) does not.
+    Pass the names of the available tools as tool_names (see normalize_tool_call).
+    """
+    if not response:
+        return None
+    calls = []
+    for value in iter_json_values(response):
+        if isinstance(value, dict) and isinstance(value.get("tool_calls"), list):
+            value = value["tool_calls"]
+        for item in value if isinstance(value, list) else [value]:
+            call = normalize_tool_call(item, tool_names)
+            if call is not None:
+                calls.append(call)
+    return calls or None
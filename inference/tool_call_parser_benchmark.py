@@ -0,0 +1,115 @@
+import json
+import time
+import random
+import argparse
+
+import tool_call_parser
+from tool_call_parser import parse_tool_calls
+
+# Measures tool-call detection on a synthetic corpus of realistic model outputs
+# (bare and fenced JSON, calls after prose, several calls, OpenAI-style calls
+# with string arguments, a tool without parameters, plain and JSON answers,
+# braces in prose), comparing the former check (the whole response in a ```json
+# fence or bare, then json.loads) with tool_call_parser, with the orjson and
+# json backends. A response counts as parsed right when exactly its calls are
+# found; every miss costs an extra model round trip.
+# Usage: python tool_call_parser_benchmark.py --responses 20000
+
+TOOL_NAMES = {"get_current_weather", "get_time"}
+CITIES = ["London", "Dublin", "Paris", "San Francisco", "Tokyo", "Nairobi"]
+
+
+def call(city, days=None):
+    arguments = {"city": city} if days is None else {"city": city, "days": days}
+    return {"name": "get_current_weather", "arguments": arguments}
+
+
+def make_corpus(responses, seed=0):
+    """Returns (response, expected calls) pairs."""
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(responses):
+        a, b = rng.sample(CITIES, 2)
+        kind = rng.randrange(12)
+        if kind == 0:
+            expected = [call(a)]
+            text = json.dumps(expected[0])
+        elif kind == 1:
+            expected = [call(a)]
+            text = f"```json\n{json.dumps(expected[0], indent=4)}\n```"
+        elif kind == 2:
+            expected = [call(a)]
+            text = f"Sure! I'll check the weather first.\n```json\n{json.dumps(expected[0])}\n```"
+        elif kind == 3:
+            expected = [call(a), call(b)]
+            text = json.dumps(expected)
+        elif kind == 4:
+            expected = [call(a), call(b)]
+            text = (
+                f"```json\n{json.dumps(expected[0])}\n```\n"
+                f"and\n```json\n{json.dumps(expected[1])}\n```"
+            )
+        elif kind == 5:
+            expected = [call(a, 3)]
+            openai_call = {
+                "type": "function",
+                "function": {"name": "get_current_weather", "arguments": json.dumps(expected[0]["arguments"])},
+            }
+            text = json.dumps({"tool_calls": [openai_call]})
+        elif kind == 6:
+            expected = [call(a)]
+            text = f"```\n{json.dumps(expected[0])}\n```\nLet me know if you need anything else."
+        elif kind == 7:
+            expected = None
+            text = f"The weather in {a} is cloudy, 15 C. Wear a light jacket."
+        elif kind == 8:
+            expected = None
+            text = f"In Python, use a dict like {{city: {a!r}}} or a set {{1, 2}} [see docs]."
+        elif kind == 9:
+            expected = None
+            text = json.dumps({"name": "Warren Buffett", "organisations": ["Berkshire Hathaway"]})
+        elif kind == 10:
+            expected = [call(a)]
+            text = f"Checking :{{ hmm, here it is: {json.dumps(expected[0])}"
+        else:
+            expected = [{"name": "get_time", "arguments": {}}]
+            text = '```json\n{"name": "get_time"}\n```'
+        corpus.append((text, expected))
+    return corpus
+
+
+def parse_strict(response, tool_names=None):
+    # The check of the function-calling clients before tool_call_parser
+    if response.startswith("```json") and response.endswith("```"):
+        response = response[7:-3].strip()
+    try:
+        data = json.loads(response)
+    except json.JSONDecodeError:
+        return None
+    if isinstance(data, dict) and data.get("name") is not None:
+        return [{"name": data["name"], "arguments": data.get("arguments", {})}]
+    return None
+
+
+def measure(label, parse, corpus):
+    start_time = time.perf_counter()
+    results = [parse(text, TOOL_NAMES) for text, _ in corpus]
+    elapsed = time.perf_counter() - start_time
+    correct = sum(result == expected for result, (_, expected) in zip(results, corpus))
+    print(
+        f"{label:<20} {correct / len(corpus):.1%} parsed right, "
+        f"{elapsed / len(corpus) * 1e6:.1f} us per response"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure tool-call parsing.")
+    parser.add_argument("--responses", type=int, default=20000)
+    args = parser.parse_args()
+
+    corpus = make_corpus(args.responses)
+    measure("strict (before)", parse_strict, corpus)
+    if tool_call_parser.orjson is not None:
+        measure("parser (orjson)", parse_tool_calls, corpus)
+    tool_call_parser.json_loads = json.loads
+    measure("parser (json)", parse_tool_calls, corpus)
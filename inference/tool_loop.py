@@ -0,0 +1,152 @@
+import json
+import asyncio
+import inspect
+import threading
+import concurrent.futures
+from typing import Any, Callable, Container, List, Optional
+
+from tool_call_parser import parse_tool_calls
+
+# Sync tools run on this pool, shared by every turn; async tools run on the event loop
+tool_executor = concurrent.futures.ThreadPoolExecutor(max_workers=8, thread_name_prefix="tool")
+
+# The event loop of synchronous callers, started on first use and shared by every turn
+_event_loop: Optional[asyncio.AbstractEventLoop] = None
+_event_loop_lock = threading.Lock()
+
+
+def get_event_loop() -> asyncio.AbstractEventLoop:
+    """
+    Returns the event loop that runs the tool loop for synchronous callers.
+
+    It runs on its own daemon thread, so that synchronous code can wait on it
+    even when its own thread already runs an event loop (e.g. in Jupyter),
+    where asyncio.run() raises.
+    """
+    global _event_loop
+    with _event_loop_lock:
+        if _event_loop is None:
+            _event_loop = asyncio.new_event_loop()
+            threading.Thread(
+                target=_event_loop.run_forever, name="tool-loop", daemon=True
+            ).start()
+    return _event_loop
+
+
+def run_sync(coroutine):
+    """Runs a coroutine on the shared event loop and waits for its result."""
+    return asyncio.run_coroutine_threadsafe(coroutine, get_event_loop()).result()
+
+
+def format_result(result: Any) -> str:
+    return result if isinstance(result, str) else json.dumps(result, indent=4)
+
+
+async def execute_tool_calls_async(
+    calls: List[dict],
+    execute: Callable[[dict], Any],
+    timeout: Optional[float] = None,
+    executor: Optional[concurrent.futures.Executor] = None,
+) -> List[str]:
+    """
+    Runs the tool calls of one model turn concurrently, and returns their results in call order.
+
+    execute(call) runs on a thread pool; when it returns an awaitable (an async
+    tool), that is awaited on the event loop. Calls still running after timeout
+    seconds are given up on: async ones are cancelled, and their result is an
+    error message.
+    """
+    loop = asyncio.get_running_loop()
+
+    async def run(call):
+        try:
+            result = await loop.run_in_executor(executor or tool_executor, execute, call)
+            if inspect.isawaitable(result):
+                result = await result
+        except Exception as exc:
+            return f"Error: function {call.get('name')} raised {exc!r}"
+        return format_result(result)
+
+    tasks = [asyncio.ensure_future(run(call)) for call in calls]
+    done, pending = await asyncio.wait(tasks, timeout=timeout)
+    for task in pending:
+        task.cancel()
+    return [
+        task.result()
+        if task in done
+        else f"Error: function {call.get('name')} timed out after {timeout} seconds"
+        for call, task in zip(calls, tasks)
+    ]
+
+
+def execute_tool_calls(
+    calls: List[dict],
+    execute: Callable[[dict], Any],
+    timeout: Optional[float] = None,
+    executor: Optional[concurrent.futures.Executor] = None,
+) -> List[str]:
+    """Runs execute_tool_calls_async from synchronous code, on the shared event loop."""
+    return run_sync(execute_tool_calls_async(calls, execute, timeout, executor))
+
+
+def run_tool_loop(
+    messages: List[dict],
+    generate: Callable[[List[dict]], str],
+    execute: Callable[[dict], Any],
+    max_turns: int = 3,
+    turn_timeout: Optional[float] = 30.0,
+    tool_names: Optional[Container[str]] = None,
+) -> Optional[str]:
+    """Runs run_tool_loop_async from synchronous code, on the shared event loop."""
+    return run_sync(
+        run_tool_loop_async(messages, generate, execute, max_turns, turn_timeout, tool_names)
+    )
+
+
+async def run_tool_loop_async(
+    messages: List[dict],
+    generate: Callable[[List[dict]], Any],
+    execute: Callable[[dict], Any],
+    max_turns: int = 3,
+    turn_timeout: Optional[float] = 30.0,
+    tool_names: Optional[Container[str]] = None,
+) -> Optional[str]:
+    """
+    Alternates model turns and tool calls until the model answers, appending to messages.
+
+    Each turn sends the transcript to generate(messages) once (awaited if it is
+    a coroutine function, otherwise run on the default executor, so that the
+    event loop is not blocked). When the response calls tools, every call of
+    the turn runs concurrently (see execute_tool_calls_async), and the calls
+    (one "function_call" message) and their results (one "function_response"
+    message each, in call order) are appended before the next turn. A response
+    without tool calls is appended as the assistant's answer and returned.
+    Returns None after max_turns turns without an answer. tool_names, the names
+    of the available tools, lets calls of tools without parameters omit their
+    arguments (see parse_tool_calls).
+
+    Async callers (e.g. a notebook cell) await this directly; run_tool_loop
+    runs it for synchronous ones.
+    """
+    loop = asyncio.get_running_loop()
+    for _ in range(max_turns):
+        if inspect.iscoroutinefunction(generate):
+            response = await generate(messages)
+        else:
+            response = await loop.run_in_executor(None, generate, messages)
+        calls = parse_tool_calls(response, tool_names)
+        if calls is None:
+            messages.append({"role": "assistant", "content": response})
+            return response
+
+        messages.append(
+            {
+                "role": "function_call",
+                "content": json.dumps(calls[0] if len(calls) == 1 else calls, indent=4),
+            }
+        )
+        for result in await execute_tool_calls_async(calls, execute, turn_timeout):
+            messages.append({"role": "function_response", "content": result})
+
+    print("Maximum number of turns reached")
+    return None
@@ -0,0 +1,248 @@
+import json
+import time
+import inspect
+import importlib
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+from tool_cache import ToolResultCache
+
+# Python types accepted for each JSON schema type; bool is not a number in JSON
+JSON_TYPES = {
+    "string": (str,),
+    "number": (int, float),
+    "integer": (int,),
+    "boolean": (bool,),
+    "array": (list, tuple),
+    "object": (dict,),
+    "null": (type(None),),
+}
+
+
+def compile_argument_validator(parameters: dict) -> Callable[[Any], Optional[str]]:
+    """
+    Compiles the "parameters" JSON schema of a tool into a validator of call arguments.
+
+    The validator returns None for valid arguments, or an error message. It
+    checks that the arguments are an object, that required properties are given
+    and no others, and the type and enum of each property. The schema is read
+    once, here, rather than on every call.
+    """
+    properties = parameters.get("properties", {})
+    required = frozenset(parameters.get("required", ()))
+    allowed = frozenset(properties)
+    expected = ", ".join(properties)
+    checks = {}
+    for name, schema in properties.items():
+        types = schema.get("type")
+        types = [types] if isinstance(types, str) else types or []
+        python_types = tuple(t for json_type in types for t in JSON_TYPES.get(json_type, ()))
+        enum = schema.get("enum")
+        checks[name] = (python_types, "boolean" not in types, enum)
+
+    def validate(arguments):
+        if not isinstance(arguments, dict):
+            return "Error: Invalid arguments format"
+        keys = arguments.keys()
+        if not keys <= allowed or not required <= keys:
+            return f"Error: Incorrect argument keys. Expected: {expected}"
+        for name, value in arguments.items():
+            python_types, reject_bool, enum = checks[name]
+            if python_types and (
+                not isinstance(value, python_types) or (reject_bool and isinstance(value, bool))
+            ):
+                return f"Error: Incorrect arguments provided. {name} has the wrong type"
+            if enum is not None and value not in enum:
+                return f"Error: Incorrect arguments provided. {name} must be one of {enum}"
+        return None
+
+    return validate
+
+
+class Tool:
+    """
+    One tool of the registry: its tools.json entry, its function once imported,
+    its argument validator and timing counters, and its result cache if any.
+
+    A tool is cached when its tools.json entry has
+    "cache": {"cacheable": true, "ttl": <seconds>, "max_entries": <entries>}
+    next to "function" (only for tools whose result depends on nothing but
+    their arguments). Calls are keyed on their arguments with the function's
+    defaults filled in, so {"city": "London"} and {"city": "London", "format":
+    "celsius"} share an entry.
+
+    Attributes
+    ----------
+    calls : int
+        executions of the function
+    errors : int
+        calls rejected by the validator, and executions that raised
+    total_time : float
+        seconds spent in the function, over every call
+    cache : ToolResultCache or None
+        the result cache, for cacheable tools
+    """
+
+    def __init__(self, spec: dict, package: str):
+        self.spec = spec
+        self.name = spec["function"]["name"]
+        self.module_name = f"{package}.{self.name}"
+        self.validate = compile_argument_validator(spec["function"].get("parameters", {}))
+        self.function = None
+        self.signature = None
+        cache = spec.get("cache") or {}
+        self.cache = (
+            ToolResultCache(cache.get("ttl", 300.0), cache.get("max_entries", 1024))
+            if cache.get("cacheable")
+            else None
+        )
+        self.calls = 0
+        self.errors = 0
+        self.total_time = 0.0
+
+    def cache_key(self, arguments: dict) -> str:
+        """Canonical form of a call's arguments: defaults filled in, keys sorted."""
+        try:
+            bound = self.signature.bind(**arguments)
+            bound.apply_defaults()
+            arguments = bound.arguments
+        except TypeError:
+            pass
+        return json.dumps(arguments, sort_keys=True, separators=(",", ":"), default=str)
+
+
+class ToolRegistry:
+    """
+    The tools of a tools.json file, imported lazily on first use.
+
+    tools.json is read once. The function of a tool is imported from
+    package.<name> the first time the tool is called, so that startup does not
+    import every tool of a large catalog. Arguments are checked by a validator
+    compiled from the tool's JSON schema when the registry is created, instead
+    of inspecting the function's signature on every call. Safe to share between
+    threads.
+
+    Attributes
+    ----------
+    tools : List[dict]
+        the entries of tools.json without their cache settings, e.g. for the
+        function metadata of a prompt
+
+    Methods
+    -------
+    execute(call: dict)
+        Runs a {"name": ..., "arguments": {...}} call, returns its result or an error message.
+    function(name: str)
+        Returns the function of a tool, importing it on first use.
+    stats()
+        Returns the calls, errors and timings of every tool called so far.
+    """
+
+    def __init__(self, tools_file: str = "./functions/tools.json", package: str = "functions"):
+        with open(tools_file, "r") as file:
+            specs = json.load(file)
+        self.by_name: Dict[str, Tool] = {
+            tool.name: tool
+            for tool in (Tool(spec, package) for spec in specs if spec["type"] == "function")
+        }
+        # Cache settings are for the registry, not for the model
+        self.tools = [
+            {key: value for key, value in spec.items() if key != "cache"} for spec in specs
+        ]
+        self.lock = threading.Lock()
+        self.import_lock = threading.Lock()
+
+    def function(self, name: str) -> Callable:
+        """Returns the function of a tool, importing it on first use."""
+        tool = self.by_name[name]
+        if tool.function is None:
+            with self.import_lock:
+                if tool.function is None:
+                    module = importlib.import_module(tool.module_name)
+                    function = getattr(module, name)
+                    tool.signature = inspect.signature(function)
+                    tool.function = function
+        return tool.function
+
+    def execute(self, call: dict) -> Any:
+        """
+        Runs a {"name": ..., "arguments": {...}} call, returns its result or an error message.
+
+        For an async tool, returns an awaitable of the result.
+        """
+        name = call.get("name")
+        tool = self.by_name.get(name)
+        if tool is None:
+            return f"Error: function {name} does not exist"
+        arguments = call.get("arguments", {})
+        error = tool.validate(arguments)
+        if error is not None:
+            self._record(tool, 0.0, failed=True, counted=False)
+            return error
+
+        function = self.function(name)
+        if inspect.iscoroutinefunction(function):
+            if tool.cache is not None:
+                return tool.cache.call_async(
+                    tool.cache_key(arguments),
+                    lambda: self._execute_async(tool, function, arguments),
+                )
+            return self._execute_async(tool, function, arguments)
+        if tool.cache is not None:
+            return tool.cache.call(
+                tool.cache_key(arguments), lambda: self._execute(tool, function, arguments)
+            )
+        return self._execute(tool, function, arguments)
+
+    def _execute(self, tool, function, arguments):
+        start_time = time.perf_counter()
+        try:
+            result = function(**arguments)
+        except Exception:
+            self._record(tool, time.perf_counter() - start_time, failed=True)
+            raise
+        self._record(tool, time.perf_counter() - start_time)
+        return result
+
+    async def _execute_async(self, tool, function, arguments):
+        start_time = time.perf_counter()
+        try:
+            result = await function(**arguments)
+        except Exception:
+            self._record(tool, time.perf_counter() - start_time, failed=True)
+            raise
+        self._record(tool, time.perf_counter() - start_time)
+        return result
+
+    def _record(self, tool, elapsed, failed=False, counted=True):
+        with self.lock:
+            tool.calls += counted
+            tool.errors += failed
+            tool.total_time += elapsed
+
+    def stats(self) -> Dict[str, dict]:
+        """Returns the calls, errors and timings of every tool called so far."""
+        with self.lock:
+            return {
+                tool.name: {
+                    "calls": tool.calls,
+                    "errors": tool.errors,
+                    "total_time": tool.total_time,
+                    "mean_time": tool.total_time / tool.calls if tool.calls else 0.0,
+                }
+                for tool in self.by_name.values()
+                if tool.calls or tool.errors
+            }
+
+    def print_stats(self):
+        for name, stats in self.stats().items():
+            print(
+                f"Tool {name}: {stats['calls']} calls, {stats['errors']} errors, "
+                f"mean {stats['mean_time'] * 1000:.2f} ms"
+            )
+        for tool in self.by_name.values():
+            if tool.cache is not None and (tool.cache.hits or tool.cache.coalesced):
+                print(
+                    f"Tool {tool.name} cache: {tool.cache.hits} hits, "
+                    f"{tool.cache.coalesced} coalesced with a call in flight"
+                )
@@ -0,0 +1,173 @@
+import os
+import sys
+import json
+import time
+import inspect
+import argparse
+import tempfile
+import importlib
+import concurrent.futures
+
+from tool_registry import ToolRegistry
+
+# Compares tool loading and dispatch with and without the ToolRegistry, over a
+# synthetic catalog of --tools tools, each in its own module importing
+# --imports_per_tool standard library modules (as real tools import clients and
+# parsers). "Eager" imports every tool at startup and checks the arguments of
+# each call against inspect.signature, as the function-calling clients did; the
+# registry imports a tool on its first call and validates arguments with a
+# validator compiled from the tool's JSON schema. Each mode runs in a fresh
+# package, so that imports are not shared. Then compares a slow tool with and
+# without its result cache, over --conversations concurrent conversations
+# asking about --cities cities.
+# Usage: python tool_registry_benchmark.py --tools 500 --calls 100000 --conversations 32
+
+STDLIB_MODULES = ["decimal", "fractions", "statistics", "difflib", "textwrap", "csv", "uuid"]
+
+
+def write_catalog(directory, package, tools, imports_per_tool):
+    os.makedirs(os.path.join(directory, package))
+    open(os.path.join(directory, package, "__init__.py"), "w").close()
+    specs = []
+    for i in range(tools):
+        name = f"tool_{i}"
+        imports = "".join(
+            f"import {STDLIB_MODULES[(i + j) % len(STDLIB_MODULES)]}\n"
+            for j in range(imports_per_tool)
+        )
+        with open(os.path.join(directory, package, f"{name}.py"), "w") as file:
+            file.write(f"{imports}\n\ndef {name}(city, days=1):\n    return {{'city': city, 'days': days}}\n")
+        specs.append(
+            {
+                "type": "function",
+                "function": {
+                    "name": name,
+                    "description": f"Synthetic tool {i}",
+                    "parameters": {
+                        "type": "object",
+                        "properties": {
+                            "city": {"type": "string"},
+                            "days": {"type": "integer"},
+                        },
+                        "required": ["city"],
+                    },
+                },
+            }
+        )
+    tools_file = os.path.join(directory, package, "tools.json")
+    with open(tools_file, "w") as file:
+        json.dump(specs, file)
+    return tools_file
+
+
+def write_slow_tool(directory, package, backend_latency, cache):
+    os.makedirs(os.path.join(directory, package))
+    open(os.path.join(directory, package, "__init__.py"), "w").close()
+    with open(os.path.join(directory, package, "get_weather.py"), "w") as file:
+        file.write(
+            "import time\n\n\ndef get_weather(city):\n"
+            f"    time.sleep({backend_latency})\n    return {{'city': city, 'temperature': '15 C'}}\n"
+        )
+    spec = {
+        "type": "function",
+        "function": {
+            "name": "get_weather",
+            "parameters": {"type": "object", "properties": {"city": {"type": "string"}}},
+        },
+    }
+    if cache:
+        spec["cache"] = {"cacheable": True, "ttl": 300, "max_entries": 1024}
+    tools_file = os.path.join(directory, package, "tools.json")
+    with open(tools_file, "w") as file:
+        json.dump([spec], file)
+    return tools_file
+
+
+def eager_execute(call, functions):
+    # The dispatch of the function-calling clients before the registry
+    func = functions[call["name"]]
+    arguments = call.get("arguments", {})
+    if set(arguments) <= set(inspect.signature(func).parameters):
+        return func(**arguments)
+    return "Error: Incorrect argument keys"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure tool loading and dispatch.")
+    parser.add_argument("--tools", type=int, default=500)
+    parser.add_argument("--imports_per_tool", type=int, default=3)
+    parser.add_argument("--calls", type=int, default=100000)
+    parser.add_argument(
+        "--tools_used", type=int, default=5, help="Distinct tools the calls go to."
+    )
+    parser.add_argument("--conversations", type=int, default=32)
+    parser.add_argument("--turns", type=int, default=4, help="Tool calls per conversation.")
+    parser.add_argument("--cities", type=int, default=4)
+    parser.add_argument("--backend_latency", type=float, default=0.05)
+    args = parser.parse_args()
+
+    # Imported up front, so that neither mode pays for the standard library modules
+    for module in STDLIB_MODULES:
+        importlib.import_module(module)
+
+    directory = tempfile.mkdtemp()
+    sys.path.insert(0, directory)
+    calls = [
+        {"name": f"tool_{i % args.tools_used}", "arguments": {"city": "Dublin", "days": 2}}
+        for i in range(args.calls)
+    ]
+
+    # Eager: import every tool, then inspect the signature on every call
+    tools_file = write_catalog(directory, "eager_tools", args.tools, args.imports_per_tool)
+    start_time = time.perf_counter()
+    with open(tools_file) as file:
+        tools = json.load(file)
+    functions = {
+        tool["function"]["name"]: getattr(
+            importlib.import_module(f"eager_tools.{tool['function']['name']}"),
+            tool["function"]["name"],
+        )
+        for tool in tools
+    }
+    startup = time.perf_counter() - start_time
+    start_time = time.perf_counter()
+    for call in calls:
+        eager_execute(call, functions)
+    dispatch = time.perf_counter() - start_time
+    print(
+        f"eager     startup {startup * 1000:.1f} ms, "
+        f"dispatch {dispatch / args.calls * 1e6:.2f} us per call"
+    )
+
+    # Registry: read tools.json, import tools on first use, compiled validators
+    tools_file = write_catalog(directory, "registry_tools", args.tools, args.imports_per_tool)
+    start_time = time.perf_counter()
+    registry = ToolRegistry(tools_file, package="registry_tools")
+    startup = time.perf_counter() - start_time
+    start_time = time.perf_counter()
+    for call in calls:
+        registry.execute(call)
+    dispatch = time.perf_counter() - start_time
+    print(
+        f"registry  startup {startup * 1000:.1f} ms, "
+        f"dispatch {dispatch / args.calls * 1e6:.2f} us per call "
+        f"(including {args.tools_used} first-use imports)"
+    )
+
+    # Result cache: concurrent conversations calling a slow tool for a few cities
+    for cache in [False, True]:
+        package = "cached_tools" if cache else "uncached_tools"
+        tools_file = write_slow_tool(directory, package, args.backend_latency, cache)
+        registry = ToolRegistry(tools_file, package=package)
+        calls = [
+            {"name": "get_weather", "arguments": {"city": f"city_{i % args.cities}"}}
+            for i in range(args.conversations * args.turns)
+        ]
+        start_time = time.perf_counter()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=args.conversations) as executor:
+            list(executor.map(registry.execute, calls))
+        elapsed = time.perf_counter() - start_time
+        print(
+            f"{'cached' if cache else 'uncached':<9} {len(calls)} calls, "
+            f"{registry.stats()['get_weather']['calls']} backend calls, {elapsed:.2f} s"
+        )
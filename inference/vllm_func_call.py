@@ -1,11 +1,14 @@
 import os
-import importlib
 import json
 from termcolor import colored
 from dotenv import load_dotenv
-from tenacity import retry, wait_random_exponential, stop_after_attempt
 from openai import OpenAI
 
+from tgi_client import EndpointRouter
+from resilience import RetryPolicy
+from tool_loop import run_tool_loop
+from tool_registry import ToolRegistry
+
 # Load environment variables
 load_dotenv()
 
@@ -13,77 +16,56 @@ load_dotenv()
 model = os.getenv('MODEL')
 api_endpoint = os.getenv('API_ENDPOINT')
 
-openai_api_base = api_endpoint + '/v1'
-
-# Initialize the OpenAI client
-client = OpenAI(
-    api_key=os.getenv('OPENAI_API_KEY'),  # Replace with your actual API key
-    base_url=openai_api_base,
-)
-
-# Import tools (a list of function metadata) and dynamically import functions
-with open('./functions/tools.json', 'r') as file:
-    tools = json.load(file)
-
-functions = {
-    tool["function"]["name"]: importlib.import_module(f"functions.{tool['function']['name']}").__dict__[tool["function"]["name"]]
-    for tool in tools if tool["type"] == "function"
+# API_ENDPOINT may list several comma-separated endpoints serving the same model.
+# The router picks the endpoint of each request and health-checks them in the background.
+router = EndpointRouter(api_endpoint)
+
+# Initialize one OpenAI client per endpoint
+clients = {
+    endpoint.url: OpenAI(
+        api_key=os.getenv('OPENAI_API_KEY'),  # Replace with your actual API key
+        base_url=endpoint.url + '/v1',
+        max_retries=0,  # retried by retry_policy instead, so retries do not multiply
+    )
+    for endpoint in router.endpoints
 }
 
-def execute_function_call(func_json, functions_dict):
-    func_name = func_json.get("name")
-    func_arguments = func_json.get("arguments", {})
-
-    if func_name in functions_dict:
-        if isinstance(func_arguments, dict):
-            results = functions_dict[func_name](**func_arguments)
-        else:
-            results = "Error: Invalid arguments format"
-    else:
-        results = f"Error: function {func_name} does not exist"
-
-    return results
-
-@retry(wait=wait_random_exponential(multiplier=1, max=40), stop=stop_after_attempt(3))
-def chat_completion_request_vllm(messages, client, recursion_depth=0, max_recursion_depth=4):
-    if recursion_depth > max_recursion_depth:
-        print("Maximum recursion depth reached")
-        return
-
+# Retries 429s, 503s, timeouts and connection errors with backoff; raises other errors
+retry_policy = RetryPolicy()
+
+# Tools are listed once from tools.json; each function is imported on first use
+# and its arguments are checked by a validator compiled from its JSON schema
+tool_registry = ToolRegistry('./functions/tools.json')
+tools = tool_registry.tools
+
+def generate_response(messages):
+    def create_chat_completion():
+        with router.endpoint() as endpoint:
+            return clients[endpoint].chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=0,
+                max_tokens=500,
+            )
+
+    # Only the request is retried, never the function calls already executed
+    chat_response = retry_policy.call(create_chat_completion)
+
+    if chat_response.choices:
+        return chat_response.choices[0].message.content or ""
+    return ""
+
+def chat_completion_request_vllm(messages, max_turns=5, turn_timeout=30):
+    # One model request per turn; all tool calls of a turn run concurrently
     try:
-        chat_response = client.chat.completions.create(
-            model=model,
-            messages=messages,
-            temperature=0,
-            max_tokens=500,
+        return run_tool_loop(
+            messages,
+            generate_response,
+            tool_registry.execute,
+            max_turns=max_turns,
+            turn_timeout=turn_timeout,
+            tool_names=tool_registry.by_name,
         )
-
-        if chat_response.choices:
-            completion_text = chat_response.choices[0].message.content
-        else:
-            completion_text = None
-
-        function_call_json = None
-        try:
-            function_call_json = json.loads(completion_text)
-        except json.JSONDecodeError as e:
-            if not isinstance(completion_text, str):
-                completion_text = json.dumps(completion_text, indent=4)
-            messages.append({"role": "assistant", "content": completion_text})
-            return
-
-        if function_call_json.get("name") is not None:
-            messages.append({"role": "function_call", "content": json.dumps(function_call_json, indent=4)})
-            results = execute_function_call(function_call_json, functions)
-
-            if not isinstance(results, str):
-                results = json.dumps(results, indent=4)
-
-            messages.append({"role": "function_response", "content": results})
-            chat_completion_request_vllm(messages, client, recursion_depth + 1, max_recursion_depth)
-        else:
-            messages.append({"role": "assistant", "content": completion_text})
-
     except Exception as e:
         print(f"Error in generating response from the server: {e}")
 
@@ -109,10 +91,14 @@ messages.append({"role": "function_metadata", "content": json.dumps(tools, inden
 # User Prompt
 # messages.append({"role": "user", "content": "What is the current weather in London?"})
 messages.append({"role": "user", "content": "What clothes should I wear? I am in Dublin"})
+# messages.append({"role": "user", "content": "What is the weather in London and in Dublin? And what should I wear in each?"})
 # messages.append({"role": "user", "content": "What is one plus one?"})
 
 # Get an assistant response
-chat_completion_request_vllm(messages, client)
+chat_completion_request_vllm(messages)
 
 # Print out the messages
 pretty_print_conversation(messages)
+
+# Calls, errors and mean time of every tool called
+tool_registry.print_stats()
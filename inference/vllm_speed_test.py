@@ -1,9 +1,12 @@
 from openai import OpenAI
 import os
 import time
+import statistics
 from dotenv import load_dotenv
 from termcolor import colored
 
+from tgi_client import StreamTimings
+
 # Load environment variables
 load_dotenv()
 
@@ -53,6 +56,50 @@ def chat_completion_request_openai(messages, client):
 
     return completion_text
 
+def chat_completion_request_openai_stream(messages, client):
+    # Records time-to-first-token and the arrival time of every token
+    timings = StreamTimings()
+
+    # Stream chat completions using the OpenAI client; the last chunk carries the usage
+    stream = client.chat.completions.create(
+        model=model,
+        messages=messages,
+        temperature=0,
+        max_tokens=500,
+        stream=True,
+        stream_options={"include_usage": True},
+    )
+
+    tokens = []
+    usage = None
+    for chunk in stream:
+        if chunk.usage:
+            usage = chunk.usage
+        if chunk.choices and chunk.choices[0].delta.content:
+            timings.add_token()
+            print(chunk.choices[0].delta.content, end="", flush=True)
+            tokens.append(chunk.choices[0].delta.content)
+    print()
+
+    completion_text = "".join(tokens)
+    timings.finish({"generated_text": completion_text})
+    inter_token_latencies = timings.inter_token_latencies
+
+    # vLLM sends one chunk per token; usage gives the exact counts
+    prompt_tokens = usage.prompt_tokens if usage else 0
+    tokens_generated = usage.completion_tokens if usage else len(tokens)
+
+    # Print time to first token, inter-token latency and decoding speed
+    print(f"Time to First Token: {timings.ttft or 0:.3f} seconds")
+    if inter_token_latencies:
+        print(f"Inter-token Latency: median {statistics.median(inter_token_latencies) * 1000:.1f} ms, max {max(inter_token_latencies) * 1000:.1f} ms")
+    print(f"Total Time: {timings.total:.2f} seconds")
+    print(f"Prompt Tokens: {prompt_tokens}")
+    print(f"Tokens Generated: {tokens_generated}")
+    print(f"Tokens per Second (after the first token): {timings.tokens_per_second:.2f}")
+
+    return completion_text
+
 def pretty_print_conversation(messages):
     role_to_color = {
         "system": "red",
@@ -70,7 +117,13 @@ messages = [
     {"role": "user", "content": "Write a long essay on the topic of spring."}
 ]
 
-chat_response = chat_completion_request_openai(messages, client)
+# Stream the response to see the time to first token; set to False for a single blocking request
+stream = True
+
+if stream:
+    chat_response = chat_completion_request_openai_stream(messages, client)
+else:
+    chat_response = chat_completion_request_openai(messages, client)
 messages.append({"role": "assistant", "content": chat_response})
 
 pretty_print_conversation(messages)
\ No newline at end of file